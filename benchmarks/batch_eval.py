@@ -0,0 +1,77 @@
+""" Measures the throughput of the vectorized batch analysis against analysing the positions one
+by one (Position.unpack, legal moves, attacks and evaluate), and checks that both agree
+
+	python benchmarks/batch_eval.py --positions 200000 --chunk 65536
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from chesscore.attacks import attacked_squares
+from chesscore.batch import analyse, pack_positions, CHUNK_SIZE
+from chesscore.bitboard import Position
+from chesscore.evaluation import evaluate
+
+
+def random_positions(rng, count, max_plies):
+	""" Positions of random games """
+	positions = []
+	while len(positions) < count:
+		position = Position.start()
+		for ply in range(max_plies):
+			moves = position.legal_moves()
+			if not moves:
+				break
+			position.make_move(rng.choice(moves))
+			positions.append(position.copy())
+	return positions[:count]
+
+
+def analyse_one(data):
+	""" The scalar analysis of one packed position """
+	position = Position.unpack(data)
+	occupied = position.occupied[0] | position.occupied[1]
+	return (attacked_squares(position, 0, occupied), attacked_squares(position, 1, occupied),
+		position.in_check(), evaluate(position), bool(position.legal_moves()))
+
+
+def main():
+	parser = argparse.ArgumentParser(description="Batch analysis benchmark")
+	parser.add_argument("--positions", type=int, default=100000)
+	parser.add_argument("--plies", type=int, default=150, help="maximum length of a random game")
+	parser.add_argument("--chunk", type=int, default=CHUNK_SIZE, help="rows per chunk")
+	parser.add_argument("--scalar", type=int, default=5000, help="positions analysed one by one")
+	parser.add_argument("--seed", type=int, default=1)
+	args = parser.parse_args()
+
+	rng = random.Random(args.seed)
+	packed = pack_positions(random_positions(rng, args.positions, args.plies))
+	print(f"{len(packed)} positions, {packed.nbytes / 1e6:.1f} MB packed")
+
+	start = time.perf_counter()
+	analysis = analyse(packed, args.chunk)
+	seconds = time.perf_counter() - start
+	batch_rate = len(packed) / seconds
+	print(f"batch   {batch_rate:10.0f} positions/s  ({analysis.fallbacks} positions needed their legal moves)")
+
+	count = min(args.scalar, len(packed))
+	start = time.perf_counter()
+	expected = [analyse_one(packed[row].tobytes()) for row in range(count)]
+	seconds = time.perf_counter() - start
+	scalar_rate = count / seconds
+	print(f"scalar  {scalar_rate:10.0f} positions/s  ({batch_rate / scalar_rate:.1f}x faster in batch)")
+
+	for row, (white, black, in_check, score, has_moves) in enumerate(expected):
+		found = (int(analysis.white_attacks[row]), int(analysis.black_attacks[row]), bool(analysis.in_check[row]),
+			int(analysis.score[row]))
+		if found != (white, black, in_check, score) or (not has_moves and not analysis.result[row]):
+			sys.exit(f"mismatch in position {row}: {Position.unpack(packed[row].tobytes()).fen()}")
+	print(f"the first {count} positions agree")
+
+
+if __name__ == "__main__":
+	main()
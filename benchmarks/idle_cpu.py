@@ -0,0 +1,60 @@
+""" Measures the CPU time an idle game window costs per minute, with the old busy-wait
+event loop and with the EventScheduler
+
+	SDL_VIDEODRIVER=dummy python benchmarks/idle_cpu.py --seconds 5
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import pygame
+
+from scheduler import EventScheduler
+
+
+def busy_wait(seconds):
+	""" The event loop used before the scheduler: spins on pygame.event.get() """
+	end = time.monotonic() + seconds
+	while time.monotonic() < end:
+		for event in pygame.event.get():
+			pass
+
+
+def scheduled_wait(seconds, fps):
+	""" The scheduler loop; the timeout only exists so that the benchmark ends """
+	scheduler = EventScheduler(fps)
+	end = time.monotonic() + seconds
+	while time.monotonic() < end:
+		scheduler.wait(timeout=int(1000 * (end - time.monotonic())) + 1)
+	return scheduler
+
+
+def cpu_per_idle_minute(loop, seconds, *args):
+	start_cpu, start_wall = time.process_time(), time.monotonic()
+	loop(seconds, *args)
+	cpu, wall = time.process_time() - start_cpu, time.monotonic() - start_wall
+	return 60 * cpu / wall
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+	parser.add_argument("--seconds", type=float, default=10.0, help="idle time measured for each loop")
+	parser.add_argument("--fps", type=int, default=60)
+	args = parser.parse_args()
+
+	pygame.init()
+	pygame.display.set_mode((1120, 650))
+
+	before = cpu_per_idle_minute(busy_wait, args.seconds)
+	after = cpu_per_idle_minute(scheduled_wait, args.seconds, args.fps)
+	print(f"busy-wait loop:  {before:7.3f} CPU seconds per idle minute")
+	print(f"event scheduler: {after:7.3f} CPU seconds per idle minute")
+	pygame.quit()
+
+
+if __name__ == "__main__":
+	main()
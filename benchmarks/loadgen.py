@@ -0,0 +1,121 @@
+""" Load generator for the game server: plays many concurrent games of random legal moves
+and reports the moves per second, the round trip time of the moves and the move validation
+latency measured by the server
+
+	python benchmarks/loadgen.py --games 1000 --seconds 10
+	python benchmarks/loadgen.py --host 127.0.0.1 --port 8765 --games 2000
+
+Without --port a server is started in the same process (and event loop) on a free port.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from chesscore import Game, move_uci
+from server import ChessServer
+
+
+async def request(reader, writer, message):
+	writer.write(json.dumps(message).encode() + b"\n")
+	return json.loads(await reader.readline())
+
+
+async def play_games(host, port, end, max_plies, rng, rtts):
+	""" Plays random games between two connections until the end time; returns the moves played """
+	white = await asyncio.open_connection(host, port)
+	black = await asyncio.open_connection(host, port)
+	joined = await request(*white, {"type": "new"})
+	await request(*black, {"type": "join", "game": joined["game"]})
+	players = {"white": white, "black": black}
+	moves = 0
+
+	while time.monotonic() < end:
+		game = Game(with_board=False)
+		while not game.result and len(game.moves) < max_plies and time.monotonic() < end:
+			move = rng.choice(game.state.moves)
+			reader, writer = players[game.player_turn]
+			start = time.perf_counter()
+			update = await request(reader, writer, {"type": "move", "move": move_uci(move)})
+			rtts.append(time.perf_counter() - start)
+			if update["type"] != "update":
+				raise RuntimeError(update)
+			# The opponent receives the same update
+			other = players["black" if game.player_turn == "white" else "white"]
+			await other[0].readline()
+			game.make_move(move)
+			moves += 1
+		if time.monotonic() >= end:
+			break
+		if game.result:
+			await request(*white, {"type": "rematch"})
+			await request(*black, {"type": "rematch"})
+		else:
+			# Games reaching max_plies are left for a new one, so every client plays until the end
+			joined = await request(*white, {"type": "new"})
+			await request(*black, {"type": "join", "game": joined["game"]})
+
+	for reader, writer in players.values():
+		writer.close()
+		await writer.wait_closed()
+	return moves
+
+
+async def run(args):
+	server = None
+	host, port = args.host, args.port
+	if port is None:
+		chess_server = ChessServer(args.workers)
+		server = await chess_server.start(host, 0)
+		port = server.sockets[0].getsockname()[1]
+
+	rng = random.Random(args.seed)
+	rtts = []
+	start = time.monotonic()
+	end = start + args.seconds
+	games = [play_games(host, port, end, args.plies, random.Random(rng.random()), rtts)
+		for i in range(args.games)]
+	moves = sum(await asyncio.gather(*games))
+	elapsed = time.monotonic() - start
+
+	reader, writer = await asyncio.open_connection(host, port)
+	stats = await request(reader, writer, {"type": "stats"})
+	writer.close()
+	await writer.wait_closed()
+	if server:
+		# Lets the handlers of the closed connections finish
+		while chess_server.sessions:
+			await asyncio.sleep(0.05)
+		server.close()
+		await server.wait_closed()
+		chess_server.pool.close()
+
+	rtts.sort()
+	def percentile(p):
+		return 1000 * rtts[min(len(rtts) - 1, int(p * len(rtts)))] if rtts else 0.0
+
+	print(f"{args.games} concurrent games, {moves} moves in {elapsed:.1f} s: {moves / elapsed:.0f} moves/s")
+	print(f"round trip     p50 {percentile(0.5):7.3f} ms   p99 {percentile(0.99):7.3f} ms")
+	print(f"validation     p50 {stats['p50_ms']:7.3f} ms   p99 {stats['p99_ms']:7.3f} ms")
+
+
+def main():
+	parser = argparse.ArgumentParser(description="Load generator for the chess server")
+	parser.add_argument("--host", default="127.0.0.1")
+	parser.add_argument("--port", type=int, help="port of a running server (default: start one in process)")
+	parser.add_argument("--games", type=int, default=500, help="number of concurrent games")
+	parser.add_argument("--seconds", type=float, default=10)
+	parser.add_argument("--plies", type=int, default=200, help="maximum length of a game")
+	parser.add_argument("--seed", type=int, default=1)
+	parser.add_argument("--workers", type=int, default=0, help="worker processes of the in-process server")
+	args = parser.parse_args()
+	asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,76 @@
+""" Measures how the move validation throughput of the shard pool scales with the number
+of worker processes. Random games are generated first, then replayed concurrently through
+the pool, each move validated in the shard of its game
+
+	python benchmarks/shards.py --games 400 --workers 0,1,2,4
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from chesscore import Game, move_uci
+from shards import ShardPool, new_game, end_game, play_move
+
+
+def random_game(rng, max_plies):
+	""" UCI moves of a random game """
+	game = Game(with_board=False)
+	while not game.result and len(game.moves) < max_plies:
+		game.make_move(rng.choice(game.state.moves))
+	return [move_uci(move) for move in game.moves]
+
+
+async def replay(pool, game_id, moves):
+	await pool.call(game_id, new_game, game_id)
+	for ply, text in enumerate(moves):
+		await pool.call(game_id, play_move, game_id, ("white", "black")[ply & 1], text)
+	await pool.call(game_id, end_game, game_id)
+
+
+async def measure(pool, games):
+	start = time.perf_counter()
+	await asyncio.gather(*(replay(pool, game_id, moves) for game_id, moves in enumerate(games)))
+	return time.perf_counter() - start
+
+
+def main():
+	parser = argparse.ArgumentParser(description="Shard pool scaling benchmark")
+	parser.add_argument("--games", type=int, default=200)
+	parser.add_argument("--plies", type=int, default=120, help="maximum length of a game")
+	parser.add_argument("--workers", default=None,
+		help="comma separated worker counts (default: 0 and powers of 2 up to the core count)")
+	parser.add_argument("--seed", type=int, default=1)
+	args = parser.parse_args()
+
+	cores = os.cpu_count() or 1
+	if args.workers:
+		counts = [int(count) for count in args.workers.split(",")]
+	else:
+		counts = [0] + [1 << i for i in range(cores.bit_length()) if 1 << i <= cores]
+		if cores not in counts:
+			counts.append(cores)
+
+	rng = random.Random(args.seed)
+	games = [random_game(rng, args.plies) for i in range(args.games)]
+	total = sum(len(moves) for moves in games)
+	print(f"{args.games} games, {total} moves, {cores} cores")
+
+	base = None
+	for count in counts:
+		pool = ShardPool(count)
+		seconds = asyncio.run(measure(pool, games))
+		pool.close()
+		rate = total / seconds
+		if count == 1:
+			base = rate
+		speedup = f"{rate / base:5.2f}x" if base and count else "     "
+		print(f"{count:3} workers  {rate:9.0f} moves/s  {speedup}")
+
+
+if __name__ == "__main__":
+	main()
@@ -1,6 +1,22 @@
+import argparse
+import atexit
+import math
 import pygame
-import sys
-import time
+
+from chesscore import PROMOTION, EN_PASSANT, COLOR_NAMES, Position, move_flag, move_from, move_to, move_uci
+from chesscore.book import OpeningBook
+from chesscore.clock import TimeControl, ChessClock, MODES
+from chesscore.game import Game
+from chesscore.pieces import Queen, Bishop, Knight, Rook
+from chesscore.pgn import write_pgn
+from chesscore.profiling import profiler, configure as configure_profiling
+from chesscore.search import Computer
+from chesscore.tablebase import Tablebase
+from fonts import text_cache
+from netclient import NetworkClient, NETWORK_EVENT
+from renderer import BoardRenderer, ClockRenderer
+from scheduler import EventScheduler, DEFAULT_FPS
+from sprites import sprite_cache, get_image, BOARD_IMAGE, ICON_IMAGE
 
 
 SCREEN_WIDTH = 1120
@@ -9,11 +25,6 @@ SQUARE_WIDTH = 65
 BOARD_WIDTH = 600
 
 
-def load_image(img_file_name):
-	image = pygame.image.load("images/" + img_file_name)
-	return image.convert_alpha()
-
-
 def get_coordinate(position):
 	""" Takes (row, col) and returns the coordinate of the index in the xy-plane """
 	row, col = position
@@ -24,22 +35,6 @@ def highlight_border(surface, position, color):
 	x, y = get_coordinate(position)
 	pygame.draw.rect(surface, color, (x+2, y+2, SQUARE_WIDTH-3, SQUARE_WIDTH-3), width=4)
 
-def is_valid_position(position):
-	""" Checks whether a given position is valid in a 8x8 board """
-	return 0 <= position[0] < 8 and 0 <= position[1] < 8
-
-def find_all_moves(board, steps, find_new_pos):
-	""" Takes a function that returns a position by taking each step of steps and 
-	returns the positions from nearest to farthest until it gets blocked by a piece """
-	moves = []
-	for step in steps:
-		move_row, move_col = find_new_pos(step)
-		if is_valid_position((move_row, move_col)):
-			moves.append((move_row, move_col))
-			if board[move_row][move_col]:
-				break
-	return moves
-
 def is_hovered(position):
 	""" Checks whether a position in the chess board is hovered by the mouse """
 	x_coor, y_coor = get_coordinate(position)
@@ -49,20 +44,29 @@ def is_hovered(position):
 
 def render_text(text, font_size, color):
 	""" Returns a rendered form of given text in given font_size and color """
-	font = pygame.font.SysFont("courier", font_size, bold=True)
-	return font.render(text, color, True)
+	return text_cache.render(text, font_size, color)
 
-def show_result(surface, game_result, center):
+def show_result(surface, game_result, center, timed_out=None, adjudicated=False, abandoned=None):
 	""" Displays a formatted result of the game on screen """
 	win = game_result in ["black", "white"]
 	center_x, center_y = center
 
-	if win:
+	if timed_out:
+		reason = "Time Out"
+	elif abandoned:
+		reason = "Opponent Left"
+	elif adjudicated:
+		reason = "Won Endgame" if win else "Drawn Endgame"
+	elif win:
 		reason = "Checkmate"
 	elif game_result == "stalemate":
 		reason = "Stalemate"
 	elif game_result == "50-move":
 		reason = "Fifty-move Rule"
+	elif game_result == "threefold":
+		reason = "Threefold Repetition"
+	elif game_result == "fivefold":
+		reason = "Fivefold Repetition"
 	else:
 		reason = "No possible way to win"
 
@@ -86,258 +90,173 @@ def show_result(surface, game_result, center):
 	pygame.display.update()
 
 
-class Piece:
-	""" A template class for all pieces in the chess board """
-	def __init__(self, position, color):
-		self.position = position
-		self.color = color
-
-	def move_to(self, board, new_position):
-		""" Moves this piece to the given new_position on the chess board """
-		old_row, old_col = self.position
-		new_row, new_col = new_position
-		board[new_row][new_col] = self
-		board[old_row][old_col] = None
-		self.position = new_position
-
-	def display(self, surface, img_file_name):
-		image = load_image(img_file_name)
-		surface.blit(image, get_coordinate(self.position))
-
-
-class King(Piece):
-	is_first_move = True
-
-	def possible_moves(self, board):
-		row, col = self.position
-		moves = []
-		# All squares around its position
-		possibles = [(row+i, col+j) for i, j in [(0, -1), (0, 1), (-1, 0), (1, 0), 
-			(-1, -1), (-1, 1), (1, -1), (1, 1)]]
-		
-		# Validates all possible moves
-		for move in possibles:
-			i, j = move
-			if is_valid_position(move):
-				if type(board[i][j]) == King:
-					continue
-				if board[i][j] and board[i][j].color == self.color:
-					continue
-				is_check = False
-				other_piece = board[i][j]
-				self.move_to(board, move)
-				for x in board:
-					for piece in x:
-						if not piece or piece.color == self.color:
-							continue
-						if type(piece) == King:
-							continue
-						if move in piece.possible_moves(board):
-							is_check = True
-							break
-					if is_check:
-						break
-				else:
-					moves.append(move)
-				self.move_to(board, (row, col))
-				board[i][j] = other_piece
-		
-		# Castling move if it is his first move
-		if self.is_first_move and not self.is_check(board):
-			if not any(board[row][1:4]) and type(board[row][0]) == Rook and board[row][0].is_first_move:
-				moves.append((row, col-2))
-			if not any(board[row][5:7]) and type(board[row][7]) == Rook and board[row][7].is_first_move:
-				moves.append((row, col+2))
-		
-		return moves
-
-	def is_check(self, board):
-		for row in board:
-			for piece in row:
-				if piece and piece.color != self.color:
-					if type(piece) == King:
-						continue
-					if self.position in piece.possible_moves(board):
-						return True
-		return False
-
-	def is_checkmate(self, board):
-		checkmate = self.is_check(board) and len(self.possible_moves(board)) == 0
-		
-		if not checkmate:
+def piece_image(piece):
+	""" File name of the image of a piece """
+	return f"{piece.color}_{piece.name}.png"
+
+def display_piece(surface, piece):
+	surface.blit(get_image(piece_image(piece)), get_coordinate(piece.position))
+
+
+# Lifecycle states of a game: one event loop handles all of them, so rematches do not nest
+PLAYING, PROMOTING, GAME_OVER = "playing", "promoting", "game over"
+# A covered part of the window was uncovered (SDL 2 and SDL 1 names)
+EXPOSE_EVENTS = (pygame.WINDOWEXPOSED, pygame.VIDEOEXPOSE)
+
+
+class Chess(Game):
+	""" pygame front-end of a game: selection, highlighting and the game screens.
+	With a network client the moves are validated by the server: local moves are sent
+	to it and the board follows the updates it pushes for both players. With a computer
+	opponent it plays one of the colors. The game starts from fen if given, and finished
+	games are appended to the PGN file pgn_path if given. With a time control both players
+	have clocks (in network games the clocks of the server are shown instead). With a
+	Tablebase, local games end as soon as an endgame of its tables is reached. With an
+	OpeningBook, pressing H suggests a book move to the player in turn.
+	The game is always in one of the states PLAYING, PROMOTING (choosing the piece a pawn
+	is promoted to) and GAME_OVER (the result screen); a rematch resets it in place """
+	def __init__(self, scheduler=None, network=None, computer=None, fen=None, pgn_path=None, time_control=None,
+			tablebase=None, book=None):
+		self.board_image = get_image(BOARD_IMAGE)
+		self.renderer = BoardRenderer(self.board_image)
+		self.clock_renderer = ClockRenderer()
+		self.scheduler = scheduler or EventScheduler()
+		self.network = network
+		self.computer = computer
+		self.pgn_path = pgn_path
+		self.time_control = time_control
+		self.book = book
+		super().__init__(fen=fen, tablebase=tablebase if not network else None)
+
+	def reset(self):
+		""" Starts over from the start position, reusing the renderers and images """
+		Game.reset(self)
+		self.mode = PLAYING
+		self.selected_piece = None
+		# (pawn, target square, pieces to choose from) while choosing a promotion
+		self.promotion = None
+		# (position key, move) of the suggested move, shown until a move is played
+		self.hint = None
+		self.clock = ChessClock(self.time_control) if self.time_control and not self.network else None
+		self.renderer.invalidate(full=True)
+		self.clock_renderer.invalidate()
+
+	def can_move(self, color):
+		""" Checks whether the local player plays the given color now """
+		if self.computer and self.computer.color == color:
 			return False
-		
-		# Checks for any other piece's move that can avoid the checkmate
-		for row in board:
-			for piece in row:
-				if piece and piece.color == self.color:
-					for new_position in piece.possible_moves(board):
-						if not is_valid_position(new_position):
-							continue
-						i, j = new_position
-						if board[i][j] and board[i][j].color == piece.color:
-							continue
-						old_position = piece.position
-						other_piece = board[i][j]
-						piece.move_to(board, new_position)
-						if not self.is_check(board):
-							checkmate = False
-						piece.move_to(board, old_position)
-						board[i][j] = other_piece
-						if not checkmate:
-							return False
-		
-		return checkmate
-
-	def display(self, surface):
-		super().display(surface, f"{self.color}_king.png")
-
-
-class Queen(Piece):
-	def possible_moves(self, board):
-		row, col = self.position
-		moves = []
-
-		# Vertically top
-		moves += find_all_moves(board, range(1, row+1), lambda step: (row-step, col))
-		# Vertically bottom
-		moves += find_all_moves(board, range(1, 8-row), lambda step: (row+step, col))
-		# Horizontally left
-		moves += find_all_moves(board, range(1, col+1), lambda step: (row, col-step))
-		# Horizontally right
-		moves += find_all_moves(board, range(1, 8-col), lambda step: (row, col+step))
-
-		# Towards topleft
-		moves += find_all_moves(board, range(1, col+1), lambda step: (row-step, col-step))
-		# Towards bottomleft
-		moves += find_all_moves(board, range(1, col+1), lambda step: (row+step, col-step))
-		# Towards topright
-		moves += find_all_moves(board, range(1, 8-col), lambda step: (row-step, col+step))
-		# Towards bottomright
-		moves += find_all_moves(board, range(1, 8-col), lambda step: (row+step, col+step))
-		
-		return moves
-
-	def display(self, surface):
-		super().display(surface, f"{self.color}_queen.png")
-
-
-class Rook(Piece):
-	is_first_move = True
-
-	def possible_moves(self, board):
-		row, col = self.position
-		moves = []
-		
-		# Vertically top
-		moves += find_all_moves(board, range(1, row+1), lambda step: (row-step, col))
-		# Vertically bottom
-		moves += find_all_moves(board, range(1, 8-row), lambda step: (row+step, col))
-		# Horizontally left
-		moves += find_all_moves(board, range(1, col+1), lambda step: (row, col-step))
-		# Horizontally right
-		moves += find_all_moves(board, range(1, 8-col), lambda step: (row, col+step))
-		
-		return moves
-
-	def display(self, surface):
-		super().display(surface, f"{self.color}_rook.png")
-
-
-class Knight(Piece):
-	def possible_moves(self, board):
-		row, col = self.position
-		# All 'L' shape moves from his position
-		moves = [(row+i, col+j) for i, j in [(-2, -1), (-2, 1), (-1, 2), (1, 2), 
-			(-1, -2), (1, -2), (2, -1), (2, 1)]]
-		return moves
-
-	def display(self, surface):
-		super().display(surface, f"{self.color}_knight.png")
-
-
-class Bishop(Piece):
-	def possible_moves(self, board):
-		row, col = self.position
-		moves = []
-
-		# Towards topleft
-		moves += find_all_moves(board, range(1, col+1), lambda step: (row-step, col-step))
-		# Towards bottomleft
-		moves += find_all_moves(board, range(1, col+1), lambda step: (row+step, col-step))
-		# Towards topright
-		moves += find_all_moves(board, range(1, 8-col), lambda step: (row-step, col+step))
-		# Towards bottomright
-		moves += find_all_moves(board, range(1, 8-col), lambda step: (row+step, col+step))
-
-		return moves
-
-	def display(self, surface):
-		super().display(surface, f"{self.color}_bishop.png")
-
-
-class Pawn(Piece):
-	is_first_move = True
-	en_passant_side = ""
-
-	def possible_moves(self, board):
-		row, col = self.position
-		moves = []
-		
-		direction = -1 if self.color == "white" else 1
-		
-		# Left capture moves (normal capture or en passant move)
-		if is_valid_position((row+direction, col-1)):
-			if board[row+direction][col-1] or self.en_passant_side == "left":
-				moves.append((row+direction, col-1))
-		# Right capture moves (normal capture or en passant move)
-		if is_valid_position((row+direction, col+1)):
-			if board[row+direction][col+1] or self.en_passant_side == "right":
-				moves.append((row+direction, col+1))
-		# Forward move in its direction
-		if is_valid_position((row+direction, col)) and board[row+direction][col]:
-			return moves
-		moves.append((row+direction, col))
-		
-		# If it is his first move, then 2 steps move
-		if self.is_first_move:
-			if is_valid_position((row+2*direction, col)) and board[row+2*direction][col]:
-				return moves
-			moves.append((row+2*direction, col))
-		
-		return moves
-
-	def display(self, surface):
-		super().display(surface, f"{self.color}_pawn.png")
-
-
-class Chess:
-	def __init__(self):
-		self.board = [
-			[Rook((0, 0), "black"), Knight((0, 1), "black"), Bishop((0, 2), "black"), Queen((0, 3), "black"), 
-				King((0, 4), "black"), Bishop((0, 5), "black"), Knight((0, 6), "black"), Rook((0, 7), "black")], 
-			[Pawn((1, i), "black") for i in range(8)], 
-			[None for i in range(8)], 
-			[None for i in range(8)], 
-			[None for i in range(8)], 
-			[None for i in range(8)], 
-			[Pawn((6, i), "white") for i in range(8)], 
-			[Rook((7, 0), "white"), Knight((7, 1), "white"), Bishop((7, 2), "white"), Queen((7, 3), "white"), 
-				King((7, 4), "white"), Bishop((7, 5), "white"), Knight((7, 6), "white"), Rook((7, 7), "white")]
-		]
-		self.board_image = load_image("chess_board.jpg")
-		self.black_king = self.board[0][4]
-		self.white_king = self.board[7][4]
+		return color == self.player_turn and (self.network is None or self.network.color == color)
+
+	def computer_move(self, surface):
+		""" Lets the computer opponent play if it is its turn """
+		if not self.computer or self.computer.color != self.player_turn or self.mode != PLAYING:
+			return
+		# Shows the last move before thinking
+		self.display_board(surface)
+		budget = self.clock.move_budget(self.position.turn) if self.clock else None
+		self.make_move(self.computer.choose_move(self, budget))
+		self.press_clock()
+		self.renderer.invalidate()
+		if self.state.is_over:
+			self.game_over(surface, self.state.result)
+
+	def play_move(self, surface, move):
+		""" Plays a legal move of the local player (sends it to the server in network games) """
 		self.selected_piece = None
-		self.player_turn = "white"
-		self.num_moves_last_capture = 0
-
-	def pawn_promotion(self, surface):
+		if self.network:
+			# The server validates the move and pushes it back to both players
+			self.network.send_move(move_uci(move))
+			return
+		self.make_move(move)
+		self.press_clock()
+
+		# Checkmate, stalemate or draw, decided from one legal move generation
+		if self.state.is_over:
+			self.game_over(surface, self.state.result)
+
+	def load_moves(self, moves):
+		""" Starts over from the initial position and replays the given UCI moves """
+		self.reset()
+		for text in moves:
+			self.make_move(self.find_uci(text))
+
+	def handle_network(self, surface, message):
+		""" Applies a message pushed by the server """
+		if message["type"] == "joined":
+			pygame.display.set_caption(f"Chess Tournament - game {message['game']} ({message['color']})")
+			self.load_moves(message["moves"])
+		elif message["type"] == "update" and self.mode != GAME_OVER:
+			if message["move"] is not None:
+				self.make_move(self.find_uci(message["move"]))
+			self.selected_piece = None
+			self.renderer.invalidate()
+		elif message["type"] == "closed":
+			self.scheduler.quit()
+		else:
+			# Updates of a rematch the opponent started are sent again when joining it
+			return
+		self.sync_clock(message.get("clock"))
+		if message.get("timed_out"):
+			self.time_out(message["timed_out"])
+		elif message.get("abandoned"):
+			self.abandon(message["abandoned"])
+		if self.state.is_over:
+			self.game_over(surface, self.state.result)
+		elif self.mode == PROMOTING and message["type"] == "update":
+			# The promotion choice was drawn over the board
+			self.mode = PLAYING
+			self.promotion = None
+			self.renderer.invalidate(full=True)
+
+	def sync_clock(self, state):
+		""" Shows the clocks of the server, as of the time the message arrived """
+		if state is None:
+			self.clock = None
+			return
+		if self.clock is None:
+			self.clock = ChessClock(TimeControl(max(state["white"], state["black"], 1)))
+			self.clock_renderer.invalidate()
+		self.clock.set_state(state)
+
+	def start_clock(self):
+		""" Starts the clock of the side to move at the beginning of a local game """
+		if self.clock and not self.network and self.clock.running is None and not self.state.is_over:
+			self.clock.start(self.position.turn)
+
+	def press_clock(self):
+		""" Ends the turn of the player who moved on the clock (the server does it in network games) """
+		if self.clock and not self.network:
+			if self.state.is_over:
+				self.clock.stop()
+			else:
+				self.clock.press()
+
+	def clock_timeout(self):
+		""" Milliseconds until the displayed time changes or a flag falls (0 if the clocks are
+		stopped), so that the event loop sleeps exactly until the clock needs drawing """
+		if not self.clock or self.mode == GAME_OVER:
+			return 0
+		wakeup = self.clock.next_wakeup()
+		if wakeup is None or self.clock.flagged() is not None:
+			# A fallen flag is handled before waiting, or by the server which tells us
+			return 0
+		return max(1, math.ceil(1000 * (wakeup - self.clock.clock())))
+
+	def check_flag(self, surface):
+		""" Ends the game if the flag of the player in turn fell (decided by the server in network games) """
+		if not self.clock or self.network or self.mode == GAME_OVER:
+			return
+		color = self.clock.flagged()
+		if color is not None:
+			self.clock.stop()
+			self.time_out(COLOR_NAMES[color])
+			self.display_clocks(surface)
+			self.game_over(surface, self.state.result)
+
+	def pawn_promotion(self, surface, pawn, target):
 		""" When the pawn reaches the other end of the chess board, 
 		the player can take Queen / Bishop / Knight / Rook """
-		pawn = self.selected_piece
-		x_coor, y_coor = get_coordinate(pawn.position)
-		row, col = pawn.position
+		row, col = target
 		color = pawn.color
 		start_row = row if color == "white" else row-3
 		choice_pieces = [piece((start_row+i, col), color) for i, piece in enumerate([Queen, Bishop, Knight, Rook])]
@@ -347,255 +266,185 @@ class Chess:
 			box_x, box_y = get_coordinate(piece.position)
 			pygame.draw.rect(surface, (0, 0, 0), (box_x-1, box_y-1, SQUARE_WIDTH+2, SQUARE_WIDTH+2), width=4)
 			pygame.draw.rect(surface, (200, 200, 200), (box_x, box_y, SQUARE_WIDTH, SQUARE_WIDTH))
-			piece.display(surface)
+			display_piece(surface, piece)
 		pygame.display.update()
-		
-		# Waits for the user to select a piece and returns the piece
-		new_piece = None
-		while not new_piece:
-			for event in pygame.event.get():
-				if event.type == pygame.QUIT:
-					pygame.quit()
-					sys.exit()
-				if event.type == pygame.MOUSEBUTTONDOWN:
-					mouse_pos = pygame.mouse.get_pos()
-					for piece in choice_pieces:
-						if is_hovered(piece.position):
-							new_piece = piece
-							break
-
-		new_piece.position = pawn.position
-		return new_piece
-
-	def remove_moves_causing_check(self, moves, piece):
-		""" Removes all moves that causes check to its own king """
-		wrong_moves = []
-		for new_position in moves:
-			if not is_valid_position(new_position):
-				continue
-
-			old_position = piece.position
-			new_row, new_col = new_position
-			
-			other_piece = self.board[new_row][new_col]
-			piece.move_to(self.board, new_position)
-			
-			king = self.white_king if piece.color == "white" else self.black_king
-			if king.is_check(self.board):
-				wrong_moves.append(new_position)
-			
-			piece.move_to(self.board, old_position)
-			self.board[new_row][new_col] = other_piece
-
-		for move in wrong_moves:
-			moves.remove(move)
-
-		return moves
-
-	def is_draw(self):
-		# Checks whether any player cannot make a move but also not in check
-		# or whether there are no pieces other than the two kings who cannot capture each other
-		can_white_move = False
-		can_black_move = False
-		
-		num_pieces_alive = 0
-		num_kings_alive = 0
-		
-		for row in self.board:
-			for piece in row:
-				if not piece:
+
+		# The choice is made by the next click (see handle_promotion)
+		self.promotion = (pawn, target, choice_pieces)
+		self.mode = PROMOTING
+
+	def handle_promotion(self, surface, event):
+		""" Promotes the pawn to the piece the player clicked on """
+		if event.type != pygame.MOUSEBUTTONDOWN:
+			return
+		pawn, target, choice_pieces = self.promotion
+		for piece in choice_pieces:
+			if is_hovered(piece.position):
+				self.mode = PLAYING
+				self.promotion = None
+				self.renderer.invalidate(full=True)
+				self.play_move(surface, self.find_move(pawn.position, target, piece.name))
+				return
+
+	def handle_click(self, surface):
+		""" Selects a piece or moves the selected piece to the clicked square """
+		self.renderer.invalidate()
+		for i in range(8):
+			for j in range(8):
+				if not is_hovered((i, j)):
 					continue
-				
-				num_pieces_alive += 1
-				if type(piece) == King:
-					num_kings_alive += 1
-				
-				possible_moves = piece.possible_moves(self.board)
-				possible_moves = list(filter(is_valid_position, possible_moves))
-				self.remove_moves_causing_check(possible_moves, piece)
-				if possible_moves:
-					if piece.color == "white":
-						can_white_move = True
+				# If a position is clicked and a piece is already selected
+				if self.selected_piece:
+					piece = self.selected_piece
+
+					if not self.board[i][j] or self.board[i][j].color != piece.color:
+						# Legal move of the selected piece to the clicked square
+						move = self.find_move(piece.position, (i, j))
+
+						if move is not None:
+							# Pawn Promotion when he reaches the other end of the chess board
+							if move_flag(move) == PROMOTION:
+								self.pawn_promotion(surface, piece, (i, j))
+								return
+							self.play_move(surface, move)
 					else:
-						can_black_move = True
-
-		if num_pieces_alive == num_kings_alive == 2:
-			return True
-		return not can_white_move or not can_black_move
-
-	def display_board(self, surface):
-		# Background color
-		surface.fill((255, 255, 255))
+						# Selects a new piece in the same color
+						self.selected_piece = self.board[i][j]
+				
+				# If a piece is clicked and no piece is selected
+				else:
+					if not self.board[i][j]:
+						continue
+					# Selects the piece if it is the piece's color turn
+					if self.can_move(self.board[i][j].color):
+						self.selected_piece = self.board[i][j]
 
-		# Chess board
-		surface.blit(self.board_image, ((SCREEN_WIDTH-BOARD_WIDTH)/2, (SCREEN_HEIGHT-BOARD_WIDTH)/2))
-		# Pieces
-		for row in self.board:
-			for piece in row:
-				if piece is None:
-					continue
-				piece.display(surface)
+	def square_states(self):
+		""" Returns the (image name, highlight color) of all 64 squares of the board """
+		highlights = {}
 
 		# Highlights the selected_piece and its possible moves
 		if self.selected_piece:
-			piece = self.selected_piece
-			row, col = piece.position
-			highlight_border(surface, (row, col), (0, 0, 200))
-			possible_moves = piece.possible_moves(self.board)
-			self.remove_moves_causing_check(possible_moves, piece)
-			for move in possible_moves:
-				i, j = move
-				if is_valid_position((i, j)):
-					if self.board[i][j]:
-						if self.board[i][j].color != piece.color:
-							highlight_border(surface, move, (200, 0, 0))
-					else:
-						highlight_border(surface, move, (0, 200, 0))
+			row, col = self.selected_piece.position
+			highlights[(row, col)] = (0, 0, 200)
+			for square, moves in self.state.targets(row*8 + col).items():
+				# Captures (including en passant) in red, other moves in green
+				if self.position.squares[square] or move_flag(moves[0]) == EN_PASSANT:
+					highlights[divmod(square, 8)] = (200, 0, 0)
+				else:
+					highlights[divmod(square, 8)] = (0, 200, 0)
 
-					# En passant capture
-					if type(piece) == Pawn and piece.en_passant_side:
-						if (piece.en_passant_side == "left" and j == col-1) or \
-								(piece.en_passant_side == "right" and j == col+1):
-							highlight_border(surface, move, (200, 0, 0))
-					
 		# If not selected, highlights the king if he is in check
-		elif self.black_king.is_check(self.board):
-			highlight_border(surface, self.black_king.position, (200, 0, 0))
-		elif self.white_king.is_check(self.board):
-			highlight_border(surface, self.white_king.position, (200, 0, 0))
+		elif self.state.in_check:
+			king = self.white_king if self.player_turn == "white" else self.black_king
+			highlights[king.position] = (200, 0, 0)
+
+		# The suggested move in yellow
+		if self.hint and self.hint[0] == self.position.key:
+			for square in (move_from(self.hint[1]), move_to(self.hint[1])):
+				highlights.setdefault(divmod(square, 8), (220, 200, 0))
+
+		return [(piece_image(piece) if piece else None, highlights.get((i, j)))
+			for i, row in enumerate(self.board) for j, piece in enumerate(row)]
+
+	def suggest_move(self):
+		""" Highlights a move of the opening book for the local player in turn (nothing once
+		the game left the book) """
+		if not self.book or not self.can_move(self.player_turn):
+			return
+		move = self.book.choose(self.position)
+		if move is None:
+			return
+		self.hint = (self.position.key, move)
+		self.renderer.invalidate()
 
-		pygame.display.update()
+	def display_board(self, surface):
+		""" Redraws only the squares changed by a move, selection or check highlight """
+		if self.renderer.full_redraw:
+			self.clock_renderer.invalidate()
+		self.renderer.draw(surface, self.square_states)
+		self.display_clocks(surface)
+
+	def handle_expose(self):
+		""" Repaints the window after it was covered: the whole board while playing (on the next
+		frame), otherwise the promotion or result screen still on the display surface """
+		if self.mode == PLAYING:
+			self.renderer.invalidate(full=True)
+		else:
+			pygame.display.update()
+
+	def display_clocks(self, surface):
+		""" Redraws the clocks whose displayed time changed """
+		if self.clock:
+			self.clock_renderer.draw(surface, {color: (self.clock.display(index), self.clock.running == index)
+				for index, color in enumerate(COLOR_NAMES)})
 
 	def play(self, surface):
-		""" Main chess game """
+		""" Main chess game: one event loop for all states of the game and any number of rematches """
 		while True:
-			for event in pygame.event.get():
-				if event.type == pygame.QUIT:
-					pygame.quit()
-					sys.exit()
-				if event.type == pygame.MOUSEBUTTONDOWN:
-					for i in range(8):
-						for j in range(8):
-							if not is_hovered((i, j)):
-								continue
-							# If a position is clicked and a piece is already selected
-							if self.selected_piece:
-								piece = self.selected_piece
-
-								if not self.board[i][j] or self.board[i][j].color != piece.color:
-									# Possible moves of the selected piece
-									possible_moves = piece.possible_moves(self.board)
-									self.remove_moves_causing_check(possible_moves, piece)
-									
-									if (i, j) in possible_moves:
-										self.num_moves_last_capture += 1
-
-										# 50-move rule
-										if type(piece) == Pawn or self.board[i][j]:
-											self.num_moves_last_capture = 0
-										if self.num_moves_last_capture >= 100:
-											self.game_over(surface, "50-move")
-
-										# Game over if king is captured
-										if type(self.board[i][j]) == King:
-											self.game_over(surface, piece.color)
-										
-										if type(piece) == Pawn:
-											# En passant
-											side = piece.en_passant_side
-											pawn_row, pawn_col = piece.position
-											
-											if side:
-												direction = -1 if piece.color == "white" else 1
-												# Left capture move or Right capture move
-												if (side == "left" and j == pawn_col-1) or (side == "right" and j == pawn_col+1):
-													self.board[i-direction][j] = None
-
-											if piece.is_first_move and abs(pawn_row-i) == 2:
-												for col, en_passant_side in ((j-1, "right"), (j+1, "left")):
-													if is_valid_position((i, col)):
-														side_piece = self.board[i][col]
-														if type(side_piece) == Pawn and side_piece.color != piece.color:
-															side_piece.en_passant_side = en_passant_side
-
-											# Pawn Promotion when he reaches the other end of the chess board
-											if i in (0, 7):
-												piece = self.pawn_promotion(surface)
-
-										# Checks whether the move is castle
-										if type(piece) == King:
-											if piece.is_first_move:
-												row, col = piece.position
-												# King side castle
-												if col+2 == j:
-													if type(self.board[row][col+3]) == Rook:
-														rook = self.board[row][col+3]
-														if rook.is_first_move:
-															rook.move_to(self.board, (row, col+1))
-												# Queen side castle
-												if col-2 == j:
-													if type(self.board[row][col-4]) == Rook:
-														rook = self.board[row][col-4]
-														if rook.is_first_move:
-															rook.move_to(self.board, (row, col-1))
-											
-										if type(piece) in [Pawn, King, Rook]:
-											piece.is_first_move = False
-
-										piece.move_to(self.board, (i, j))
-
-										for row in range(2, 6):
-											for col in self.board[row]:
-												if col and type(col) == Pawn and col.color == piece.color:
-													col.en_passant_side = ""
-
-										# White causes check to black, white wins
-										if piece.color == "white":
-											if self.black_king.is_checkmate(self.board):
-												self.game_over(surface, "white")
-										# Black causes check to white, black wins
-										elif self.white_king.is_checkmate(self.board):
-											self.game_over(surface, "black")
-										
-										# Match draw
-										if self.is_draw():
-											# Checks whether it is stalemate
-											if not self.black_king.possible_moves(self.board) or not self.white_king.possible_moves(self.board):
-												self.game_over(surface, "stalemate")
-											else:
-												self.game_over(surface, "normal-draw")
-
-										self.selected_piece = None
-										self.player_turn = "white" if self.player_turn == "black" else "black"
-								else:
-									# Selects a new piece in the same color
-									self.selected_piece = self.board[i][j]
-							
-							# If a piece is clicked and no piece is selected
-							else:
-								if not self.board[i][j]:
-									continue
-								# Selects the piece if it is the piece's color turn
-								if self.board[i][j].color == self.player_turn:
-									self.selected_piece = self.board[i][j]
+			if self.mode == PLAYING:
+				self.start_clock()
+				self.computer_move(surface)
+			for event in self.scheduler.wait(self.clock_timeout()):
+				if event.type == NETWORK_EVENT:
+					self.handle_network(surface, event.message)
+				elif event.type in EXPOSE_EVENTS:
+					self.handle_expose()
+				elif self.mode == GAME_OVER:
+					self.handle_game_over(event)
+				elif event.type == pygame.KEYDOWN and event.key == pygame.K_f:
+					# Prints the position to load it later with --fen
+					print(self.fen())
+				elif event.type == pygame.KEYDOWN and event.key == pygame.K_h and self.mode == PLAYING:
+					self.suggest_move()
+				elif self.mode == PROMOTING:
+					self.handle_promotion(surface, event)
+				elif event.type == pygame.MOUSEBUTTONDOWN:
+					self.handle_click(surface)
+
+			self.check_flag(surface)
 
 			# Displays chess board, pieces, and possible moves of selected piece
-			self.display_board(surface)
+			if self.mode == PLAYING:
+				self.display_board(surface)
+			elif self.mode == PROMOTING:
+				self.display_clocks(surface)
+
+	def save_pgn(self):
+		""" Appends the game to the PGN file """
+		players = {"white": "Player", "black": "Player"}
+		if self.computer:
+			players[self.computer.color] = "Computer"
+		tags = {"White": players["white"], "Black": players["black"]}
+		if self.time_control:
+			tags["TimeControl"] = f"{self.time_control.initial:g}+{self.time_control.increment:g}"
+		if self.timed_out:
+			tags["Termination"] = "time forfeit"
+		elif self.abandoned:
+			tags["Termination"] = "abandoned"
+		with open(self.pgn_path, "a") as file:
+			file.write(write_pgn(self, tags) + "\n")
 
 	def game_over(self, surface, game_result):
+		""" Shows the result screen; the game waits in the GAME_OVER state for a rematch """
+		if self.pgn_path:
+			self.save_pgn()
+		self.mode = GAME_OVER
+		self.promotion = None
+
 		checkmate_king = None
 		stalemate_king = None
 
-		if game_result == "white":
+		# A game lost on time, left or adjudicated has no checkmated king
+		checkmate = not self.timed_out and not self.abandoned and not self.state.adjudicated
+		if game_result == "white" and checkmate:
 			checkmate_king = self.black_king
-		elif game_result == "black":
+		elif game_result == "black" and checkmate:
 			checkmate_king = self.white_king
 
+		# The player in turn has no legal moves
 		if game_result == "stalemate":
-			if not self.black_king.possible_moves(self.board):
-				stalemate_king = self.black_king
-			else:
-				stalemate_king = self.white_king
+			stalemate_king = self.white_king if self.player_turn == "white" else self.black_king
 		
 		surface.fill((255, 255, 255))
 		
@@ -607,7 +456,7 @@ class Chess:
 				if piece:
 					# Displays all pieces on the board
 					piece.position = (piece.position[0], piece.position[1]-3.5)
-					piece.display(surface)
+					display_piece(surface, piece)
 					
 					# Highlights the checkmate_king psoition
 					if checkmate_king and piece == checkmate_king:
@@ -621,39 +470,101 @@ class Chess:
 		center_x = SCREEN_WIDTH-240
 		center_y = SCREEN_HEIGHT/2
 		
-		show_result(surface, game_result, (center_x, center_y))
-		
-		# Retry if SPACE pressed or Quit if game window closed
-		retry = False
-		while True:
-			for event in pygame.event.get():
-				if event.type == pygame.QUIT:
-					pygame.quit()
-					sys.exit()
-				if event.type == pygame.KEYDOWN:
-					if event.key == pygame.K_SPACE:
-						self.__init__()
-						retry = True
-						break
-			if retry:
-				break
-		self.play(surface)
+		show_result(surface, game_result, (center_x, center_y), self.timed_out, self.state.adjudicated, self.abandoned)
+
+	def handle_game_over(self, event):
+		""" Starts a rematch if SPACE is pressed (the game window can be closed at any time) """
+		if event.type == pygame.KEYDOWN and event.key == pygame.K_SPACE:
+			if self.network:
+				self.network.rematch()
+			if self.computer:
+				self.computer.new_game()
+			self.reset()
 
 
 def main():
+	parser = argparse.ArgumentParser(description="A simple multiplayer chess game")
+	parser.add_argument("--fps", type=int, default=DEFAULT_FPS, help="frame rate cap (0 for no cap)")
+	parser.add_argument("--frame-stats", action="store_true", help="print frame timing stats on exit")
+	parser.add_argument("--connect", metavar="HOST:PORT", help="play on a game server (see server.py)")
+	parser.add_argument("--game", type=int, help="id of the game to join on the server (default: a new game)")
+	parser.add_argument("--computer", choices=("white", "black"), help="color played by the computer")
+	parser.add_argument("--think", type=float, default=1.0, help="thinking time of the computer per move (s)")
+	parser.add_argument("--fen", help="start from this position (press F in the game to print the current one)")
+	parser.add_argument("--pgn", metavar="PATH", help="append every finished game to this PGN file")
+	parser.add_argument("--search-stats", action="store_true", help="print depth and nodes per second of every search")
+	parser.add_argument("--clock", metavar="MINUTES+INCREMENT", help="play with clocks, like 5+3 or 10 (minutes, seconds)")
+	parser.add_argument("--clock-mode", choices=MODES, default=MODES[0], help="how the increment is given (default: fischer)")
+	parser.add_argument("--tablebases", metavar="DIR", help="endgame tables for the computer and for ending won or drawn endgames")
+	parser.add_argument("--book", metavar="PATH", help="opening book for the computer and for move hints with H "
+		"(see chesscore.book)")
+	parser.add_argument("--profile", metavar="PATH", nargs="?", const="-",
+		help="time the rules and drawing hot paths and write the numbers on exit to PATH (.json or .prof), "
+		"or print them without PATH (also set by the CHESS_PROFILE environment variable)")
+	args = parser.parse_args()
+	if args.computer and args.connect:
+		# The moves of network games are validated and played by the server
+		parser.error("--computer cannot be combined with --connect")
+	if args.fen:
+		try:
+			Position.from_fen(args.fen)
+		except ValueError as error:
+			parser.error(str(error))
+	time_control = None
+	if args.clock:
+		try:
+			time_control = TimeControl.parse(args.clock, args.clock_mode)
+		except ValueError as error:
+			parser.error(str(error))
+	book = None
+	if args.book:
+		try:
+			book = OpeningBook(args.book)
+		except (OSError, ValueError) as error:
+			parser.error(str(error))
+	tablebase = None
+	if args.tablebases:
+		try:
+			tablebase = Tablebase(args.tablebases)
+		except (OSError, ValueError) as error:
+			parser.error(str(error))
+
 	pygame.init()
 
 	screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
 
-	chess_icon = load_image("chess_icon.png")
+	# Loads all images from the disk and finds the font only once for the whole process
+	sprite_cache.load_all()
+	text_cache.find_font()
 	pygame.display.set_caption("Chess Tournament")
-	pygame.display.set_icon(chess_icon)
-
-	my_chess = Chess()
+	pygame.display.set_icon(get_image(ICON_IMAGE))
+
+	scheduler = EventScheduler(args.fps)
+	if configure_profiling(args.profile):
+		profiler.watch(Chess, None, "display_board", histogram=True)
+		profiler.watch(BoardRenderer, None, "draw")
+		profiler.watch(type(text_cache), None, "render")
+		profiler.histograms["frame"] = scheduler.frame_times
+	if args.frame_stats:
+		atexit.register(lambda: print(scheduler.report(), text_cache.stats()))
+
+	network = None
+	if args.connect:
+		host, port = args.connect.rsplit(":", 1)
+		network = NetworkClient(host, int(port))
+		if args.game:
+			network.join(args.game)
+		else:
+			network.new_game(args.clock, args.clock_mode)
+
+	computer = None
+	if args.computer:
+		computer = Computer(args.computer, args.think, on_search=print if args.search_stats else None,
+			tablebase=tablebase, book=book)
+
+	my_chess = Chess(scheduler, network, computer, args.fen, args.pgn, time_control, tablebase, book)
 	my_chess.play(screen)
 
 
 if __name__ == "__main__":
 	main()
-
-
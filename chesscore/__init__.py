@@ -0,0 +1,14 @@
+""" Rules of chess, independent of the pygame front-end """
+
+from chesscore.bitboard import (
+	WHITE, BLACK, COLOR_NAMES, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING, PIECE_NAMES,
+	NORMAL, PROMOTION, EN_PASSANT, CASTLING,
+	Position, encode_move, move_from, move_to, move_flag, move_promotion, move_uci,
+	square_name, parse_square,
+)
+from chesscore.gamestate import GameState, insufficient_material, can_checkmate, flag_result, DRAW_RESULTS
+from chesscore.zobrist import TranspositionTable, compute_key, EXACT, LOWER, UPPER
+from chesscore.pieces import Piece, King, Queen, Rook, Knight, Bishop, Pawn, PIECE_CLASSES
+from chesscore.notation import move_san, parse_san
+from chesscore.clock import TimeControl, ChessClock, TimerHeap
+from chesscore.game import Game
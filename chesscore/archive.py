@@ -0,0 +1,285 @@
+""" Append-only binary archive of games with random access and a position index
+
+	python -m chesscore.archive import games.pgn games.chs
+	python -m chesscore.archive index games.chs
+	python -m chesscore.archive query games.chs --fen "<FEN>"
+
+An archive at PATH is made of four files:
+	PATH        header, then per game: move count (u16), result (u8), flags (u8),
+	            the packed start position (72 bytes, only if flags & CUSTOM_START)
+	            and the moves, 16 bits each (the move encoding of the position)
+	PATH.idx    offset of every game in PATH (u64), so game N is found in O(1)
+	PATH.keys   (Zobrist key u64, game u32, ply u16, padding) of every position reached,
+	            in the order the games were appended
+	PATH.pidx   the entries of PATH.keys sorted by key, written by build_index. Entries
+	            appended to PATH.keys since then are searched linearly until the next build
+All numbers are little endian. Reads go through mmap: the moves of a game are returned as a
+memoryview into the mapped file, without copying or parsing.
+"""
+
+import argparse
+import bisect
+import mmap
+import os
+import struct
+import sys
+import time
+
+from chesscore.bitboard import Position, PACKED_SIZE, START_FEN, move_uci
+from chesscore.gamestate import DRAW_RESULTS
+from chesscore.pgn import read_games
+
+
+MAGIC = b"CHESSARC\x01\x00\x00\x00"
+GAME_HEADER = struct.Struct("<HBB")
+OFFSET = struct.Struct("<Q")
+KEY_ENTRY = struct.Struct("<QIHxx")
+INDEX_HEADER = struct.Struct("<Q")
+CUSTOM_START = 1
+
+# Results of a game (see GameState) by their code in the archive. "draw" is a draw of
+# unknown kind, like the draws read from PGN
+RESULTS = (None, "white", "black", "draw") + DRAW_RESULTS
+RESULT_CODES = {result: code for code, result in enumerate(RESULTS)}
+PGN_RESULTS = {"1-0": "white", "0-1": "black", "1/2-1/2": "draw"}
+
+LITTLE_ENDIAN = sys.byteorder == "little"
+
+
+class MappedFile:
+	""" Read-only mmap of a file that may grow or be replaced; remapped when it changed """
+	def __init__(self, path):
+		self.path = path
+		self.map = None
+		self.stat = None
+
+	def view(self):
+		""" Returns a memoryview of the whole file (empty if it does not exist) """
+		try:
+			stat = os.stat(self.path)
+			stat = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+		except FileNotFoundError:
+			stat = None
+		if stat != self.stat:
+			self.close()
+			self.stat = stat
+			if stat and stat[1]:
+				with open(self.path, "rb") as file:
+					self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+		return memoryview(self.map) if self.map is not None else memoryview(b"")
+
+	def close(self):
+		if self.map is not None:
+			try:
+				self.map.close()
+			except BufferError:
+				# Views of the old mapping are still in use; it is closed once they are released
+				pass
+			self.map = None
+		self.stat = None
+
+
+class SortedKeys:
+	""" Sequence view of the sorted key entries of a .pidx file, for bisect """
+	def __init__(self, data):
+		self.data = data
+
+	def __len__(self):
+		return len(self.data) // KEY_ENTRY.size
+
+	def __getitem__(self, index):
+		return KEY_ENTRY.unpack_from(self.data, index * KEY_ENTRY.size)[0]
+
+
+class Archive:
+	""" Binary game archive (see the module docstring). Games are numbered from 0 """
+	def __init__(self, path):
+		self.path = path
+		if not os.path.exists(path) or not os.path.getsize(path):
+			with open(path, "wb") as file:
+				file.write(MAGIC)
+			for suffix in (".idx", ".keys", ".pidx"):
+				if os.path.exists(path + suffix):
+					os.remove(path + suffix)
+		with open(path, "rb") as file:
+			if file.read(len(MAGIC)) != MAGIC:
+				raise ValueError(f"not a game archive: {path}")
+		self.data = MappedFile(path)
+		self.offsets = MappedFile(path + ".idx")
+		self.keys = MappedFile(path + ".keys")
+		self.index = MappedFile(path + ".pidx")
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		self.close()
+
+	def close(self):
+		for mapped in (self.data, self.offsets, self.keys, self.index):
+			mapped.close()
+
+	def __len__(self):
+		return len(self.offsets.view()) // OFFSET.size
+
+	def append(self, moves, result=None, start=None):
+		""" Appends a game: its moves (checked to be legal), its result and its start position
+		(a Position, the standard one if None). Returns the number of the game """
+		number = len(self)
+		position = start.copy() if start is not None else Position.start()
+		keys = bytearray(KEY_ENTRY.pack(position.key, number, 0))
+		for ply, move in enumerate(moves, 1):
+			if move not in position.legal_moves():
+				raise ValueError(f"illegal move {move:#06x} at ply {ply} of game {number}")
+			position.make_move(move)
+			keys += KEY_ENTRY.pack(position.key, number, ply)
+
+		record = GAME_HEADER.pack(len(moves), RESULT_CODES[result], CUSTOM_START if start is not None else 0)
+		if start is not None:
+			record += start.pack()
+		record += struct.pack(f"<{len(moves)}H", *moves)
+		with open(self.path, "ab") as file:
+			offset = file.tell()
+			file.write(record)
+		with open(self.path + ".keys", "ab") as file:
+			file.write(keys)
+		# The offset is written last: a game is only visible once it is complete
+		with open(self.path + ".idx", "ab") as file:
+			file.write(OFFSET.pack(offset))
+		return number
+
+	def append_game(self, game):
+		""" Appends a Game or a PgnGame """
+		start = Position.from_fen(game.start_fen) if game.start_fen != START_FEN else None
+		result = PGN_RESULTS.get(game.result, game.result)
+		return self.append(game.moves, result if result in RESULT_CODES else None, start)
+
+	def _record(self, number):
+		if not 0 <= number < len(self):
+			raise IndexError(f"no game {number} in the archive")
+		offset = OFFSET.unpack_from(self.offsets.view(), number * OFFSET.size)[0]
+		data = self.data.view()
+		count, result, flags = GAME_HEADER.unpack_from(data, offset)
+		offset += GAME_HEADER.size
+		start = None
+		if flags & CUSTOM_START:
+			start = data[offset:offset + PACKED_SIZE]
+			offset += PACKED_SIZE
+		return data, offset, count, RESULTS[result], start
+
+	def moves(self, number):
+		""" The moves of game N as a memoryview of 16-bit integers into the archive (no copy) """
+		data, offset, count, result, start = self._record(number)
+		moves = data[offset:offset + 2 * count]
+		if LITTLE_ENDIAN:
+			return moves.cast("H")
+		return memoryview(struct.pack(f"={count}H", *struct.unpack(f"<{count}H", moves))).cast("H")
+
+	def result(self, number):
+		return self._record(number)[3]
+
+	def start_position(self, number):
+		start = self._record(number)[4]
+		return Position.unpack(start) if start is not None else Position.start()
+
+	def position(self, number, ply=None):
+		""" Position of game N after ply moves (all moves if None), replayed from the binary moves """
+		position = self.start_position(number)
+		moves = self.moves(number)
+		for move in moves[:len(moves) if ply is None else ply]:
+			position.make_move(move)
+		return position
+
+	def build_index(self):
+		""" Writes the position index: all key entries sorted by key """
+		keys = self.keys.view()
+		count = len(keys) // KEY_ENTRY.size
+		entries = sorted(KEY_ENTRY.iter_unpack(keys[:count * KEY_ENTRY.size]))
+		temporary = self.path + ".pidx.tmp"
+		with open(temporary, "wb") as file:
+			file.write(INDEX_HEADER.pack(count))
+			for entry in entries:
+				file.write(KEY_ENTRY.pack(*entry))
+		os.replace(temporary, self.path + ".pidx")
+		return count
+
+	def find(self, key):
+		""" (game, ply) of every position with the given Zobrist key, sorted """
+		found = []
+		indexed = 0
+		index = self.index.view()
+		if len(index) >= INDEX_HEADER.size:
+			indexed = INDEX_HEADER.unpack_from(index)[0]
+			sorted_keys = SortedKeys(index[INDEX_HEADER.size:])
+			i = bisect.bisect_left(sorted_keys, key)
+			while i < len(sorted_keys):
+				entry_key, game, ply = KEY_ENTRY.unpack_from(sorted_keys.data, i * KEY_ENTRY.size)
+				if entry_key != key:
+					break
+				found.append((game, ply))
+				i += 1
+		# Entries appended after the index was built
+		keys = self.keys.view()
+		for entry_key, game, ply in KEY_ENTRY.iter_unpack(keys[indexed * KEY_ENTRY.size:len(keys) // KEY_ENTRY.size * KEY_ENTRY.size]):
+			if entry_key == key:
+				found.append((game, ply))
+		return sorted(found)
+
+	def games_with(self, position):
+		""" (game, ply) of every game that reached the position. Positions are compared by
+		Zobrist key, and the matches are checked against the replayed positions """
+		return [(game, ply) for game, ply in self.find(position.key) if self.position(game, ply) == position]
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description="Binary game archive")
+	commands = parser.add_subparsers(dest="command", required=True)
+	command = commands.add_parser("import", help="append the games of PGN files")
+	command.add_argument("pgn", nargs="+")
+	command.add_argument("archive")
+	command = commands.add_parser("index", help="rebuild the position index")
+	command.add_argument("archive")
+	command = commands.add_parser("query", help="list the games that reached a position")
+	command.add_argument("archive")
+	command.add_argument("--fen", required=True)
+	command = commands.add_parser("show", help="print the moves and final position of a game")
+	command.add_argument("archive")
+	command.add_argument("game", type=int)
+	args = parser.parse_args(argv)
+
+	with Archive(args.archive) as archive:
+		start = time.perf_counter()
+		if args.command == "import":
+			games = moves = skipped = 0
+			for path in args.pgn:
+				with open(path, encoding="utf-8", errors="replace") as file:
+					for game in read_games(file):
+						if game.error:
+							skipped += 1
+							continue
+						archive.append_game(game)
+						games += 1
+						moves += len(game.moves)
+			entries = archive.build_index()
+			print(f"{games} games ({moves} moves) imported, {skipped} with errors skipped, "
+				f"{entries} positions indexed in {time.perf_counter() - start:.2f} s")
+		elif args.command == "index":
+			print(f"{archive.build_index()} positions indexed in {time.perf_counter() - start:.2f} s")
+		elif args.command == "query":
+			try:
+				position = Position.from_fen(args.fen)
+			except ValueError as error:
+				parser.error(str(error))
+			matches = archive.games_with(position)
+			seconds = time.perf_counter() - start
+			for game, ply in matches:
+				print(f"game {game} ply {ply} result {archive.result(game)}")
+			print(f"{len(matches)} matches in {1000 * seconds:.2f} ms")
+		elif args.command == "show":
+			print(" ".join(move_uci(move) for move in archive.moves(args.game)))
+			print(archive.position(args.game).fen(), archive.result(args.game))
+	return 0
+
+
+if __name__ == "__main__":
+	sys.exit(main())
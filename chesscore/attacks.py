@@ -0,0 +1,198 @@
+""" Precomputed attack tables and the attack map of a position
+
+Square numbering is the same as in chesscore.bitboard (0 is a8, 63 is h1).
+"""
+
+from chesscore.constants import PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING
+
+
+def _step_table(steps):
+	""" Attack table of a piece that moves by fixed steps (king, knight, pawn captures) """
+	table = []
+	for square in range(64):
+		row, col = divmod(square, 8)
+		attacks = 0
+		for i, j in steps:
+			if 0 <= row+i < 8 and 0 <= col+j < 8:
+				attacks |= 1 << ((row+i)*8 + col+j)
+		table.append(attacks)
+	return table
+
+def _ray(square, step):
+	""" Squares from the square (exclusive) to the edge of the board in the given direction """
+	row, col = divmod(square, 8)
+	ray = []
+	row, col = row+step[0], col+step[1]
+	while 0 <= row < 8 and 0 <= col < 8:
+		ray.append(row*8 + col)
+		row, col = row+step[0], col+step[1]
+	return ray
+
+def _line_table(square, direction):
+	""" Returns (mask, table) for the line through the square in the direction and its opposite.
+	table maps every occupancy of the masked squares to the attacked squares on the line """
+	rays = [_ray(square, direction), _ray(square, (-direction[0], -direction[1]))]
+	# The last square of a ray never blocks anything behind it
+	mask = 0
+	for ray in rays:
+		for sq in ray[:-1]:
+			mask |= 1 << sq
+
+	table = {}
+	occupancy = 0
+	while True:
+		attacks = 0
+		for ray in rays:
+			for sq in ray:
+				attacks |= 1 << sq
+				if occupancy >> sq & 1:
+					break
+		table[occupancy] = attacks
+		# Next subset of the mask (Carry-Rippler)
+		occupancy = (occupancy - mask) & mask
+		if not occupancy:
+			return mask, table
+
+
+KNIGHT_ATTACKS = _step_table([(-2, -1), (-2, 1), (-1, 2), (1, 2), (-1, -2), (1, -2), (2, -1), (2, 1)])
+KING_ATTACKS = _step_table([(0, -1), (0, 1), (-1, 0), (1, 0), (-1, -1), (-1, 1), (1, -1), (1, 1)])
+# Squares attacked by a pawn of each color standing on a square
+PAWN_ATTACKS = (_step_table([(-1, -1), (-1, 1)]), _step_table([(1, -1), (1, 1)]))
+
+# Sliding attacks are looked up by the occupancy of each line through the square,
+# so a rook or a bishop needs two dictionary lookups and no loops
+ROOK_LINES = [_line_table(sq, (0, 1)) + _line_table(sq, (1, 0)) for sq in range(64)]
+BISHOP_LINES = [_line_table(sq, (1, 1)) + _line_table(sq, (1, -1)) for sq in range(64)]
+
+
+def rook_attacks(square, occupied):
+	rank_mask, rank_table, file_mask, file_table = ROOK_LINES[square]
+	return rank_table[occupied & rank_mask] | file_table[occupied & file_mask]
+
+def bishop_attacks(square, occupied):
+	diag_mask, diag_table, anti_mask, anti_table = BISHOP_LINES[square]
+	return diag_table[occupied & diag_mask] | anti_table[occupied & anti_mask]
+
+def queen_attacks(square, occupied):
+	return rook_attacks(square, occupied) | bishop_attacks(square, occupied)
+
+
+def _line_tables():
+	""" BETWEEN[a][b] holds the squares strictly between two aligned squares and LINE[a][b]
+	the whole line through them (both are 0 if the squares are not on a common line) """
+	between = [[0] * 64 for _ in range(64)]
+	line = [[0] * 64 for _ in range(64)]
+	for square in range(64):
+		for step in [(0, 1), (1, 0), (1, 1), (1, -1), (0, -1), (-1, 0), (-1, -1), (-1, 1)]:
+			ray = _ray(square, step)
+			full_line = 1 << square
+			for sq in ray + _ray(square, (-step[0], -step[1])):
+				full_line |= 1 << sq
+			squares_between = 0
+			for sq in ray:
+				between[square][sq] = squares_between
+				line[square][sq] = full_line
+				squares_between |= 1 << sq
+	return between, line
+
+
+BETWEEN, LINE = _line_tables()
+
+
+def attacked_squares(position, color, occupied):
+	""" Bitboard of all squares attacked by the pieces of color with the given occupancy """
+	pieces = position.pieces[color]
+	pawn_attacks = PAWN_ATTACKS[color]
+	attacked = 0
+	for ptype in (PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING):
+		bb = pieces[ptype]
+		while bb:
+			lsb = bb & -bb
+			square = lsb.bit_length() - 1
+			bb ^= lsb
+			if ptype == PAWN:
+				attacked |= pawn_attacks[square]
+			elif ptype == KNIGHT:
+				attacked |= KNIGHT_ATTACKS[square]
+			elif ptype == BISHOP:
+				attacked |= bishop_attacks(square, occupied)
+			elif ptype == ROOK:
+				attacked |= rook_attacks(square, occupied)
+			elif ptype == QUEEN:
+				attacked |= queen_attacks(square, occupied)
+			else:
+				attacked |= KING_ATTACKS[square]
+	return attacked
+
+
+class AttackMap:
+	""" Attack information of a position, computed once per position and cached by it:
+	danger holds the squares attacked by the opponent of the side to move (seen through
+	the king, so the king cannot step back along a checking line), checkers the pieces
+	giving check and pinned the pieces of the side to move pinned to their king.
+
+	It is rebuilt rather than updated by make_move: every field is relative to the side to
+	move, so after a move none of them carries over, and most positions made (the leaves of
+	perft, the moves cut off by the search) never ask for their map """
+	__slots__ = ("position", "king_square", "danger", "checkers", "pinned", "_attacked")
+
+	def __init__(self, position):
+		self.position = position
+		us = position.turn
+		them = 1 - us
+		own, enemy = position.occupied[us], position.occupied[them]
+		occupied = own | enemy
+		king = position.pieces[us][KING]
+		self.king_square = king_square = king.bit_length() - 1
+		self._attacked = [None, None]
+		self.danger = attacked_squares(position, them, occupied ^ king)
+		self.checkers = 0
+		self.pinned = 0
+		if not king:
+			return
+
+		self.checkers = position.attackers_to(king_square, them, occupied)
+
+		# Enemy sliders that would attack the king if there were no pieces of the side to move
+		pieces = position.pieces[them]
+		snipers = (rook_attacks(king_square, enemy) & (pieces[ROOK] | pieces[QUEEN])) | \
+			(bishop_attacks(king_square, enemy) & (pieces[BISHOP] | pieces[QUEEN]))
+		while snipers:
+			lsb = snipers & -snipers
+			snipers ^= lsb
+			blockers = BETWEEN[king_square][lsb.bit_length() - 1] & occupied
+			# Exactly one piece in between and it is ours
+			if blockers and not blockers & (blockers - 1) and blockers & own:
+				self.pinned |= blockers
+
+	def attacked(self, color):
+		""" Bitboard of the squares attacked by color in the position """
+		if self._attacked[color] is None:
+			position = self.position
+			occupied = position.occupied[0] | position.occupied[1]
+			self._attacked[color] = attacked_squares(position, color, occupied)
+		return self._attacked[color]
+
+	def in_check(self):
+		return self.checkers != 0
+
+	def is_double_check(self):
+		return self.checkers & (self.checkers - 1) != 0
+
+	def is_pinned(self, square):
+		return self.pinned >> square & 1 == 1
+
+	def pin_mask(self, square):
+		""" Squares a piece on the square may move to without exposing its king """
+		if self.pinned >> square & 1:
+			return LINE[self.king_square][square]
+		return (1 << 64) - 1
+
+	def check_mask(self):
+		""" Squares a non-king move must go to to resolve a check (all squares if not in check) """
+		checkers = self.checkers
+		if not checkers:
+			return (1 << 64) - 1
+		if checkers & (checkers - 1):
+			return 0
+		return checkers | BETWEEN[self.king_square][checkers.bit_length() - 1]
@@ -0,0 +1,239 @@
+""" Vectorized analysis of many positions at once with NumPy
+
+The positions come as an (N, 72) uint8 array of packed positions (see Position.pack: the 64
+mailbox codes followed by the state fields), for example a memory mapped file of them
+(load_packed). They are processed in chunks of chunk_size rows, so the temporary arrays stay
+bounded whatever N is: about 200 bytes per row of the chunk. Within a chunk every position is a
+row and all work is done column-wise: the mailbox codes become 12 bitboards per row
+(np.packbits), the attacks of each color are shifted and flood filled (Kogge-Stone) on whole
+uint64 columns and the evaluation terms are table lookups summed over the rows.
+
+Whether the side to move has a legal move is decided without generating moves for nearly all
+positions: a safe square for the king, or any move of a piece that is not on a line with its own
+king (it cannot be pinned) when not in check, is enough. The few positions left (checkmates,
+stalemates and some positions in check) are decided by Position.legal_moves, so the results are
+exact. Repetitions are not known from a single position and are not detected.
+
+NumPy is only needed for this module.
+"""
+
+try:
+	import numpy as np
+except ImportError:
+	raise ImportError("chesscore.batch needs NumPy (pip install numpy)") from None
+
+from chesscore.archive import RESULT_CODES
+from chesscore.attacks import KING_ATTACKS, rook_attacks, bishop_attacks
+from chesscore.bitboard import Position, PACKED_SIZE, piece_code
+from chesscore.constants import WHITE, BLACK, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING
+from chesscore.evaluation import PIECE_VALUES, SQUARE_VALUES, KING_ENDGAME_VALUES
+from chesscore.material import LIGHT_SQUARES
+
+
+# Rows per chunk
+CHUNK_SIZE = 65536
+
+U64 = np.uint64
+FILE_A = 0x0101010101010101
+NOT_A = U64(~FILE_A & (1 << 64) - 1)
+NOT_H = U64(~(FILE_A << 7) & (1 << 64) - 1)
+NOT_AB = U64(~(FILE_A * 3) & (1 << 64) - 1)
+NOT_GH = U64(~(FILE_A * 0xC0) & (1 << 64) - 1)
+ALL = U64((1 << 64) - 1)
+LIGHT = U64(LIGHT_SQUARES)
+
+# (square delta, mask of the squares that can be reached without wrapping around the board).
+# Square 0 is a8, so going up the board (towards black) lowers the square
+ROOK_DIRECTIONS = ((-8, ALL), (8, ALL), (1, NOT_A), (-1, NOT_H))
+BISHOP_DIRECTIONS = ((-7, NOT_A), (-9, NOT_H), (9, NOT_A), (7, NOT_H))
+KNIGHT_STEPS = ((-17, NOT_H), (-15, NOT_A), (-10, NOT_GH), (-6, NOT_AB), (6, NOT_GH), (10, NOT_AB), (15, NOT_H), (17, NOT_A))
+KING_STEPS = ROOK_DIRECTIONS + BISHOP_DIRECTIONS
+PAWN_CAPTURES = (((-9, NOT_H), (-7, NOT_A)), ((7, NOT_H), (9, NOT_A)))
+PAWN_PUSH = (-8, 8)
+
+KING_TABLE = np.array(KING_ATTACKS, dtype=U64)
+# Squares on a rank, file or diagonal through each square: pieces elsewhere are never pinned
+LINES = np.array([rook_attacks(sq, 0) | bishop_attacks(sq, 0) for sq in range(64)], dtype=U64)
+
+# Centipawns by mailbox code and square, from the view of white: piece values only, piece
+# values plus square bonuses, and the same with the endgame square bonuses of the kings
+MATERIAL_VALUES = np.zeros(16, dtype=np.int32)
+SQUARE_TABLE = np.zeros((16, 64), dtype=np.int32)
+ENDGAME_TABLE = np.zeros((16, 64), dtype=np.int32)
+for _color in (WHITE, BLACK):
+	for _ptype in range(6):
+		_code = piece_code(_color, _ptype)
+		MATERIAL_VALUES[_code] = PIECE_VALUES[_ptype] * (-1 if _color else 1)
+		SQUARE_TABLE[_code] = SQUARE_VALUES[_color][_ptype]
+		ENDGAME_TABLE[_code] = KING_ENDGAME_VALUES[_color] if _ptype == KING else SQUARE_VALUES[_color][_ptype]
+SQUARES = np.arange(64)
+
+NO_RESULT = RESULT_CODES[None]
+
+
+def _shift(bitboards, delta):
+	return bitboards << U64(delta) if delta > 0 else bitboards >> U64(-delta)
+
+
+def _steps(bitboards, steps):
+	""" Squares reached from the set bits by one of the steps """
+	attacks = np.zeros_like(bitboards)
+	for delta, mask in steps:
+		attacks |= _shift(bitboards, delta) & mask
+	return attacks
+
+
+def _slide(sliders, empty, directions):
+	""" Squares attacked by the sliders along the directions (Kogge-Stone fill) """
+	attacks = np.zeros_like(sliders)
+	for delta, mask in directions:
+		generate = sliders
+		propagate = empty & mask
+		generate = generate | propagate & _shift(generate, delta)
+		propagate = propagate & _shift(propagate, delta)
+		generate = generate | propagate & _shift(generate, 2 * delta)
+		propagate = propagate & _shift(propagate, 2 * delta)
+		generate = generate | propagate & _shift(generate, 4 * delta)
+		attacks |= _shift(generate, delta) & mask
+	return attacks
+
+
+def _slider_attacks(pieces, empty):
+	return _slide(pieces[ROOK] | pieces[QUEEN], empty, ROOK_DIRECTIONS) | \
+		_slide(pieces[BISHOP] | pieces[QUEEN], empty, BISHOP_DIRECTIONS)
+
+
+def _attacks(color, pieces, empty):
+	""" Squares attacked by the pieces (bitboards by piece type) of one color """
+	return _steps(pieces[PAWN], PAWN_CAPTURES[color]) | _steps(pieces[KNIGHT], KNIGHT_STEPS) | \
+		_steps(pieces[KING], KING_STEPS) | _slider_attacks(pieces, empty)
+
+
+if hasattr(np, "bitwise_count"):
+	def popcount(bitboards):
+		return np.bitwise_count(bitboards).astype(np.int32)
+else:
+	_BYTE_COUNTS = np.array([bin(byte).count("1") for byte in range(256)], dtype=np.int32)
+
+	def popcount(bitboards):
+		return _BYTE_COUNTS[bitboards.view(np.uint8).reshape(-1, 8)].sum(axis=1, dtype=np.int32)
+
+
+class Analysis:
+	""" Per-position results of analyse, arrays of N values:
+		white_attacks, black_attacks  squares attacked by each color (uint64, bit = square)
+		in_check                      whether the side to move is in check
+		material                      material balance in centipawns (white minus black)
+		mobility                      attacked squares not occupied by own pieces, white minus black
+		score                         the evaluation of chesscore.evaluation, from the side to move
+		result                        game over code: an index of chesscore.archive.RESULTS (0 if
+		                              not over, white or black won, stalemate, normal-draw or 50-move)
+	fallbacks counts the positions whose legal moves had to be generated """
+	__slots__ = ("white_attacks", "black_attacks", "in_check", "material", "mobility", "score", "result", "fallbacks")
+
+	def __init__(self, size):
+		self.white_attacks = np.zeros(size, dtype=U64)
+		self.black_attacks = np.zeros(size, dtype=U64)
+		self.in_check = np.zeros(size, dtype=bool)
+		self.material = np.zeros(size, dtype=np.int32)
+		self.mobility = np.zeros(size, dtype=np.int32)
+		self.score = np.zeros(size, dtype=np.int32)
+		self.result = np.zeros(size, dtype=np.uint8)
+		self.fallbacks = 0
+
+	def __len__(self):
+		return len(self.result)
+
+
+def pack_positions(positions):
+	""" Packs positions into an (N, 72) array """
+	return np.frombuffer(b"".join(position.pack() for position in positions), dtype=np.uint8).reshape(-1, PACKED_SIZE)
+
+
+def load_packed(path):
+	""" Maps a file of packed positions (written with pack_positions(...).tofile) read-only """
+	return np.memmap(path, dtype=np.uint8, mode="r").reshape(-1, PACKED_SIZE)
+
+
+def analyse(packed, chunk_size=CHUNK_SIZE):
+	""" Analyses an (N, 72) uint8 array of packed positions; returns an Analysis """
+	packed = np.asarray(packed, dtype=np.uint8).reshape(-1, PACKED_SIZE)
+	analysis = Analysis(len(packed))
+	for start in range(0, len(packed), chunk_size):
+		_analyse_chunk(np.ascontiguousarray(packed[start:start + chunk_size]), analysis, slice(start, start + chunk_size))
+	return analysis
+
+
+def _analyse_chunk(chunk, analysis, rows):
+	codes = chunk[:, :64]
+	state = np.ascontiguousarray(chunk[:, 64:]).view("<u8")[:, 0]
+	black_to_move = (state & U64(1)).astype(bool)
+	halfmove_clock = (state >> U64(12)) & U64(0xFFFF)
+
+	pieces = [[np.packbits(codes == piece_code(color, ptype), axis=1, bitorder="little").view("<u8")[:, 0]
+		for ptype in range(6)] for color in (WHITE, BLACK)]
+	occupied = [np.bitwise_or.reduce(pieces[color]) for color in (WHITE, BLACK)]
+	empty = ~(occupied[WHITE] | occupied[BLACK])
+	attacks = [_attacks(color, pieces[color], empty) for color in (WHITE, BLACK)]
+	analysis.white_attacks[rows] = attacks[WHITE]
+	analysis.black_attacks[rows] = attacks[BLACK]
+	analysis.mobility[rows] = popcount(attacks[WHITE] & ~occupied[WHITE]) - popcount(attacks[BLACK] & ~occupied[BLACK])
+
+	# Everything of the side to move (us) and of the opponent (them), row by row
+	def pick(white, black, for_us=True):
+		return np.where(black_to_move == for_us, black, white)
+	our_king = pick(pieces[WHITE][KING], pieces[BLACK][KING])
+	ours = pick(occupied[WHITE], occupied[BLACK])
+	theirs = pick(occupied[WHITE], occupied[BLACK], False)
+	their_attacks = pick(attacks[WHITE], attacks[BLACK], False)
+	in_check = (our_king & their_attacks) != 0
+	analysis.in_check[rows] = in_check
+
+	# Material and evaluation, as chesscore.evaluation.evaluate does it
+	counts = [[popcount(bitboard) for bitboard in color_pieces] for color_pieces in pieces]
+	analysis.material[rows] = MATERIAL_VALUES[codes].sum(axis=1, dtype=np.int32)
+	endgame = np.ones(len(chunk), dtype=bool)
+	for color in (WHITE, BLACK):
+		minors = counts[color][KNIGHT] + counts[color][BISHOP]
+		endgame &= (counts[color][QUEEN] == 0) | ((counts[color][ROOK] == 0) & (minors <= 1))
+	score = np.where(endgame, ENDGAME_TABLE[codes, SQUARES].sum(axis=1, dtype=np.int32),
+		SQUARE_TABLE[codes, SQUARES].sum(axis=1, dtype=np.int32))
+	analysis.score[rows] = np.where(black_to_move, -score, score)
+
+	# Legal moves exist if the king has a safe square (the attacks of the opponent pass through
+	# the king, which cannot hide behind itself) or, when not in check, if a piece that cannot
+	# be pinned can move
+	has_king = our_king != 0
+	king_square = np.argmax(codes == np.where(black_to_move, piece_code(BLACK, KING), piece_code(WHITE, KING))[:, None], axis=1)
+	their_pieces = [pick(white, black, False) for white, black in zip(pieces[WHITE], pieces[BLACK])]
+	their_xray = pick(attacks[WHITE], attacks[BLACK], False) | _slider_attacks(their_pieces, empty | our_king)
+	has_move = (KING_TABLE[king_square] & ~ours & ~their_xray) != 0
+	free = [pick(white, black) & ~LINES[king_square] for white, black in zip(pieces[WHITE], pieces[BLACK])]
+	free[KING] = np.zeros_like(our_king)
+	piece_targets = _steps(free[KNIGHT], KNIGHT_STEPS) | _slider_attacks(free, empty)
+	pawns = free[PAWN]
+	pawn_targets = np.where(black_to_move, _shift(pawns, 8), _shift(pawns, -8)) & empty | \
+		np.where(black_to_move, _steps(pawns, PAWN_CAPTURES[BLACK]), _steps(pawns, PAWN_CAPTURES[WHITE])) & theirs
+	has_move |= ~in_check & (((piece_targets & ~ours) | pawn_targets) != 0)
+	has_move &= has_king
+
+	# Dead positions, as chesscore.material.is_dead decides them
+	mating = sum(counts[color][ptype] for color in (WHITE, BLACK) for ptype in (PAWN, ROOK, QUEEN))
+	bishops = pieces[WHITE][BISHOP] | pieces[BLACK][BISHOP]
+	knights = counts[WHITE][KNIGHT] + counts[BLACK][KNIGHT]
+	light, dark = popcount(bishops & LIGHT), popcount(bishops & ~LIGHT)
+	dead = (mating == 0) & ((knights + light + dark <= 1) | ((knights == 0) & ((light == 0) | (dark == 0))))
+
+	result = np.full(len(chunk), NO_RESULT, dtype=np.uint8)
+	result[dead] = RESULT_CODES["normal-draw"]
+	result[~dead & (halfmove_clock >= 100)] = RESULT_CODES["50-move"]
+	unknown = np.flatnonzero(~has_move)
+	for row in unknown:
+		position = Position.unpack(chunk[row].tobytes())
+		if not position.legal_moves():
+			if position.in_check():
+				result[row] = RESULT_CODES["black" if position.turn == WHITE else "white"]
+			else:
+				result[row] = RESULT_CODES["stalemate"]
+	analysis.result[rows] = result
+	analysis.fallbacks += len(unknown)
@@ -0,0 +1,647 @@
+""" Bitboard position representation and legal move generation
+
+Squares are numbered row*8 + col like the (row, col) positions of the board, so
+square 0 is a8 and square 63 is h1. Bit n of a bitboard stands for square n.
+Moves are 16 bit ints: from | to << 6 | flag << 12 | (promotion - KNIGHT) << 14
+"""
+
+from chesscore.attacks import (
+	KNIGHT_ATTACKS, KING_ATTACKS, PAWN_ATTACKS, LINE,
+	rook_attacks, bishop_attacks, queen_attacks, AttackMap,
+)
+from chesscore.constants import (
+	WHITE, BLACK, COLOR_NAMES, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING, PIECE_NAMES,
+	NORMAL, PROMOTION, EN_PASSANT, CASTLING,
+	WHITE_KINGSIDE, WHITE_QUEENSIDE, BLACK_KINGSIDE, BLACK_QUEENSIDE, FULL, ROW_MASKS,
+)
+from chesscore.material import MATERIAL
+from chesscore.zobrist import PIECE_KEYS, SIDE_KEY, CASTLING_KEYS, EP_KEYS, compute_key
+
+
+def square_name(square):
+	""" Takes a square number and returns its name like 'e4' """
+	return "abcdefgh"[square & 7] + str(8 - (square >> 3))
+
+def parse_square(name):
+	""" Takes a square name like 'e4' and returns its square number. Raises ValueError for
+	anything else """
+	if len(name) != 2 or name[0] not in "abcdefgh" or name[1] not in "12345678":
+		raise ValueError(f"invalid square: {name!r}")
+	return (8 - int(name[1])) * 8 + "abcdefgh".index(name[0])
+
+def encode_move(from_square, to_square, flag=NORMAL, promotion=KNIGHT):
+	return from_square | to_square << 6 | flag << 12 | (promotion - KNIGHT) << 14
+
+def move_from(move):
+	return move & 63
+
+def move_to(move):
+	return move >> 6 & 63
+
+def move_flag(move):
+	return move >> 12 & 3
+
+def move_promotion(move):
+	return (move >> 14) + KNIGHT
+
+def move_uci(move):
+	""" Returns the move in UCI notation like 'e2e4' or 'e7e8q' """
+	uci = square_name(move & 63) + square_name(move >> 6 & 63)
+	if move >> 12 & 3 == PROMOTION:
+		uci += "nbrq"[move >> 14]
+	return uci
+
+def iter_bits(bitboard):
+	""" Yields the square numbers of all set bits from a8 to h1 """
+	while bitboard:
+		lsb = bitboard & -bitboard
+		yield lsb.bit_length() - 1
+		bitboard ^= lsb
+
+
+# Squares that must be empty and squares that must not be attacked for each castling move
+CASTLING_MOVES = (
+	(WHITE_KINGSIDE, 60, 62, 63, 61, (1 << 61) | (1 << 62), (1 << 61) | (1 << 62)),
+	(WHITE_QUEENSIDE, 60, 58, 56, 59, (1 << 57) | (1 << 58) | (1 << 59), (1 << 59) | (1 << 58)),
+	(BLACK_KINGSIDE, 4, 6, 7, 5, (1 << 5) | (1 << 6), (1 << 5) | (1 << 6)),
+	(BLACK_QUEENSIDE, 4, 2, 0, 3, (1 << 1) | (1 << 2) | (1 << 3), (1 << 3) | (1 << 2)),
+)
+
+START_LAYOUT = (ROOK, KNIGHT, BISHOP, QUEEN, KING, BISHOP, KNIGHT, ROOK)
+
+# Castling rights kept when a piece moves from or to each square
+CASTLING_KEEP = [15] * 64
+CASTLING_KEEP[60] = 15 & ~(WHITE_KINGSIDE | WHITE_QUEENSIDE)
+CASTLING_KEEP[63] = 15 & ~WHITE_KINGSIDE
+CASTLING_KEEP[56] = 15 & ~WHITE_QUEENSIDE
+CASTLING_KEEP[4] = 15 & ~(BLACK_KINGSIDE | BLACK_QUEENSIDE)
+CASTLING_KEEP[7] = 15 & ~BLACK_KINGSIDE
+CASTLING_KEEP[0] = 15 & ~BLACK_QUEENSIDE
+
+# Rook (from, to) squares of the castling move of the king to each square
+CASTLING_ROOKS = {62: (63, 61), 58: (56, 59), 6: (7, 5), 2: (0, 3)}
+
+FEN_PIECES = "pnbrqk"
+FEN_CASTLING = {"K": WHITE_KINGSIDE, "Q": WHITE_QUEENSIDE, "k": BLACK_KINGSIDE, "q": BLACK_QUEENSIDE}
+START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+# Mailbox codes: 0 for an empty square, else piece type + 1, plus 8 for black pieces
+EMPTY = 0
+BLACK_FLAG = 8
+
+def piece_code(color, ptype):
+	return color << 3 | (ptype + 1)
+
+# Size in bytes of a packed position: 64 mailbox bytes and 8 bytes of state
+PACKED_SIZE = 72
+NO_EP = 64
+
+
+class Position:
+	""" A chess position stored as one bitboard per color and piece type, plus a 64 byte
+	mailbox for finding the piece on a square. Positions have no __dict__, copy without
+	their move history and pack into 72 bytes (which is also how they are pickled) """
+	__slots__ = ("pieces", "occupied", "squares", "turn", "castling", "ep_square",
+		"halfmove_clock", "fullmove_number", "key", "material", "ply", "_undo", "_keys", "_attacks")
+
+	def __init__(self):
+		self.pieces = [[0] * 6, [0] * 6]
+		self.occupied = [0, 0]
+		self.squares = bytearray(64)
+		self.turn = WHITE
+		self.castling = 0
+		self.ep_square = None
+		self.halfmove_clock = 0
+		self.fullmove_number = 1
+		# Zobrist key of the position
+		self.key = CASTLING_KEYS[0]
+		# Material signature (see chesscore.material), updated on captures and promotions
+		self.material = 0
+		# Undo entries and keys of the positions before each move, grown on demand and reused
+		self._undo = []
+		self._keys = []
+		self.ply = 0
+		self._attacks = None
+
+	@classmethod
+	def start(cls):
+		""" Returns the starting position of a chess game """
+		position = cls()
+		for col, ptype in enumerate(START_LAYOUT):
+			position.put(col, BLACK, ptype)
+			position.put(8 + col, BLACK, PAWN)
+			position.put(48 + col, WHITE, PAWN)
+			position.put(56 + col, WHITE, ptype)
+		position.castling = WHITE_KINGSIDE | WHITE_QUEENSIDE | BLACK_KINGSIDE | BLACK_QUEENSIDE
+		position.rehash()
+		return position
+
+	@classmethod
+	def from_board(cls, board, turn="white", castling=0, ep_square=None, halfmove_clock=0):
+		""" Builds the position from an 8x8 list of Piece objects (or None) """
+		position = cls()
+		for row in board:
+			for piece in row:
+				if piece:
+					i, j = piece.position
+					position.put(i*8 + j, COLOR_NAMES.index(piece.color), PIECE_NAMES.index(piece.name))
+		position.turn = COLOR_NAMES.index(turn)
+		position.castling = castling
+		position.ep_square = ep_square
+		position.halfmove_clock = halfmove_clock
+		position.rehash()
+		return position
+
+	@classmethod
+	def from_fen(cls, fen):
+		""" Builds a position from Forsyth-Edwards Notation. Raises ValueError for invalid FEN """
+		fields = fen.split()
+		if len(fields) < 4 or len(fields[0].split("/")) != 8:
+			raise ValueError(f"invalid FEN: {fen!r}")
+		position = cls()
+		for row, rank in enumerate(fields[0].split("/")):
+			col = 0
+			for char in rank:
+				if char.isdigit():
+					col += int(char)
+				elif char.lower() in FEN_PIECES and col < 8:
+					position.put(row*8 + col, WHITE if char.isupper() else BLACK, FEN_PIECES.index(char.lower()))
+					col += 1
+				else:
+					raise ValueError(f"invalid FEN: {fen!r}")
+			if col != 8:
+				raise ValueError(f"invalid FEN: {fen!r}")
+		if len(fields) > 6 or fields[1] not in ("w", "b"):
+			raise ValueError(f"invalid FEN: {fen!r}")
+		for kings in (position.pieces[WHITE][KING], position.pieces[BLACK][KING]):
+			if not kings or kings & (kings - 1):
+				raise ValueError(f"invalid FEN (each side needs exactly one king): {fen!r}")
+		for pieces in position.pieces:
+			# Pieces beyond those of the starting position are promoted pawns. This also keeps
+			# the piece counts within the 4 bit fields of the material signature
+			counts = [bin(bitboard).count("1") for bitboard in pieces]
+			promoted = sum(max(0, counts[ptype] - initial) for ptype, initial in ((KNIGHT, 2), (BISHOP, 2), (ROOK, 2), (QUEEN, 1)))
+			if counts[PAWN] + promoted > 8:
+				raise ValueError(f"invalid FEN (more pieces than a side can have): {fen!r}")
+
+		position.turn = WHITE if fields[1] == "w" else BLACK
+		if fields[2] != "-":
+			if len(set(fields[2])) != len(fields[2]) or any(char not in FEN_CASTLING for char in fields[2]):
+				raise ValueError(f"invalid FEN castling rights: {fen!r}")
+			for char in fields[2]:
+				position.castling |= FEN_CASTLING[char]
+			# Rights whose king or rook is not on its home square are dropped
+			for right, king_square, _, rook_square, _, _, _ in CASTLING_MOVES:
+				color = BLACK if king_square < 8 else WHITE
+				if not position.pieces[color][KING] >> king_square & 1 or not position.pieces[color][ROOK] >> rook_square & 1:
+					position.castling &= ~right
+		if fields[3] != "-":
+			try:
+				ep_square = parse_square(fields[3])
+			except ValueError:
+				raise ValueError(f"invalid FEN en passant square: {fen!r}") from None
+			if ep_square >> 3 != (2 if position.turn == WHITE else 5):
+				raise ValueError(f"invalid FEN en passant square: {fen!r}")
+			# Only kept if a pawn can capture en passant, like make_move does
+			if PAWN_ATTACKS[1 - position.turn][ep_square] & position.pieces[position.turn][PAWN]:
+				position.ep_square = ep_square
+		try:
+			if len(fields) > 4:
+				position.halfmove_clock = int(fields[4])
+			if len(fields) > 5:
+				position.fullmove_number = int(fields[5])
+		except ValueError:
+			raise ValueError(f"invalid FEN move counters: {fen!r}") from None
+		if not 0 <= position.halfmove_clock <= 0xFFFF or position.fullmove_number < 1:
+			raise ValueError(f"invalid FEN move counters: {fen!r}")
+		position.rehash()
+		return position
+
+	def fen(self):
+		""" Returns the position in Forsyth-Edwards Notation """
+		ranks = []
+		for row in range(8):
+			rank = ""
+			empty = 0
+			for code in self.squares[row*8:row*8 + 8]:
+				if not code:
+					empty += 1
+					continue
+				if empty:
+					rank += str(empty)
+					empty = 0
+				char = FEN_PIECES[(code & 7) - 1]
+				rank += char if code >> 3 == BLACK else char.upper()
+			ranks.append(rank + (str(empty) if empty else ""))
+		castling = "".join(char for char, right in FEN_CASTLING.items() if self.castling & right) or "-"
+		ep_square = square_name(self.ep_square) if self.ep_square is not None else "-"
+		return f"{'/'.join(ranks)} {'wb'[self.turn]} {castling} {ep_square} {self.halfmove_clock} {self.fullmove_number}"
+
+	def pack(self):
+		""" Returns the position as 72 bytes: the mailbox followed by turn | castling << 1 |
+		en passant square << 5 | halfmove clock << 12 | fullmove number << 28 (little endian) """
+		ep_square = NO_EP if self.ep_square is None else self.ep_square
+		state = self.turn | self.castling << 1 | ep_square << 5 | self.halfmove_clock << 12 | \
+			self.fullmove_number << 28
+		return bytes(self.squares) + state.to_bytes(8, "little")
+
+	@classmethod
+	def unpack(cls, data):
+		""" Builds a position from the bytes returned by pack """
+		position = cls()
+		for square, code in enumerate(data[:64]):
+			if code:
+				position.put(square, code >> 3, (code & 7) - 1)
+		state = int.from_bytes(data[64:PACKED_SIZE], "little")
+		position.turn = state & 1
+		position.castling = state >> 1 & 15
+		position.ep_square = None if state >> 5 & 127 == NO_EP else state >> 5 & 127
+		position.halfmove_clock = state >> 12 & 0xFFFF
+		position.fullmove_number = state >> 28
+		position.rehash()
+		return position
+
+	def copy(self):
+		""" Returns a copy of the position without its move history """
+		position = Position.__new__(Position)
+		position.pieces = [self.pieces[0][:], self.pieces[1][:]]
+		position.occupied = self.occupied[:]
+		position.squares = self.squares[:]
+		position.turn = self.turn
+		position.castling = self.castling
+		position.ep_square = self.ep_square
+		position.halfmove_clock = self.halfmove_clock
+		position.fullmove_number = self.fullmove_number
+		position.key = self.key
+		position.material = self.material
+		position._undo = []
+		position._keys = []
+		position.ply = 0
+		position._attacks = None
+		return position
+
+	def __reduce__(self):
+		return Position.unpack, (self.pack(),)
+
+	def __hash__(self):
+		return self.key
+
+	def __eq__(self, other):
+		""" Positions are equal if they have the same pieces, side to move, castling rights and en passant square """
+		if not isinstance(other, Position):
+			return NotImplemented
+		return self.key == other.key and self.squares == other.squares and self.turn == other.turn and \
+			self.castling == other.castling and self.ep_square == other.ep_square
+
+	def put(self, square, color, ptype):
+		bit = 1 << square
+		self.pieces[color][ptype] |= bit
+		self.occupied[color] |= bit
+		self.squares[square] = color << 3 | (ptype + 1)
+		self.key ^= PIECE_KEYS[color][ptype][square]
+		self.material += MATERIAL[color][ptype][square]
+		self._attacks = None
+
+	def remove(self, square, color, ptype):
+		bit = 1 << square
+		self.pieces[color][ptype] &= ~bit
+		self.occupied[color] &= ~bit
+		self.squares[square] = EMPTY
+		self.key ^= PIECE_KEYS[color][ptype][square]
+		self.material -= MATERIAL[color][ptype][square]
+		self._attacks = None
+
+	def rehash(self):
+		""" Recomputes the Zobrist key after the turn, castling rights or en passant square were set directly """
+		self.key = compute_key(self)
+
+	def repetition_count(self):
+		""" How many times the current position occurred in the game (same pieces, side to
+		move, castling rights and en passant square), looking back to the last capture or pawn move """
+		count = 1
+		key = self.key
+		keys = self._keys
+		for ply in range(self.ply - 2, max(self.ply - self.halfmove_clock, 0) - 1, -2):
+			if keys[ply] == key:
+				count += 1
+		return count
+
+	@property
+	def attacks(self):
+		""" AttackMap of the position (checkers, pins and attacked squares), computed on first use
+		and dropped whenever a piece is put or removed (see AttackMap) """
+		if self._attacks is None:
+			self._attacks = AttackMap(self)
+		return self._attacks
+
+	def piece_at(self, square):
+		""" Returns (color, piece type) of the piece on the square or None """
+		code = self.squares[square]
+		if not code:
+			return None
+		return code >> 3, (code & 7) - 1
+
+	def king_square(self, color):
+		return self.pieces[color][KING].bit_length() - 1
+
+	def attackers_to(self, square, by, occupied, exclude=0):
+		""" Bitboard of the pieces of color by attacking the square with the given occupancy,
+		ignoring the pieces in exclude (a piece that is captured) """
+		pieces = self.pieces[by]
+		queens = pieces[QUEEN]
+		attackers = (KNIGHT_ATTACKS[square] & pieces[KNIGHT]) | \
+			(PAWN_ATTACKS[1-by][square] & pieces[PAWN]) | \
+			(KING_ATTACKS[square] & pieces[KING])
+		bishops = pieces[BISHOP] | queens
+		if bishops:
+			attackers |= bishop_attacks(square, occupied) & bishops
+		rooks = pieces[ROOK] | queens
+		if rooks:
+			attackers |= rook_attacks(square, occupied) & rooks
+		return attackers & ~exclude
+
+	def is_attacked(self, square, by):
+		""" Checks whether the square is attacked by any piece of color by """
+		return self.attackers_to(square, by, self.occupied[WHITE] | self.occupied[BLACK]) != 0
+
+	def in_check(self, color=None):
+		""" Checks whether the king of the given color (default: side to move) is in check """
+		if color is None or color == self.turn:
+			return self.attacks.checkers != 0
+		if not self.pieces[color][KING]:
+			return False
+		return self.is_attacked(self.king_square(color), 1 - color)
+
+	def pseudo_legal_moves(self, from_mask=FULL):
+		""" All moves of the side to move from the squares in from_mask, without checking
+		whether they leave the own king in check (castling is always fully checked) """
+		moves = []
+		append = moves.append
+		us = self.turn
+		them = 1 - us
+		own = self.occupied[us]
+		enemy = self.occupied[them]
+		occupied = own | enemy
+		empty = ~occupied & FULL
+		not_own = ~own & FULL
+		pieces = self.pieces[us]
+
+		# Pawns: pushes are generated for all pawns at once
+		pawns = pieces[PAWN] & from_mask
+		if pawns:
+			if us == WHITE:
+				back, last_row, single = 8, 0, (pawns >> 8) & empty
+				double = ((single & ROW_MASKS[5]) >> 8) & empty
+			else:
+				back, last_row, single = -8, 7, (pawns << 8) & empty
+				double = ((single & ROW_MASKS[2]) << 8) & empty
+
+			pawn_moves = []
+			attacks = PAWN_ATTACKS[us]
+			ep_bit = 1 << self.ep_square if self.ep_square is not None else 0
+			bb = pawns
+			while bb:
+				lsb = bb & -bb
+				frm = lsb.bit_length() - 1
+				bb ^= lsb
+				targets = attacks[frm] & enemy
+				while targets:
+					lsb = targets & -targets
+					pawn_moves.append((frm, lsb.bit_length() - 1))
+					targets ^= lsb
+				if attacks[frm] & ep_bit:
+					append(frm | self.ep_square << 6 | EN_PASSANT << 12)
+
+			for to in iter_bits(single):
+				pawn_moves.append((to + back, to))
+			for to in iter_bits(double):
+				append((to + 2*back) | to << 6)
+			for frm, to in pawn_moves:
+				if to >> 3 == last_row:
+					for promotion in (QUEEN, ROOK, BISHOP, KNIGHT):
+						append(frm | to << 6 | PROMOTION << 12 | (promotion - KNIGHT) << 14)
+				else:
+					append(frm | to << 6)
+
+		# Knights, bishops, rooks, queens and king
+		for ptype in (KNIGHT, BISHOP, ROOK, QUEEN, KING):
+			bb = pieces[ptype] & from_mask
+			while bb:
+				lsb = bb & -bb
+				frm = lsb.bit_length() - 1
+				bb ^= lsb
+				if ptype == KNIGHT:
+					targets = KNIGHT_ATTACKS[frm]
+				elif ptype == BISHOP:
+					targets = bishop_attacks(frm, occupied)
+				elif ptype == ROOK:
+					targets = rook_attacks(frm, occupied)
+				elif ptype == QUEEN:
+					targets = queen_attacks(frm, occupied)
+				else:
+					targets = KING_ATTACKS[frm]
+				targets &= not_own
+				while targets:
+					lsb = targets & -targets
+					append(frm | (lsb.bit_length() - 1) << 6)
+					targets ^= lsb
+
+		# Castling: king and rook unmoved, squares between empty, king not passing an attacked square
+		if self.castling and pieces[KING] & from_mask:
+			attacks = self.attacks
+			for right, king_square, to, rook_square, _, between, passed in CASTLING_MOVES:
+				if not self.castling & right or (king_square < 8) != (us == BLACK):
+					continue
+				if occupied & between or not pieces[ROOK] >> rook_square & 1 or not pieces[KING] >> king_square & 1:
+					continue
+				if attacks.checkers or attacks.danger & passed:
+					continue
+				append(king_square | to << 6 | CASTLING << 12)
+
+		return moves
+
+	def is_legal(self, move):
+		""" Checks whether a pseudo legal move leaves the own king safe """
+		us = self.turn
+		frm, to, flag = move & 63, move >> 6 & 63, move >> 12 & 3
+		if flag == CASTLING:
+			return True
+		from_bit, to_bit = 1 << frm, 1 << to
+		occupied = ((self.occupied[WHITE] | self.occupied[BLACK]) ^ from_bit) | to_bit
+		captured = to_bit
+		if flag == EN_PASSANT:
+			captured = 1 << (to + (8 if us == WHITE else -8))
+			occupied ^= captured
+		if self.pieces[us][KING] & from_bit:
+			king_square = to
+		else:
+			king_square = self.king_square(us)
+		return not self.attackers_to(king_square, 1 - us, occupied, captured)
+
+	def legal_moves(self, from_mask=FULL):
+		""" All legal moves of the side to move from the squares in from_mask.
+		Uses the attack map: the king may only go to squares the opponent does not attack,
+		other pieces must resolve a check and pinned pieces must stay on their pin line """
+		attacks = self.attacks
+		king = self.pieces[self.turn][KING]
+		if attacks.checkers & (attacks.checkers - 1):
+			# Double check, only the king can move
+			from_mask &= king
+		check_mask = attacks.check_mask()
+		pinned = attacks.pinned
+		danger = attacks.danger
+		king_line = LINE[attacks.king_square] if king else None
+
+		moves = []
+		for move in self.pseudo_legal_moves(from_mask):
+			frm, to = move & 63, move >> 6 & 63
+			if king >> frm & 1:
+				if move >> 12 & 3 == CASTLING or not danger >> to & 1:
+					moves.append(move)
+			elif move >> 12 & 3 == EN_PASSANT:
+				if self.is_legal(move):
+					moves.append(move)
+			elif check_mask >> to & 1 and (not pinned >> frm & 1 or king_line[frm] >> to & 1):
+				moves.append(move)
+		return moves
+
+	def make_move(self, move):
+		""" Plays a legal move and pushes a compact undo entry on the undo stack:
+		move | captured piece << 16 | castling << 20 | en passant file << 24 | halfmove clock << 28 """
+		us = self.turn
+		them = 1 - us
+		frm, to, flag = move & 63, move >> 6 & 63, move >> 12 & 3
+		from_bit, to_bit = 1 << frm, 1 << to
+		own = self.pieces[us]
+		enemy = self.pieces[them]
+		squares = self.squares
+		code = squares[frm]
+		ptype = (code & 7) - 1
+
+		key = self.key
+		own_keys = PIECE_KEYS[us]
+
+		captured = 0
+		if flag == EN_PASSANT:
+			captured_square = to + (8 if us == WHITE else -8)
+			enemy[PAWN] ^= 1 << captured_square
+			self.occupied[them] ^= 1 << captured_square
+			squares[captured_square] = EMPTY
+			key ^= PIECE_KEYS[them][PAWN][captured_square]
+			self.material -= MATERIAL[them][PAWN][captured_square]
+			captured = PAWN + 1
+		elif squares[to]:
+			captured = squares[to] & 7
+			enemy[captured - 1] ^= to_bit
+			self.occupied[them] ^= to_bit
+			key ^= PIECE_KEYS[them][captured - 1][to]
+			self.material -= MATERIAL[them][captured - 1][to]
+
+		ep_file = 0
+		if self.ep_square is not None:
+			ep_file = (self.ep_square & 7) + 1
+			key ^= EP_KEYS[ep_file - 1]
+		undo = move | captured << 16 | self.castling << 20 | ep_file << 24 | self.halfmove_clock << 28
+		if self.ply == len(self._undo):
+			self._undo.append(undo)
+			self._keys.append(self.key)
+		else:
+			self._undo[self.ply] = undo
+			self._keys[self.ply] = self.key
+		self.ply += 1
+
+		move_bits = from_bit | to_bit
+		own[ptype] ^= move_bits
+		self.occupied[us] ^= move_bits
+		squares[frm] = EMPTY
+		squares[to] = code
+		key ^= own_keys[ptype][frm] ^ own_keys[ptype][to]
+		if flag == PROMOTION:
+			promotion = (move >> 14) + KNIGHT
+			own[PAWN] ^= to_bit
+			own[promotion] |= to_bit
+			squares[to] = us << 3 | (promotion + 1)
+			key ^= own_keys[PAWN][to] ^ own_keys[promotion][to]
+			self.material += MATERIAL[us][promotion][to] - MATERIAL[us][PAWN][to]
+		elif flag == CASTLING:
+			rook_from, rook_to = CASTLING_ROOKS[to]
+			rook_bits = (1 << rook_from) | (1 << rook_to)
+			own[ROOK] ^= rook_bits
+			self.occupied[us] ^= rook_bits
+			squares[rook_to] = squares[rook_from]
+			squares[rook_from] = EMPTY
+			key ^= own_keys[ROOK][rook_from] ^ own_keys[ROOK][rook_to]
+
+		castling = self.castling & CASTLING_KEEP[frm] & CASTLING_KEEP[to]
+		key ^= CASTLING_KEYS[self.castling] ^ CASTLING_KEYS[castling]
+		self.castling = castling
+		# The en passant square is only set if an enemy pawn can capture on it
+		self.ep_square = None
+		if ptype == PAWN and (to - frm == 16 or frm - to == 16):
+			ep_square = (frm + to) >> 1
+			if PAWN_ATTACKS[us][ep_square] & enemy[PAWN]:
+				self.ep_square = ep_square
+				key ^= EP_KEYS[ep_square & 7]
+		self.key = key ^ SIDE_KEY
+		if ptype == PAWN or captured:
+			self.halfmove_clock = 0
+		else:
+			self.halfmove_clock += 1
+		if us == BLACK:
+			self.fullmove_number += 1
+		self.turn = them
+		self._attacks = None
+
+	def unmake_move(self):
+		""" Takes back the last move made with make_move and returns it """
+		self.ply -= 1
+		undo = self._undo[self.ply]
+		move = undo & 0xFFFF
+		them = self.turn
+		us = 1 - them
+		frm, to, flag = move & 63, move >> 6 & 63, move >> 12 & 3
+		from_bit, to_bit = 1 << frm, 1 << to
+		own = self.pieces[us]
+		squares = self.squares
+
+		if flag == PROMOTION:
+			promotion = (move >> 14) + KNIGHT
+			own[promotion] ^= to_bit
+			own[PAWN] |= to_bit
+			self.material += MATERIAL[us][PAWN][to] - MATERIAL[us][promotion][to]
+			ptype = PAWN
+		else:
+			ptype = (squares[to] & 7) - 1
+			if flag == CASTLING:
+				rook_from, rook_to = CASTLING_ROOKS[to]
+				rook_bits = (1 << rook_from) | (1 << rook_to)
+				own[ROOK] ^= rook_bits
+				self.occupied[us] ^= rook_bits
+				squares[rook_from] = squares[rook_to]
+				squares[rook_to] = EMPTY
+		move_bits = from_bit | to_bit
+		own[ptype] ^= move_bits
+		self.occupied[us] ^= move_bits
+		squares[frm] = us << 3 | (ptype + 1)
+		squares[to] = EMPTY
+
+		captured = undo >> 16 & 15
+		if captured:
+			captured_square = to
+			if flag == EN_PASSANT:
+				captured_square = to + (8 if us == WHITE else -8)
+			self.pieces[them][captured - 1] |= 1 << captured_square
+			self.occupied[them] |= 1 << captured_square
+			squares[captured_square] = them << 3 | captured
+			self.material += MATERIAL[them][captured - 1][captured_square]
+
+		self.castling = undo >> 20 & 15
+		ep_file = undo >> 24 & 15
+		self.ep_square = (16 if us == WHITE else 40) + ep_file - 1 if ep_file else None
+		self.halfmove_clock = undo >> 28
+		self.key = self._keys[self.ply]
+		if us == BLACK:
+			self.fullmove_number -= 1
+		self.turn = us
+		self._attacks = None
+		return move
@@ -0,0 +1,196 @@
+""" Opening book: moves played from the positions of a PGN corpus, in a sorted binary file
+
+	python -m chesscore.book compile games.pgn [more.pgn ...] book.bin [--plies 24] [--min-games 2]
+	python -m chesscore.book probe book.bin [--fen "<FEN>"]
+
+A book file is the header (magic, entry count u64) followed by 16 byte entries laid out like
+the entries of a Polyglot book: Zobrist key (u64), move (u16, the move encoding of the
+position), weight (u16) and the number of games the move was played in (u32), little endian.
+Keys are the Zobrist keys of chesscore, so the files are not interchangeable with Polyglot
+books. The entries are sorted by key, and by decreasing weight for the same key, so the moves
+of a position are found by a binary search over the mapped file: O(log n) reads of 8 bytes,
+without reading or parsing the file when it is opened.
+
+A move scores 2 for every game won by the side that played it and 1 for every draw, like the
+weights of Polyglot; weights of a position are scaled down together if they exceed 65535.
+"""
+
+import argparse
+import bisect
+import mmap
+import os
+import random
+import struct
+import sys
+import time
+
+from chesscore.bitboard import Position, START_FEN, move_uci
+from chesscore.pgn import read_games
+
+
+MAGIC = b"CHESSBK\x01"
+HEADER = struct.Struct("<8sQ")
+ENTRY = struct.Struct("<QHHI")
+MAX_WEIGHT = 0xFFFF
+
+# Moves recorded per game by default (12 moves of each side)
+DEFAULT_PLIES = 24
+
+# Points of the moves of white and black by PGN result
+POINTS = {"1-0": (2, 0), "0-1": (0, 2), "1/2-1/2": (1, 1)}
+
+
+class BookKeys:
+	""" Sequence view of the keys of the entries of a book, for bisect """
+	def __init__(self, data, count):
+		self.data = data
+		self.count = count
+
+	def __len__(self):
+		return self.count
+
+	def __getitem__(self, index):
+		return ENTRY.unpack_from(self.data, HEADER.size + index * ENTRY.size)[0]
+
+
+class OpeningBook:
+	""" Read-only opening book file (see the module docstring) """
+	def __init__(self, path):
+		self.path = path
+		with open(path, "rb") as file:
+			header = file.read(HEADER.size)
+			if len(header) != HEADER.size or header[:len(MAGIC)] != MAGIC:
+				raise ValueError(f"not an opening book: {path}")
+			self.count = HEADER.unpack(header)[1]
+			if os.fstat(file.fileno()).st_size != HEADER.size + self.count * ENTRY.size:
+				raise ValueError(f"truncated opening book: {path}")
+			self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+		self.keys = BookKeys(self.map, self.count)
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		self.close()
+
+	def close(self):
+		self.map.close()
+
+	def __len__(self):
+		return self.count
+
+	def entries(self, position):
+		""" (move, weight, games) of the book moves of a Position, by decreasing weight. Moves
+		that are not legal in the position (a key collision) are left out """
+		found = []
+		key = position.key
+		i = bisect.bisect_left(self.keys, key)
+		while i < self.count:
+			entry_key, move, weight, games = ENTRY.unpack_from(self.map, HEADER.size + i * ENTRY.size)
+			if entry_key != key:
+				break
+			found.append((move, weight, games))
+			i += 1
+		if found:
+			legal = set(position.legal_moves())
+			found = [entry for entry in found if entry[0] in legal]
+		return found
+
+	def choose(self, position, rng=random):
+		""" A book move picked at random with the probabilities of the weights, or None """
+		entries = [(move, weight) for move, weight, games in self.entries(position) if weight]
+		if not entries:
+			return None
+		moves, weights = zip(*entries)
+		return rng.choices(moves, weights)[0]
+
+	def best_move(self, position):
+		""" The book move with the highest weight, or None """
+		entries = self.entries(position)
+		return entries[0][0] if entries and entries[0][1] else None
+
+
+def collect(games, plies=DEFAULT_PLIES):
+	""" {key: {move: [points, games]}} of the first plies moves of the games (PgnGame). Games
+		with an error keep the moves before it; those without any (a bad FEN tag) are skipped """
+	moves = {}
+	for game in games:
+		if not game.moves:
+			continue
+		points = POINTS.get(game.result, (0, 0))
+		position = Position.from_fen(game.start_fen)
+		for move in game.moves[:plies]:
+			stats = moves.setdefault(position.key, {}).setdefault(move, [0, 0])
+			stats[0] += points[position.turn]
+			stats[1] += 1
+			position.make_move(move)
+	return moves
+
+
+def write_book(moves, path, min_games=1):
+	""" Writes the moves returned by collect played in at least min_games games as a book;
+	returns the number of entries """
+	entries = []
+	for key, stats in moves.items():
+		stats = [(move, points, games) for move, (points, games) in stats.items() if games >= min_games]
+		if not stats:
+			continue
+		top = max(points for move, points, games in stats)
+		scale = MAX_WEIGHT / top if top > MAX_WEIGHT else 1
+		for move, points, games in stats:
+			entries.append((key, -int(points * scale), move, min(games, 0xFFFFFFFF)))
+	entries.sort()
+	temporary = path + ".tmp"
+	with open(temporary, "wb") as file:
+		file.write(HEADER.pack(MAGIC, len(entries)))
+		for key, weight, move, games in entries:
+			file.write(ENTRY.pack(key, move, -weight, games))
+	os.replace(temporary, path)
+	return len(entries)
+
+
+def compile_book(pgn_paths, path, plies=DEFAULT_PLIES, min_games=1):
+	""" Compiles the games of PGN files into a book; returns (games, entries) """
+	games = 0
+	def read():
+		nonlocal games
+		for pgn_path in pgn_paths:
+			with open(pgn_path, encoding="utf-8", errors="replace") as file:
+				for game in read_games(file):
+					games += 1
+					yield game
+	entries = write_book(collect(read(), plies), path, min_games)
+	return games, entries
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description="Opening book")
+	commands = parser.add_subparsers(dest="command", required=True)
+	command = commands.add_parser("compile", help="build a book from PGN files")
+	command.add_argument("pgn", nargs="+")
+	command.add_argument("book")
+	command.add_argument("--plies", type=int, default=DEFAULT_PLIES, help="moves per game recorded (plies)")
+	command.add_argument("--min-games", type=int, default=1, help="leave out moves played in fewer games")
+	command = commands.add_parser("probe", help="list the book moves of a position")
+	command.add_argument("book")
+	command.add_argument("--fen", default=START_FEN)
+	args = parser.parse_args(argv)
+
+	start = time.perf_counter()
+	if args.command == "compile":
+		games, entries = compile_book(args.pgn, args.book, args.plies, args.min_games)
+		print(f"{games} games compiled into {entries} entries in {time.perf_counter() - start:.2f} s")
+	else:
+		position = Position.from_fen(args.fen)
+		with OpeningBook(args.book) as book:
+			entries = book.entries(position)
+			seconds = time.perf_counter() - start
+			total = sum(weight for move, weight, games in entries) or 1
+			for move, weight, games in entries:
+				print(f"{move_uci(move):6} weight {weight:5} ({100 * weight / total:4.1f}%)  {games} games")
+			print(f"{len(entries)} moves out of {len(book)} entries in {1000 * seconds:.2f} ms")
+	return 0
+
+
+if __name__ == "__main__":
+	sys.exit(main())
@@ -0,0 +1,190 @@
+""" Chess clocks, time controls and a timer heap for running many clocks
+
+A clock is only a pair of remaining times and the time the running side started thinking;
+it never ticks by itself. Whoever drives it asks when the next interesting moment is (the
+displayed second of the running side changes or its flag falls) and sleeps until then.
+"""
+
+import heapq
+import itertools
+import math
+import time
+
+from chesscore.constants import WHITE, BLACK, COLOR_NAMES
+
+
+FISCHER, BRONSTEIN, SUDDEN_DEATH = "fischer", "bronstein", "sudden-death"
+MODES = (FISCHER, BRONSTEIN, SUDDEN_DEATH)
+
+
+class TimeControl:
+	""" Initial time and increment in seconds. Fischer adds the increment after every move,
+	Bronstein gives back the time used for the move up to the increment (a delay), sudden death
+	has no increment """
+	__slots__ = ("initial", "increment", "mode")
+
+	def __init__(self, initial, increment=0, mode=FISCHER):
+		if mode not in MODES:
+			raise ValueError(f"unknown time control mode {mode!r}")
+		if initial <= 0 or increment < 0:
+			raise ValueError("the initial time must be positive and the increment not negative")
+		self.initial = initial
+		self.increment = 0 if mode == SUDDEN_DEATH else increment
+		self.mode = mode
+
+	@classmethod
+	def parse(cls, text, mode=FISCHER):
+		""" Parses 'minutes+increment seconds' like '5+3' or '10' """
+		minutes, _, increment = text.partition("+")
+		try:
+			return cls(float(minutes) * 60, float(increment or 0), mode if increment else SUDDEN_DEATH)
+		except ValueError:
+			raise ValueError(f"invalid time control {text!r} (expected minutes+increment like 5+3)") from None
+
+	def __str__(self):
+		minutes = f"{self.initial / 60:g}"
+		return f"{minutes}+{self.increment:g} {self.mode}" if self.increment else f"{minutes} {self.mode}"
+
+
+class ChessClock:
+	""" The clocks of both players. Times are taken from a monotonic clock (time.monotonic
+	unless another function is given) and can also be passed explicitly """
+	__slots__ = ("control", "remaining", "running", "started", "clock")
+
+	def __init__(self, control, clock=time.monotonic):
+		self.control = control
+		self.remaining = [float(control.initial), float(control.initial)]
+		self.running = None
+		self.started = None
+		self.clock = clock
+
+	def start(self, color=WHITE, now=None):
+		""" Starts the clock of the given color """
+		self.running = color
+		self.started = self.clock() if now is None else now
+
+	def stop(self, now=None):
+		""" Stops the running clock, keeping the time used """
+		if self.running is not None:
+			now = self.clock() if now is None else now
+			self.remaining[self.running] -= now - self.started
+			self.running = None
+
+	def press(self, now=None):
+		""" Ends the move of the running side: applies the increment and starts the clock of
+		the opponent. Returns the time the move took (0 while the clock is stopped) """
+		color = self.running
+		if color is None:
+			return 0.0
+		now = self.clock() if now is None else now
+		used = now - self.started
+		self.remaining[color] -= used
+		if self.remaining[color] > 0:
+			if self.control.mode == FISCHER:
+				self.remaining[color] += self.control.increment
+			elif self.control.mode == BRONSTEIN:
+				self.remaining[color] += min(used, self.control.increment)
+		self.start(1 - color, now)
+		return used
+
+	def time_left(self, color, now=None):
+		""" Remaining seconds of a player (negative once the flag fell) """
+		if color != self.running:
+			return self.remaining[color]
+		now = self.clock() if now is None else now
+		return self.remaining[color] - (now - self.started)
+
+	def flagged(self, now=None):
+		""" The color whose flag fell, or None """
+		if self.running is not None and self.time_left(self.running, now) <= 0:
+			return self.running
+		return None
+
+	def flag_time(self):
+		""" Monotonic time at which the flag of the running side falls, or None """
+		if self.running is None:
+			return None
+		return self.started + self.remaining[self.running]
+
+	def next_wakeup(self, now=None):
+		""" Monotonic time of the next change of the displayed seconds of the running side,
+		which is also when its flag falls at the end, or None if the clock is stopped """
+		if self.running is None:
+			return None
+		now = self.clock() if now is None else now
+		left = self.time_left(self.running, now)
+		if left <= 0:
+			return now
+		# The display shows whole seconds rounded up, so it changes when left crosses an integer
+		return now + (left - (math.ceil(left) - 1))
+
+	def move_budget(self, color, moves_to_go=30, now=None):
+		""" Time a player can spend on the next move: an even share of the remaining time over
+		moves_to_go moves plus most of the increment, never more than half the remaining time """
+		left = max(0.0, self.time_left(color, now))
+		return min(left / 2, left / moves_to_go + 0.8 * self.control.increment)
+
+	def display(self, color, now=None):
+		""" Remaining time of a player as 'm:ss' (or 'h:mm:ss') """
+		seconds = max(0, math.ceil(self.time_left(color, now)))
+		hours, seconds = divmod(seconds, 3600)
+		minutes, seconds = divmod(seconds, 60)
+		return f"{hours}:{minutes:02}:{seconds:02}" if hours else f"{minutes}:{seconds:02}"
+
+	def state(self, now=None):
+		""" Remaining seconds of white and black and the running color, for sending over the network """
+		return {
+			"white": round(self.time_left(WHITE, now), 3),
+			"black": round(self.time_left(BLACK, now), 3),
+			"running": COLOR_NAMES[self.running] if self.running is not None else None,
+		}
+
+	def set_state(self, state, now=None):
+		""" Sets the clock from the dictionary returned by state (the clock of a game server) """
+		self.remaining = [float(state["white"]), float(state["black"])]
+		self.running = None
+		if state["running"]:
+			self.start(COLOR_NAMES.index(state["running"]), now)
+
+
+class TimerHeap:
+	""" Deadlines of any number of timers on one heap. Cancelled timers stay on the heap and
+	are skipped when they come up, so scheduling and cancelling are O(log n) and O(1) """
+	def __init__(self):
+		self.heap = []
+		self.counter = itertools.count()
+		# Handles of the timers that are neither cancelled nor run yet
+		self.live = set()
+
+	def __len__(self):
+		return len(self.live)
+
+	def schedule(self, deadline, callback, *args):
+		""" Calls callback(*args) once the deadline passed; returns a handle for cancel """
+		handle = next(self.counter)
+		heapq.heappush(self.heap, (deadline, handle, callback, args))
+		self.live.add(handle)
+		return handle
+
+	def cancel(self, handle):
+		self.live.discard(handle)
+
+	def next_deadline(self):
+		""" Deadline of the first timer that was not cancelled, or None """
+		heap = self.heap
+		while heap and heap[0][1] not in self.live:
+			heapq.heappop(heap)
+		return heap[0][0] if heap else None
+
+	def run(self, now):
+		""" Calls the callbacks of all timers whose deadline passed; returns how many ran """
+		ran = 0
+		heap = self.heap
+		while heap and heap[0][0] <= now:
+			deadline, handle, callback, args = heapq.heappop(heap)
+			if handle not in self.live:
+				continue
+			self.live.remove(handle)
+			callback(*args)
+			ran += 1
+		return ran
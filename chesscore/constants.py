@@ -0,0 +1,18 @@
+""" Colors, piece types, move flags and castling rights shared by the rules modules """
+
+WHITE, BLACK = 0, 1
+COLOR_NAMES = ("white", "black")
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = range(6)
+PIECE_NAMES = ("pawn", "knight", "bishop", "rook", "queen", "king")
+
+# Move flags
+NORMAL, PROMOTION, EN_PASSANT, CASTLING = range(4)
+
+# Castling rights
+WHITE_KINGSIDE, WHITE_QUEENSIDE, BLACK_KINGSIDE, BLACK_QUEENSIDE = 1, 2, 4, 8
+
+# Endgame tablebase results, from the view of the side to move
+WIN, DRAW, LOSS = 1, 0, -1
+
+FULL = (1 << 64) - 1
+ROW_MASKS = [0xFF << (8 * row) for row in range(8)]
@@ -0,0 +1,119 @@
+""" Static evaluation of positions for the search: material plus piece-square tables """
+
+from chesscore.constants import WHITE, KNIGHT, BISHOP, ROOK, QUEEN, KING
+
+
+# Centipawn values of the piece types
+PIECE_VALUES = (100, 320, 330, 500, 900, 0)
+
+# Piece-square bonuses from the view of white, a8 first (the square numbering of the position).
+# Black uses the same tables mirrored vertically (square ^ 56)
+PAWN_TABLE = (
+	0,   0,   0,   0,   0,   0,   0,   0,
+	50,  50,  50,  50,  50,  50,  50,  50,
+	10,  10,  20,  30,  30,  20,  10,  10,
+	5,   5,  10,  25,  25,  10,   5,   5,
+	0,   0,   0,  20,  20,   0,   0,   0,
+	5,  -5, -10,   0,   0, -10,  -5,   5,
+	5,  10,  10, -20, -20,  10,  10,   5,
+	0,   0,   0,   0,   0,   0,   0,   0,
+)
+KNIGHT_TABLE = (
+	-50, -40, -30, -30, -30, -30, -40, -50,
+	-40, -20,   0,   0,   0,   0, -20, -40,
+	-30,   0,  10,  15,  15,  10,   0, -30,
+	-30,   5,  15,  20,  20,  15,   5, -30,
+	-30,   0,  15,  20,  20,  15,   0, -30,
+	-30,   5,  10,  15,  15,  10,   5, -30,
+	-40, -20,   0,   5,   5,   0, -20, -40,
+	-50, -40, -30, -30, -30, -30, -40, -50,
+)
+BISHOP_TABLE = (
+	-20, -10, -10, -10, -10, -10, -10, -20,
+	-10,   0,   0,   0,   0,   0,   0, -10,
+	-10,   0,   5,  10,  10,   5,   0, -10,
+	-10,   5,   5,  10,  10,   5,   5, -10,
+	-10,   0,  10,  10,  10,  10,   0, -10,
+	-10,  10,  10,  10,  10,  10,  10, -10,
+	-10,   5,   0,   0,   0,   0,   5, -10,
+	-20, -10, -10, -10, -10, -10, -10, -20,
+)
+ROOK_TABLE = (
+	0,   0,   0,   0,   0,   0,   0,   0,
+	5,  10,  10,  10,  10,  10,  10,   5,
+	-5,   0,   0,   0,   0,   0,   0,  -5,
+	-5,   0,   0,   0,   0,   0,   0,  -5,
+	-5,   0,   0,   0,   0,   0,   0,  -5,
+	-5,   0,   0,   0,   0,   0,   0,  -5,
+	-5,   0,   0,   0,   0,   0,   0,  -5,
+	0,   0,   0,   5,   5,   0,   0,   0,
+)
+QUEEN_TABLE = (
+	-20, -10, -10,  -5,  -5, -10, -10, -20,
+	-10,   0,   0,   0,   0,   0,   0, -10,
+	-10,   0,   5,   5,   5,   5,   0, -10,
+	-5,   0,   5,   5,   5,   5,   0,  -5,
+	0,   0,   5,   5,   5,   5,   0,  -5,
+	-10,   5,   5,   5,   5,   5,   0, -10,
+	-10,   0,   5,   0,   0,   0,   0, -10,
+	-20, -10, -10,  -5,  -5, -10, -10, -20,
+)
+KING_TABLE = (
+	-30, -40, -40, -50, -50, -40, -40, -30,
+	-30, -40, -40, -50, -50, -40, -40, -30,
+	-30, -40, -40, -50, -50, -40, -40, -30,
+	-30, -40, -40, -50, -50, -40, -40, -30,
+	-20, -30, -30, -40, -40, -30, -30, -20,
+	-10, -20, -20, -20, -20, -20, -20, -10,
+	20,  20,   0,   0,   0,   0,  20,  20,
+	20,  30,  10,   0,   0,  10,  30,  20,
+)
+# Kings belong in the center once the queens are gone
+KING_ENDGAME_TABLE = (
+	-50, -40, -30, -20, -20, -30, -40, -50,
+	-30, -20, -10,   0,   0, -10, -20, -30,
+	-30, -10,  20,  30,  30,  20, -10, -30,
+	-30, -10,  30,  40,  40,  30, -10, -30,
+	-30, -10,  30,  40,  40,  30, -10, -30,
+	-30, -10,  20,  30,  30,  20, -10, -30,
+	-30, -30,   0,   0,   0,   0, -30, -30,
+	-50, -30, -30, -30, -30, -30, -30, -50,
+)
+
+PIECE_TABLES = (PAWN_TABLE, KNIGHT_TABLE, BISHOP_TABLE, ROOK_TABLE, QUEEN_TABLE, KING_TABLE)
+
+# SQUARE_VALUES[color][piece type][square]: piece value plus square bonus, negative for black
+SQUARE_VALUES = [
+	[[PIECE_VALUES[ptype] + PIECE_TABLES[ptype][sq] for sq in range(64)] for ptype in range(6)],
+	[[-PIECE_VALUES[ptype] - PIECE_TABLES[ptype][sq ^ 56] for sq in range(64)] for ptype in range(6)],
+]
+KING_ENDGAME_VALUES = [
+	[KING_ENDGAME_TABLE[sq] for sq in range(64)],
+	[-KING_ENDGAME_TABLE[sq ^ 56] for sq in range(64)],
+]
+
+
+def is_endgame(position):
+	""" No queens left, or only queens with at most one minor piece each """
+	white, black = position.pieces
+	if not white[QUEEN] and not black[QUEEN]:
+		return True
+	for pieces in position.pieces:
+		minors = pieces[KNIGHT] | pieces[BISHOP]
+		if pieces[QUEEN] and (pieces[ROOK] or minors & (minors - 1)):
+			return False
+	return True
+
+
+def evaluate(position):
+	""" Score of the position in centipawns from the view of the side to move """
+	score = 0
+	endgame = is_endgame(position)
+	for color, pieces in enumerate(position.pieces):
+		for ptype, bitboard in enumerate(pieces):
+			values = KING_ENDGAME_VALUES[color] if ptype == KING and endgame else SQUARE_VALUES[color][ptype]
+			while bitboard:
+				lsb = bitboard & -bitboard
+				score += values[lsb.bit_length() - 1]
+				bitboard ^= lsb
+	return score if position.turn == WHITE else -score
@@ -0,0 +1,101 @@
+""" A game of chess without any user interface """
+
+from chesscore.bitboard import Position, START_FEN, move_flag, parse_square
+from chesscore.constants import COLOR_NAMES, PIECE_NAMES, PROMOTION, KNIGHT
+from chesscore.notation import FILES, RANKS
+from chesscore.gamestate import GameState, flag_result
+from chesscore.pieces import King, PIECE_CLASSES
+
+
+class Game:
+	""" The rules side of a game: the position, the board of Piece objects built from it,
+	the moves played and the state of the game after the last move. Without with_board
+	no Piece objects are built, which is all a server validating moves needs. The game
+	starts from the given FEN or the standard starting position. With a Tablebase, endgames
+	in its tables end as soon as they are reached (see GameState) """
+	def __init__(self, with_board=True, fen=None, tablebase=None):
+		self.with_board = with_board
+		self.start_fen = fen or START_FEN
+		self.tablebase = tablebase
+		# Parsed once; every game played from it starts with a copy
+		self.start_position = Position.from_fen(fen) if fen else Position.start()
+		self.board = None
+		self.reset()
+
+	def reset(self):
+		""" Starts the game over from its start position, without parsing it again """
+		self.position = self.start_position.copy()
+		self.state = GameState(self.position, tablebase=self.tablebase)
+		self.player_turn = COLOR_NAMES[self.position.turn]
+		self.moves = []
+		# Color of the player who lost on time (or drew, see flag_result)
+		self.timed_out = None
+		# Color of the player who left a network game
+		self.abandoned = None
+		self.sync_board()
+
+	@property
+	def result(self):
+		""" Winner ("white" / "black"), kind of draw or None while the game goes on """
+		return self.state.result
+
+	def fen(self):
+		""" The current position in Forsyth-Edwards Notation """
+		return self.position.fen()
+
+	def find_move(self, from_position, to_position, promotion=None):
+		""" Returns the legal move of the player in turn from one (row, col) to another, or None.
+		promotion is the name of the piece a pawn is promoted to (the first one if not given) """
+		from_square = from_position[0]*8 + from_position[1]
+		to_square = to_position[0]*8 + to_position[1]
+		return self.state.find(from_square, to_square, PIECE_NAMES.index(promotion) if promotion else None)
+
+	def find_uci(self, text):
+		""" Returns the legal move written in UCI notation like 'e2e4' or 'e7e8q', or None """
+		if len(text) not in (4, 5) or text[0] not in FILES or text[2] not in FILES or \
+				text[1] not in RANKS or text[3] not in RANKS:
+			return None
+		promotion = None
+		if len(text) == 5:
+			promotion = "nbrq".find(text[4]) + KNIGHT
+			if promotion < KNIGHT:
+				return None
+		move = self.state.find(parse_square(text[:2]), parse_square(text[2:4]), promotion)
+		if move is not None and move_flag(move) == PROMOTION and promotion is None:
+			return None
+		return move
+
+	def make_move(self, move):
+		""" Plays a legal move on the position, rebuilds the board from it and evaluates the
+		new position once (legal moves of the player in turn and result) """
+		self.position.make_move(move)
+		self.moves.append(move)
+		self.player_turn = COLOR_NAMES[self.position.turn]
+		self.sync_board()
+		self.state = GameState(self.position, tablebase=self.tablebase)
+
+	def sync_board(self):
+		""" Rebuilds the board of Piece objects from the mailbox of the position """
+		if not self.with_board:
+			return
+		self.board = [[None for i in range(8)] for j in range(8)]
+		for square, code in enumerate(self.position.squares):
+			if code:
+				row, col = divmod(square, 8)
+				piece = PIECE_CLASSES[(code & 7) - 1]((row, col), COLOR_NAMES[code >> 3])
+				self.board[row][col] = piece
+				if type(piece) == King:
+					if piece.color == "white":
+						self.white_king = piece
+					else:
+						self.black_king = piece
+
+	def time_out(self, color):
+		""" Ends the game because the flag of the player of the given color fell """
+		self.state.result = flag_result(self.position, COLOR_NAMES.index(color))
+		self.timed_out = color
+
+	def abandon(self, color):
+		""" Ends the game because the player of the given color left it (decided by the server) """
+		self.state.result = "black" if color == "white" else "white"
+		self.abandoned = color
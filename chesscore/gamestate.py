@@ -0,0 +1,108 @@
+""" Evaluation of the state of a game after every move """
+
+from chesscore.constants import COLOR_NAMES, KNIGHT, PROMOTION, WIN, DRAW
+from chesscore.material import is_dead, has_pieces
+
+
+# Results of a game, named like the results shown by the front-end
+DRAW_RESULTS = ("stalemate", "50-move", "normal-draw", "threefold", "fivefold", "timeout-draw", "tablebase-draw")
+
+
+def insufficient_material(position):
+	""" Checks whether neither player can checkmate (a dead position): only kings and knights
+	or bishops are left, and either there is at most one minor piece or all of them are
+	bishops on squares of the same color. Decided from the material signature in O(1) """
+	return is_dead(position.material)
+
+
+def can_checkmate(position, color):
+	""" Checks whether the player of the given color could still checkmate with some series
+	of legal moves: not with a bare king, nor when neither player can checkmate """
+	return has_pieces(position.material, color) and not is_dead(position.material)
+
+
+def flag_result(position, color):
+	""" Result of the game when the flag of the given color falls: a win for the opponent,
+	or a draw if the opponent cannot checkmate """
+	if can_checkmate(position, 1 - color):
+		return COLOR_NAMES[1 - color]
+	return "timeout-draw"
+
+
+class GameState:
+	""" Generates the legal moves of the side to move exactly once after a move and decides
+	from them whether the game is over. The moves are kept for selection and highlighting,
+	grouped by origin and target square, so the state of a position (identified by its key)
+	is also its legal move cache. Threefold repetition ends the game automatically unless
+	auto_threefold is False, fivefold repetition always does. With a Tablebase, positions
+	found in its tables are adjudicated right away (and adjudicated is set) """
+	def __init__(self, position, auto_threefold=True, tablebase=None):
+		self.position = position
+		self.key = position.key
+		self.auto_threefold = auto_threefold
+		self.tablebase = tablebase
+		self.adjudicated = False
+		self.moves = position.legal_moves()
+		self.in_check = position.in_check()
+		self._targets = None
+		self.result = self.evaluate()
+
+	def evaluate(self):
+		""" Returns the winner ("white" / "black"), the kind of draw or None if the game goes on """
+		position = self.position
+		if not self.moves:
+			if self.in_check:
+				return COLOR_NAMES[1 - position.turn]
+			return "stalemate"
+		if insufficient_material(position):
+			return "normal-draw"
+		if position.halfmove_clock >= 100:
+			return "50-move"
+		if position.halfmove_clock >= 4:
+			repetitions = position.repetition_count()
+			if repetitions >= 5:
+				return "fivefold"
+			if repetitions >= 3 and self.auto_threefold:
+				return "threefold"
+		if self.tablebase is not None:
+			found = self.tablebase.probe(position)
+			if found is not None:
+				self.adjudicated = True
+				if found[0] == DRAW:
+					return "tablebase-draw"
+				return COLOR_NAMES[position.turn if found[0] == WIN else 1 - position.turn]
+		return None
+
+	@property
+	def is_over(self):
+		return self.result is not None
+
+	@property
+	def is_draw(self):
+		return self.result in DRAW_RESULTS
+
+	def targets(self, square):
+		""" Legal moves of the piece on the square as {target square: [moves]} (several moves
+		only for the promotions). Built from the move list on first use """
+		if self._targets is None:
+			self._targets = {}
+			for move in self.moves:
+				self._targets.setdefault(move & 63, {}).setdefault(move >> 6 & 63, []).append(move)
+		return self._targets.get(square, {})
+
+	def moves_from(self, square):
+		""" Legal moves of the piece on the square """
+		return [move for moves in self.targets(square).values() for move in moves]
+
+	def find(self, from_square, to_square, promotion=None):
+		""" The legal move between two squares (promoting to the piece type promotion,
+		the first promotion if None) or None, found by two dictionary lookups """
+		moves = self.targets(from_square).get(to_square)
+		if not moves:
+			return None
+		if promotion is None:
+			return moves[0]
+		for move in moves:
+			if move >> 12 & 3 == PROMOTION and (move >> 14) + KNIGHT == promotion:
+				return move
+		return None
@@ -0,0 +1,77 @@
+""" Material signatures: the piece counts of a position packed into one integer
+
+A signature has 4 bits per color and slot: slots 0 to 5 count the pieces of each type,
+slot 6 the bishops on light squares and slot 7 the bishops on dark squares. The position
+adds or subtracts MATERIAL[color][piece type][square] whenever a piece appears or
+disappears (captures and promotions), so the signature is always up to date and
+questions about the material are answered with a few shifts and masks.
+"""
+
+from chesscore.constants import WHITE, BLACK, PAWN, KNIGHT, BISHOP, ROOK, QUEEN
+
+
+LIGHT_BISHOPS, DARK_BISHOPS = 6, 7
+
+# Squares of the same color as a8
+LIGHT_SQUARES = sum(1 << sq for sq in range(64) if (sq >> 3) + (sq & 7) & 1 == 0)
+
+
+def shift(color, slot):
+	return (color * 8 + slot) * 4
+
+
+def _unit(color, ptype, square):
+	unit = 1 << shift(color, ptype)
+	if ptype == BISHOP:
+		light = LIGHT_SQUARES >> square & 1
+		unit += 1 << shift(color, LIGHT_BISHOPS if light else DARK_BISHOPS)
+	return unit
+
+# MATERIAL[color][piece type][square]
+MATERIAL = [[[_unit(color, ptype, square) for square in range(64)] for ptype in range(6)] for color in (WHITE, BLACK)]
+
+# Pawns, rooks and queens of both colors: with any of them left a checkmate is possible
+MATING_MATERIAL = sum(15 << shift(color, ptype) for color in (WHITE, BLACK) for ptype in (PAWN, ROOK, QUEEN))
+# All pieces of a color but the king
+NON_KING = [sum(15 << shift(color, ptype) for ptype in (PAWN, KNIGHT, BISHOP, ROOK, QUEEN)) for color in (WHITE, BLACK)]
+
+W_KNIGHTS, B_KNIGHTS = shift(WHITE, KNIGHT), shift(BLACK, KNIGHT)
+W_LIGHT, B_LIGHT = shift(WHITE, LIGHT_BISHOPS), shift(BLACK, LIGHT_BISHOPS)
+W_DARK, B_DARK = shift(WHITE, DARK_BISHOPS), shift(BLACK, DARK_BISHOPS)
+
+
+def count(material, color, slot):
+	""" Number of pieces of a type (or bishops on light / dark squares) in a signature """
+	return material >> shift(color, slot) & 15
+
+
+def signature(position):
+	""" Computes the material signature of a position from scratch """
+	material = 0
+	for color, pieces in enumerate(position.pieces):
+		for ptype, bitboard in enumerate(pieces):
+			units = MATERIAL[color][ptype]
+			while bitboard:
+				lsb = bitboard & -bitboard
+				material += units[lsb.bit_length() - 1]
+				bitboard ^= lsb
+	return material
+
+
+def is_dead(material):
+	""" Checks whether neither player can checkmate with the material of a signature: only
+	kings and knights or bishops are left, and either there is at most one minor piece or
+	all of them are bishops on squares of the same color """
+	if material & MATING_MATERIAL:
+		return False
+	knights = (material >> W_KNIGHTS & 15) + (material >> B_KNIGHTS & 15)
+	light = (material >> W_LIGHT & 15) + (material >> B_LIGHT & 15)
+	dark = (material >> W_DARK & 15) + (material >> B_DARK & 15)
+	if knights + light + dark <= 1:
+		return True
+	return not knights and (not light or not dark)
+
+
+def has_pieces(material, color):
+	""" Checks whether a player has anything but the king """
+	return bool(material & NON_KING[color])
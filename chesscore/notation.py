@@ -0,0 +1,112 @@
+""" Standard Algebraic Notation (SAN) of moves, like 'Nf3', 'exd5', 'O-O' or 'e8=Q+' """
+
+from chesscore.bitboard import square_name, parse_square
+from chesscore.constants import PAWN, KNIGHT, QUEEN, PROMOTION, EN_PASSANT, CASTLING
+
+
+SAN_PIECES = "PNBRQK"
+FILES = "abcdefgh"
+RANKS = "87654321"
+
+
+def move_san(position, move, moves=None):
+	""" SAN of a legal move of the side to move. moves are the legal moves of the position,
+	generated if not given """
+	frm, to, flag = move & 63, move >> 6 & 63, move >> 12 & 3
+	if flag == CASTLING:
+		san = "O-O" if to & 7 == 6 else "O-O-O"
+	else:
+		ptype = (position.squares[frm] & 7) - 1
+		capture = position.squares[to] or flag == EN_PASSANT
+		if ptype == PAWN:
+			san = FILES[frm & 7] + "x" if capture else ""
+			san += square_name(to)
+			if flag == PROMOTION:
+				san += "=" + SAN_PIECES[(move >> 14) + KNIGHT]
+		else:
+			if moves is None:
+				moves = position.legal_moves()
+			# Other pieces of the same type that can move to the same square
+			others = [other & 63 for other in moves if other >> 6 & 63 == to and other != move
+				and position.squares[other & 63] == position.squares[frm]]
+			san = SAN_PIECES[ptype]
+			if others:
+				if all(other & 7 != frm & 7 for other in others):
+					san += FILES[frm & 7]
+				elif all(other >> 3 != frm >> 3 for other in others):
+					san += RANKS[frm >> 3]
+				else:
+					san += square_name(frm)
+			san += ("x" if capture else "") + square_name(to)
+
+	position.make_move(move)
+	if position.in_check():
+		san += "#" if not position.legal_moves() else "+"
+	position.unmake_move()
+	return san
+
+
+def parse_san(position, text, moves=None):
+	""" Returns the legal move of the side to move written in SAN. Check and annotation
+	suffixes are ignored. Raises ValueError if the text is not exactly one legal move """
+	san = text.rstrip("+#!?")
+	if moves is None:
+		moves = position.legal_moves()
+
+	if san in ("O-O", "0-0", "O-O-O", "0-0-0"):
+		target_col = 6 if len(san) == 3 else 2
+		for move in moves:
+			if move >> 12 & 3 == CASTLING and move >> 6 & 7 == target_col:
+				return move
+		raise ValueError(f"illegal move {text!r}")
+
+	promotion = None
+	if "=" in san:
+		san, char = san.split("=", 1)
+		promotion = SAN_PIECES.find(char.upper())
+		if promotion < KNIGHT or promotion > QUEEN:
+			raise ValueError(f"invalid move {text!r}")
+	elif len(san) > 2 and san[-1] in "NBRQ" and san[-2] in RANKS:
+		# Promotions written without '=' like 'e8Q'
+		promotion = SAN_PIECES.index(san[-1])
+		san = san[:-1]
+
+	ptype = PAWN
+	if san and san[0] in SAN_PIECES[1:]:
+		ptype = SAN_PIECES.index(san[0])
+		san = san[1:]
+	san = san.replace("x", "").replace("-", "")
+	if len(san) < 2 or san[-2] not in FILES or san[-1] not in RANKS:
+		raise ValueError(f"invalid move {text!r}")
+	to = parse_square(san[-2:])
+	hint = san[:-2]
+	from_col = from_row = None
+	for char in hint:
+		if char in FILES:
+			from_col = FILES.index(char)
+		elif char in RANKS:
+			from_row = RANKS.index(char)
+		else:
+			raise ValueError(f"invalid move {text!r}")
+
+	squares = position.squares
+	found = None
+	for move in moves:
+		if move >> 6 & 63 != to:
+			continue
+		frm = move & 63
+		if (squares[frm] & 7) - 1 != ptype or move >> 12 & 3 == CASTLING:
+			continue
+		if from_col is not None and frm & 7 != from_col or from_row is not None and frm >> 3 != from_row:
+			continue
+		if move >> 12 & 3 == PROMOTION:
+			if (move >> 14) + KNIGHT != (QUEEN if promotion is None else promotion):
+				continue
+		elif promotion is not None:
+			continue
+		if found is not None:
+			raise ValueError(f"ambiguous move {text!r}")
+		found = move
+	if found is None:
+		raise ValueError(f"illegal move {text!r}")
+	return found
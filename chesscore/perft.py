@@ -0,0 +1,127 @@
+""" Perft: counts the leaf nodes of the legal move tree to check the move generator
+against known values and to measure its speed
+
+	python -m chesscore.perft --depth 4
+	python -m chesscore.perft --positions start,kiwipete --depth 5 --json perft.json
+"""
+
+import argparse
+import json
+import platform
+import sys
+import time
+
+from chesscore.bitboard import Position, START_FEN, move_uci
+
+
+# Standard test positions with their known node counts from depth 1
+POSITIONS = {
+	"start": (START_FEN,
+		[20, 400, 8902, 197281, 4865609, 119060324]),
+	"kiwipete": ("r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+		[48, 2039, 97862, 4085603, 193690690]),
+	"position3": ("8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+		[14, 191, 2812, 43238, 674624, 11030083]),
+	"position4": ("r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+		[6, 264, 9467, 422333, 15833292]),
+	"position5": ("rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+		[44, 1486, 62379, 2103487, 89941194]),
+	"position6": ("r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+		[46, 2079, 89890, 3894594, 164075551]),
+}
+
+
+def perft(position, depth):
+	""" Number of leaf nodes of the legal move tree of the given depth """
+	moves = position.legal_moves()
+	if depth <= 1:
+		return len(moves) if depth == 1 else 1
+	nodes = 0
+	for move in moves:
+		position.make_move(move)
+		nodes += perft(position, depth - 1)
+		position.unmake_move()
+	return nodes
+
+
+def divide(position, depth):
+	""" Node counts below each legal move, keyed by the move in UCI notation """
+	counts = {}
+	for move in position.legal_moves():
+		position.make_move(move)
+		counts[move_uci(move)] = perft(position, depth - 1)
+		position.unmake_move()
+	return counts
+
+
+def run(name, fen, depth, expected=None):
+	""" Runs perft on one position and returns a result record """
+	position = Position.from_fen(fen)
+	start = time.perf_counter()
+	nodes = perft(position, depth)
+	seconds = time.perf_counter() - start
+	return {
+		"name": name,
+		"fen": fen,
+		"depth": depth,
+		"nodes": nodes,
+		"expected": expected,
+		"ok": expected is None or nodes == expected,
+		"seconds": round(seconds, 4),
+		"nps": round(nodes / seconds) if seconds else None,
+	}
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description="Perft correctness and speed suite")
+	parser.add_argument("--depth", type=int, default=3, help="maximum depth (every depth from 1 is run)")
+	parser.add_argument("--positions", default=",".join(POSITIONS),
+		help="comma separated names of the standard positions")
+	parser.add_argument("--fen", help="run a custom position instead (no expected counts)")
+	parser.add_argument("--divide", action="store_true", help="print the node count below each move")
+	parser.add_argument("--json", metavar="PATH", help="write the results as JSON ('-' for stdout)")
+	args = parser.parse_args(argv)
+
+	if args.fen:
+		suite = [("custom", args.fen, [])]
+	else:
+		suite = [(name, *POSITIONS[name]) for name in args.positions.split(",")]
+
+	if args.divide:
+		for name, fen, _ in suite:
+			for move, nodes in sorted(divide(Position.from_fen(fen), args.depth).items()):
+				print(f"{move}: {nodes}")
+		return 0
+
+	results = []
+	for name, fen, counts in suite:
+		for depth in range(1, args.depth + 1):
+			expected = counts[depth - 1] if depth <= len(counts) else None
+			result = run(name, fen, depth, expected)
+			results.append(result)
+			if args.json != "-":
+				status = "ok" if result["ok"] else f"FAIL (expected {expected})"
+				print(f"{name:10} depth {depth}  {result['nodes']:>10} nodes  "
+					f"{result['seconds']:8.3f} s  {result['nps'] or 0:>8} nps  {status}")
+
+	if args.json:
+		report = {
+			"python": platform.python_version(),
+			"implementation": platform.python_implementation(),
+			"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+			"results": results,
+			"total_nodes": sum(result["nodes"] for result in results),
+			"total_seconds": round(sum(result["seconds"] for result in results), 4),
+			"ok": all(result["ok"] for result in results),
+		}
+		if args.json == "-":
+			json.dump(report, sys.stdout, indent=2)
+			print()
+		else:
+			with open(args.json, "w") as file:
+				json.dump(report, file, indent=2)
+	return 0 if all(result["ok"] for result in results) else 1
+
+
+if __name__ == "__main__":
+	sys.exit(main())
@@ -0,0 +1,226 @@
+""" Portable Game Notation: export of games and a streaming reader for large archives
+
+	python -m chesscore.pgn games.pgn [more.pgn ...]
+
+The reader yields one game at a time, so archives of any size are read in constant memory.
+Every game is replayed move by move through the rules; games with an illegal or unreadable
+move are still yielded, with the error and the moves before it.
+"""
+
+import argparse
+import re
+import sys
+import time
+
+from chesscore.bitboard import Position, START_FEN
+from chesscore.constants import WHITE
+from chesscore.notation import move_san, parse_san
+
+
+# PGN result of the results of a game (see GameState)
+RESULTS = {"white": "1-0", "black": "0-1", None: "*"}
+DRAW = "1/2-1/2"
+RESULT_TOKENS = ("1-0", "0-1", "1/2-1/2", "*")
+
+# Seven Tag Roster, in the order they are written
+ROSTER = ("Event", "Site", "Date", "Round", "White", "Black", "Result")
+
+TAG_RE = re.compile(r'\[\s*(\w+)\s+"((?:[^"\\]|\\.)*)"\s*\]')
+TOKEN_RE = re.compile(r"\{|;|\(|\)|\$\d+|[^\s(){};]+")
+MOVE_NUMBER_RE = re.compile(r"\d+\.+")
+
+
+def pgn_result(result):
+	""" PGN result token of a game result like "white" or "stalemate" """
+	return RESULTS.get(result, DRAW)
+
+
+class PgnGame:
+	""" A game read from PGN: its tags, the legal moves replayed from the start position and
+	the error that stopped the replay, if any """
+	__slots__ = ("tags", "moves", "error", "start_fen")
+
+	def __init__(self, tags, start_fen=START_FEN):
+		self.tags = tags
+		self.moves = []
+		self.error = None
+		self.start_fen = start_fen
+
+	@property
+	def result(self):
+		return self.tags.get("Result", "*")
+
+	def position(self):
+		""" The position after the replayed moves """
+		position = Position.from_fen(self.start_fen)
+		for move in self.moves:
+			position.make_move(move)
+		return position
+
+
+def write_pgn(game, tags=None, result=None):
+	""" Returns the game (a Game) in PGN with the Seven Tag Roster, the given extra tags
+	and the moves in SAN. result, if given, is written instead of the result of the game
+	(a result like "white" or "stalemate", for games decided outside of the board) """
+	tags = dict(tags or {})
+	tags.setdefault("Event", "Casual game")
+	tags.setdefault("Site", "?")
+	tags.setdefault("Date", time.strftime("%Y.%m.%d"))
+	tags.setdefault("Round", "-")
+	tags.setdefault("White", "?")
+	tags.setdefault("Black", "?")
+	tags["Result"] = pgn_result(game.result if result is None else result)
+	if game.start_fen != START_FEN:
+		tags["SetUp"] = "1"
+		tags["FEN"] = game.start_fen
+	names = list(ROSTER) + sorted(name for name in tags if name not in ROSTER)
+	lines = [f'[{name} "{escape(tags[name])}"]' for name in names]
+	lines.append("")
+
+	position = Position.from_fen(game.start_fen)
+	tokens = []
+	for move in game.moves:
+		if position.turn == WHITE:
+			tokens.append(f"{position.fullmove_number}.")
+		elif not tokens:
+			tokens.append(f"{position.fullmove_number}...")
+		tokens.append(move_san(position, move))
+		position.make_move(move)
+	tokens.append(tags["Result"])
+
+	# Movetext lines of at most 80 characters
+	line = ""
+	for token in tokens:
+		if line and len(line) + 1 + len(token) > 80:
+			lines.append(line)
+			line = token
+		else:
+			line = f"{line} {token}" if line else token
+	lines.append(line)
+	return "\n".join(lines) + "\n"
+
+
+def escape(value):
+	return str(value).replace("\\", "\\\\").replace('"', '\\"')
+
+
+def iter_pgn_blocks(lines):
+	""" Splits PGN text into (tags, movetext tokens) of one game at a time. Comments,
+	variations and numeric annotation glyphs are dropped """
+	tags = {}
+	tokens = []
+	comment = False
+	variation = 0
+	for line in lines:
+		if comment:
+			end = line.find("}")
+			if end < 0:
+				continue
+			line = line[end + 1:]
+			comment = False
+		elif line.startswith("%"):
+			continue
+		stripped = line.strip()
+		if not stripped:
+			continue
+		if stripped[0] == "[" and not variation:
+			if tokens:
+				# A tag section without a result token before it ends the previous game
+				yield tags, tokens
+				tags, tokens = {}, []
+			match = TAG_RE.match(stripped)
+			if match:
+				tags[match.group(1)] = match.group(2).replace('\\"', '"').replace("\\\\", "\\")
+			continue
+
+		position = 0
+		while True:
+			match = TOKEN_RE.search(line, position)
+			if not match:
+				break
+			token = match.group()
+			position = match.end()
+			if token == "{":
+				end = line.find("}", position)
+				if end < 0:
+					comment = True
+					break
+				position = end + 1
+			elif token == ";":
+				break
+			elif token == "(":
+				variation += 1
+			elif token == ")":
+				variation = max(variation - 1, 0)
+			elif variation or token[0] == "$":
+				continue
+			elif token in RESULT_TOKENS:
+				tags.setdefault("Result", token)
+				yield tags, tokens
+				tags, tokens = {}, []
+			else:
+				number = MOVE_NUMBER_RE.match(token)
+				if number:
+					token = token[number.end():]
+					if not token:
+						continue
+				tokens.append(token)
+	if tokens or tags:
+		yield tags, tokens
+
+
+def replay(tags, tokens):
+	""" Replays the SAN moves of a game through the rules and returns the PgnGame """
+	fen = tags.get("FEN") if tags.get("SetUp", "1") == "1" else None
+	game = PgnGame(tags, fen or START_FEN)
+	try:
+		position = Position.from_fen(game.start_fen)
+	except ValueError as error:
+		game.error = str(error)
+		return game
+	for token in tokens:
+		try:
+			move = parse_san(position, token)
+		except ValueError as error:
+			ply = len(game.moves)
+			turn = "white" if position.turn == WHITE else "black"
+			game.error = f"{error} at ply {ply + 1} ({turn} to move)"
+			break
+		position.make_move(move)
+		game.moves.append(move)
+	return game
+
+
+def read_games(lines):
+	""" Yields the games of PGN text (a file or any iterable of lines) one at a time """
+	for tags, tokens in iter_pgn_blocks(lines):
+		yield replay(tags, tokens)
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description="Validates PGN archives by replaying every game")
+	parser.add_argument("files", nargs="+", help="PGN files ('-' for stdin)")
+	parser.add_argument("--quiet", action="store_true", help="do not list the games with errors")
+	args = parser.parse_args(argv)
+
+	games = moves = errors = 0
+	start = time.perf_counter()
+	for path in args.files:
+		file = sys.stdin if path == "-" else open(path, encoding="utf-8", errors="replace")
+		with file:
+			for game in read_games(file):
+				games += 1
+				moves += len(game.moves)
+				if game.error:
+					errors += 1
+					if not args.quiet:
+						print(f"{path}: game {games}: {game.error}", file=sys.stderr)
+	seconds = time.perf_counter() - start
+	rate = moves / seconds if seconds else 0
+	print(f"{games} games, {moves} moves, {errors} with errors in {seconds:.2f} s "
+		f"({rate:.0f} moves/s, {rate * 3600 / 1e6:.1f} million moves/hour)")
+	return 1 if errors else 0
+
+
+if __name__ == "__main__":
+	sys.exit(main())
@@ -0,0 +1,45 @@
+""" Piece objects of the board, as seen by the front-end """
+
+
+class Piece:
+	""" A template class for all pieces in the chess board """
+	__slots__ = ("position", "color")
+	name = ""
+
+	def __init__(self, position, color):
+		self.position = position
+		self.color = color
+
+
+class King(Piece):
+	__slots__ = ()
+	name = "king"
+
+
+class Queen(Piece):
+	__slots__ = ()
+	name = "queen"
+
+
+class Rook(Piece):
+	__slots__ = ()
+	name = "rook"
+
+
+class Knight(Piece):
+	__slots__ = ()
+	name = "knight"
+
+
+class Bishop(Piece):
+	__slots__ = ()
+	name = "bishop"
+
+
+class Pawn(Piece):
+	__slots__ = ()
+	name = "pawn"
+
+
+# Piece classes indexed by piece type
+PIECE_CLASSES = (Pawn, Knight, Bishop, Rook, Queen, King)
@@ -0,0 +1,232 @@
+""" Optional instrumentation of the hot paths: call counts and cumulative time per function,
+latency histograms with percentiles, exported as JSON or as a cProfile dump for pstats
+
+Off by default and free when off: enable() replaces the functions listed in HOT_PATHS (and
+those added with watch) by timing wrappers, and disable() puts the originals back, so nothing
+is wrapped unless profiling was asked for. The programs turn it on with --profile [PATH] or
+the CHESS_PROFILE environment variable (see configure):
+	CHESS_PROFILE=1 python chess.py                 prints a report on exit
+	python chess.py --profile stats.json            writes the counters and histograms as JSON
+	python server.py --profile server.prof          also runs cProfile; read it with python -m pstats
+"""
+
+import atexit
+import cProfile
+import functools
+import importlib
+import json
+import math
+import os
+import sys
+import time
+
+
+# (module, class or None for a module function, function, with a latency histogram).
+# Functions are replaced where they are looked up: evaluate is called by name in chesscore.search.
+# The histograms of GameState.__init__ and Position.legal_moves are the latency of the legal move
+# generation of every ply played (and of every node searched)
+HOT_PATHS = (
+	("chesscore.bitboard", "Position", "legal_moves", True),
+	("chesscore.bitboard", "Position", "in_check", False),
+	("chesscore.bitboard", "Position", "make_move", False),
+	("chesscore.bitboard", "Position", "unmake_move", False),
+	("chesscore.gamestate", "GameState", "__init__", True),
+	("chesscore.gamestate", "GameState", "evaluate", False),
+	("chesscore.gamestate", "GameState", "targets", False),
+	("chesscore.gamestate", None, "insufficient_material", False),
+	("chesscore.game", "Game", "make_move", True),
+	("chesscore.game", "Game", "sync_board", False),
+	("chesscore.search", "Searcher", "search", True),
+	("chesscore.search", None, "evaluate", False),
+	("chesscore.tablebase", "Tablebase", "probe", False),
+)
+
+ENVIRONMENT_VARIABLE = "CHESS_PROFILE"
+
+
+class Histogram:
+	""" Counts of durations in buckets growing by a factor of 2^(1/4) (19%) from one microsecond,
+	from which percentiles are estimated within that precision """
+	__slots__ = ("counts", "count", "total", "max")
+
+	def __init__(self):
+		self.counts = []
+		self.count = 0
+		self.total = 0.0
+		self.max = 0.0
+
+	def add(self, seconds):
+		micros = seconds * 1e6
+		index = int(math.log2(micros) * 4) + 1 if micros > 1 else 0
+		counts = self.counts
+		if index >= len(counts):
+			counts.extend([0] * (index + 1 - len(counts)))
+		counts[index] += 1
+		self.count += 1
+		self.total += seconds
+		if seconds > self.max:
+			self.max = seconds
+
+	def percentile(self, fraction):
+		""" Upper bound of the bucket holding the given fraction of the durations, in seconds """
+		if not self.count:
+			return 0.0
+		rank = fraction * self.count
+		seen = 0
+		for index, count in enumerate(self.counts):
+			seen += count
+			if seen >= rank:
+				return min(2 ** (index / 4) / 1e6, self.max)
+		return self.max
+
+	def summary(self):
+		""" Count, mean, percentiles and maximum in milliseconds """
+		return {
+			"count": self.count,
+			"mean_ms": 1000 * self.total / self.count if self.count else 0.0,
+			"p50_ms": 1000 * self.percentile(0.5),
+			"p90_ms": 1000 * self.percentile(0.9),
+			"p99_ms": 1000 * self.percentile(0.99),
+			"max_ms": 1000 * self.max,
+		}
+
+
+class Profiler:
+	""" Counters of the watched functions and named histograms """
+	def __init__(self):
+		self.enabled = False
+		self.watched = [(module, owner, name, histogram) for module, owner, name, histogram in HOT_PATHS]
+		# (target, attribute, original function) of the functions replaced by enable
+		self.patched = []
+		# Name -> [calls, cumulative seconds, calls in progress]
+		self.counters = {}
+		self.histograms = {}
+		self.cprofile = None
+		self.started = None
+
+	def watch(self, module, owner, name, histogram=False):
+		""" Adds a function to the watched ones. module is a module name or a module or class
+		object (the classes of a script run as __main__), owner a class name or None """
+		self.watched.append((module, owner, name, histogram))
+		if self.enabled:
+			self.patch(module, owner, name, histogram)
+
+	def histogram(self, name):
+		""" The histogram of the given name, created on first use """
+		histogram = self.histograms.get(name)
+		if histogram is None:
+			histogram = self.histograms[name] = Histogram()
+		return histogram
+
+	def enable(self, cprofile=False):
+		""" Wraps the watched functions, and runs cProfile too if asked """
+		if not self.enabled:
+			self.enabled = True
+			self.started = time.perf_counter()
+			for watched in self.watched:
+				self.patch(*watched)
+		if cprofile and self.cprofile is None:
+			self.cprofile = cProfile.Profile()
+			self.cprofile.enable()
+
+	def disable(self):
+		""" Puts the original functions back; the collected numbers are kept """
+		for target, attribute, original in reversed(self.patched):
+			setattr(target, attribute, original)
+		self.patched.clear()
+		if self.cprofile is not None:
+			self.cprofile.disable()
+		self.enabled = False
+
+	def patch(self, module, owner, name, histogram):
+		if isinstance(module, str):
+			target, prefix = importlib.import_module(module), module.rsplit(".", 1)[-1]
+		else:
+			target, prefix = module, module.__name__
+		if owner is not None:
+			target, prefix = getattr(target, owner), owner
+		original = getattr(target, name)
+		label = f"{prefix}.{name}"
+		counter = self.counters.setdefault(label, [0, 0.0, 0])
+		setattr(target, name, _timed(original, counter, self.histogram(label) if histogram else None))
+		self.patched.append((target, name, original))
+
+	def to_json(self):
+		""" Counters sorted by cumulative time, and histogram summaries """
+		functions = {}
+		for label, (calls, seconds, active) in sorted(self.counters.items(), key=lambda item: -item[1][1]):
+			functions[label] = {
+				"calls": calls,
+				"total_ms": 1000 * seconds,
+				"per_call_us": 1e6 * seconds / calls if calls else 0.0,
+			}
+		return {
+			"seconds": time.perf_counter() - self.started if self.started else 0.0,
+			"functions": functions,
+			"histograms": {name: histogram.summary() for name, histogram in self.histograms.items()},
+		}
+
+	def report(self):
+		""" The counters and histograms as a text table """
+		data = self.to_json()
+		lines = [f"{'function':36} {'calls':>10} {'total ms':>11} {'us/call':>9}"]
+		for label, stats in data["functions"].items():
+			if stats["calls"]:
+				lines.append(f"{label:36} {stats['calls']:10} {stats['total_ms']:11.1f} {stats['per_call_us']:9.1f}")
+		for name, summary in data["histograms"].items():
+			if summary["count"]:
+				lines.append(f"{name}: {summary['count']} samples, p50 {summary['p50_ms']:.3f} ms, "
+					f"p90 {summary['p90_ms']:.3f} ms, p99 {summary['p99_ms']:.3f} ms, max {summary['max_ms']:.3f} ms")
+		return "\n".join(lines)
+
+	def export(self, path):
+		""" Writes the numbers to path: JSON for .json, a cProfile dump for .prof / .pstats
+		(if cProfile ran), otherwise the report is printed on stderr """
+		if path.endswith((".prof", ".pstats")):
+			if self.cprofile is None:
+				raise ValueError("cProfile was not enabled")
+			self.cprofile.disable()
+			self.cprofile.dump_stats(path)
+		elif path.endswith(".json"):
+			with open(path, "w") as file:
+				json.dump(self.to_json(), file, indent=1)
+		else:
+			print(self.report(), file=sys.stderr)
+
+
+def _timed(function, counter, histogram):
+	""" Wrapper counting the calls of a function and their time. Time spent in recursive calls
+	is only counted once, by the outermost call """
+	perf_counter = time.perf_counter
+
+	@functools.wraps(function)
+	def wrapper(*args, **kwargs):
+		counter[0] += 1
+		counter[2] += 1
+		start = perf_counter()
+		try:
+			return function(*args, **kwargs)
+		finally:
+			counter[2] -= 1
+			if not counter[2]:
+				elapsed = perf_counter() - start
+				counter[1] += elapsed
+				if histogram is not None:
+					histogram.add(elapsed)
+	return wrapper
+
+
+profiler = Profiler()
+
+
+def configure(path=None):
+	""" Enables profiling if a path (see Profiler.export, '1' or '-' for the report) is given or
+	set in CHESS_PROFILE, and exports the numbers on exit. Returns whether it was enabled """
+	path = path or os.environ.get(ENVIRONMENT_VARIABLE)
+	if not path or path == "0":
+		return False
+	if path == "1":
+		path = "-"
+	profiler.enable(cprofile=path.endswith((".prof", ".pstats")))
+	atexit.register(profiler.export, path)
+	return True
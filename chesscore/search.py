@@ -0,0 +1,351 @@
+""" Alpha-beta search for the computer opponent
+
+	python -m chesscore.search --time 2
+	python -m chesscore.search --fen "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1"
+
+Negamax with alpha-beta pruning and iterative deepening under a time budget. Moves are
+ordered by the transposition table move, captures by MVV-LVA (most valuable victim, least
+valuable attacker), killer moves and the history heuristic; the leaves are resolved by a
+quiescence search over captures and promotions.
+"""
+
+import argparse
+import sys
+import time
+
+from chesscore.bitboard import Position, START_FEN, move_uci
+from chesscore.constants import PROMOTION, EN_PASSANT, PAWN, DRAW
+from chesscore.evaluation import evaluate, PIECE_VALUES
+from chesscore.material import is_dead
+from chesscore.tablebase import Tablebase
+from chesscore.zobrist import TranspositionTable, EXACT, LOWER, UPPER
+
+
+MATE = 100000
+# Scores beyond this are mates, counted in plies from the root
+MATE_BOUND = MATE - 1000
+INFINITY = MATE + 1
+MAX_PLY = 64
+
+# Move ordering scores
+TT_MOVE_SCORE = 1 << 30
+CAPTURE_SCORE = 1 << 28
+KILLER_SCORE = 1 << 27
+
+# The clock is looked at once every this many nodes
+CHECK_INTERVAL = 1024
+
+
+class SearchTimeout(Exception):
+	pass
+
+
+class SearchInfo:
+	""" Result of one iteration of the search """
+	__slots__ = ("depth", "score", "move", "nodes", "seconds")
+
+	def __init__(self, depth, score, move, nodes, seconds):
+		self.depth = depth
+		self.score = score
+		self.move = move
+		self.nodes = nodes
+		self.seconds = seconds
+
+	@property
+	def nps(self):
+		return round(self.nodes / self.seconds) if self.seconds else 0
+
+	def __str__(self):
+		if abs(self.score) > MATE_BOUND:
+			plies = MATE - abs(self.score)
+			score = f"mate {(plies + 1) // 2 if self.score > 0 else -((plies + 1) // 2)}"
+		else:
+			score = f"cp {self.score}"
+		return f"depth {self.depth} score {score} nodes {self.nodes} nps {self.nps} " \
+			f"time {self.seconds:.2f} move {move_uci(self.move) if self.move else '-'}"
+
+
+class Searcher:
+	""" Finds the best move of a position within a time budget. The transposition table,
+	killer moves and history scores are kept between searches of the same game. With a
+	Tablebase, positions in its tables are scored from them instead of searched """
+	def __init__(self, tt_size=1 << 18, tablebase=None):
+		self.tt = TranspositionTable(tt_size)
+		self.tablebase = tablebase
+		self.killers = [[0, 0] for ply in range(MAX_PLY + 1)]
+		self.history = {}
+		self.nodes = 0
+		self.deadline = None
+		self.info = []
+
+	def new_game(self):
+		self.tt.clear()
+		self.history.clear()
+
+	def search(self, position, time_limit=1.0, max_depth=MAX_PLY):
+		""" Searches the position (which is restored afterwards) with iterative deepening until
+		the time is up or max_depth is reached, and returns the best move found. The result of
+		every finished iteration is kept in self.info """
+		start = time.perf_counter()
+		self.deadline = start + time_limit if time_limit else None
+		self.nodes = 0
+		self.info = []
+		self.tt.new_search()
+		for killers in self.killers:
+			killers[0] = killers[1] = 0
+		# Old history scores are halved so that the current position matters most
+		for move in self.history:
+			self.history[move] >>= 1
+
+		moves = position.legal_moves()
+		if not moves:
+			return None
+		if self.tablebase is not None:
+			found = self.tablebase.best_move(position)
+			if found is not None:
+				# Perfect play: the move with the shortest mate, or the longest when losing
+				move, (result, plies) = found
+				score = 0 if result == DRAW else tablebase_score(-result, plies + 1, 0)
+				self.info.append(SearchInfo(0, score, move, 0, time.perf_counter() - start))
+				return move
+		best = moves[0]
+		ply = position.ply
+		for depth in range(1, max_depth + 1):
+			try:
+				score = self.negamax(position, depth, -INFINITY, INFINITY, 0)
+			except SearchTimeout:
+				# Takes back the moves of the interrupted iteration
+				while position.ply > ply:
+					position.unmake_move()
+				break
+			entry = self.tt.probe(position.key)
+			if entry and entry[3]:
+				best = entry[3]
+			self.info.append(SearchInfo(depth, score, best, self.nodes, time.perf_counter() - start))
+			# Stops early once a forced mate is found or one move is left
+			if abs(score) > MATE_BOUND or len(moves) == 1:
+				break
+		return best
+
+	@property
+	def last(self):
+		""" Info of the last finished iteration """
+		return self.info[-1] if self.info else None
+
+	def order(self, position, moves, tt_move, ply):
+		""" Sorts the moves by their chance to cause a cutoff """
+		squares = position.squares
+		killers = self.killers[ply] if ply <= MAX_PLY else (0, 0)
+		history = self.history
+		scores = {}
+		for move in moves:
+			if move == tt_move:
+				scores[move] = TT_MOVE_SCORE
+				continue
+			victim = squares[move >> 6 & 63]
+			flag = move >> 12 & 3
+			if victim or flag == EN_PASSANT:
+				victim_value = PIECE_VALUES[(victim & 7) - 1] if victim else PIECE_VALUES[PAWN]
+				attacker_value = PIECE_VALUES[(squares[move & 63] & 7) - 1]
+				scores[move] = CAPTURE_SCORE + 16 * victim_value - attacker_value // 16
+			elif flag == PROMOTION:
+				scores[move] = CAPTURE_SCORE + (move >> 14)
+			elif move == killers[0] or move == killers[1]:
+				scores[move] = KILLER_SCORE
+			else:
+				scores[move] = history.get(move, 0)
+		moves.sort(key=scores.__getitem__, reverse=True)
+		return moves
+
+	def check_time(self):
+		if self.deadline is not None and time.perf_counter() >= self.deadline:
+			raise SearchTimeout()
+
+	def negamax(self, position, depth, alpha, beta, ply):
+		""" Score of the position from the view of the side to move, within (alpha, beta) """
+		self.nodes += 1
+		if not self.nodes % CHECK_INTERVAL:
+			self.check_time()
+
+		if ply:
+			if position.halfmove_clock >= 100 or is_dead(position.material) or \
+					(position.halfmove_clock >= 4 and position.repetition_count() > 1):
+				return 0
+			if self.tablebase is not None:
+				found = self.tablebase.probe(position)
+				if found is not None:
+					return tablebase_score(found[0], found[1], ply)
+			# Mate distance pruning
+			alpha = max(alpha, ply - MATE)
+			beta = min(beta, MATE - ply - 1)
+			if alpha >= beta:
+				return alpha
+
+		in_check = position.in_check()
+		if in_check and ply < MAX_PLY:
+			depth += 1
+		if depth <= 0 or ply >= MAX_PLY:
+			return self.quiesce(position, alpha, beta, ply)
+
+		key = position.key
+		tt_move = 0
+		entry = self.tt.probe(key)
+		if entry:
+			tt_depth, score, bound, tt_move = entry
+			if ply and tt_depth >= depth:
+				score = score_from_tt(score, ply)
+				if bound == EXACT or (bound == LOWER and score >= beta) or (bound == UPPER and score <= alpha):
+					return score
+
+		moves = position.legal_moves()
+		if not moves:
+			return ply - MATE if in_check else 0
+
+		original_alpha = alpha
+		best_score = -INFINITY
+		best_move = 0
+		for move in self.order(position, moves, tt_move, ply):
+			position.make_move(move)
+			score = -self.negamax(position, depth - 1, -beta, -alpha, ply + 1)
+			position.unmake_move()
+			if score > best_score:
+				best_score = score
+				best_move = move
+				if score > alpha:
+					alpha = score
+					if alpha >= beta:
+						if not position.squares[move >> 6 & 63] and move >> 12 & 3 != EN_PASSANT:
+							killers = self.killers[ply]
+							if killers[0] != move:
+								killers[1] = killers[0]
+								killers[0] = move
+							self.history[move] = self.history.get(move, 0) + depth * depth
+						break
+
+		if best_score >= beta:
+			bound = LOWER
+		elif best_score > original_alpha:
+			bound = EXACT
+		else:
+			bound = UPPER
+		self.tt.store(key, depth, score_to_tt(best_score, ply), bound, best_move)
+		return best_score
+
+	def quiesce(self, position, alpha, beta, ply):
+		""" Searches only captures and promotions until the position is quiet,
+		so the static evaluation is never taken in the middle of an exchange """
+		self.nodes += 1
+		if not self.nodes % CHECK_INTERVAL:
+			self.check_time()
+
+		in_check = position.in_check()
+		if not in_check:
+			stand_pat = evaluate(position)
+			if stand_pat >= beta or ply >= MAX_PLY:
+				return stand_pat
+			alpha = max(alpha, stand_pat)
+
+		moves = position.legal_moves()
+		if not moves:
+			return ply - MATE if in_check else 0
+		squares = position.squares
+		if not in_check:
+			# In check every move is searched, otherwise only captures and promotions
+			moves = [move for move in moves if squares[move >> 6 & 63] or move >> 12 & 3 in (PROMOTION, EN_PASSANT)]
+
+		best_score = alpha if not in_check else -INFINITY
+		for move in self.order(position, moves, 0, MAX_PLY + 1):
+			position.make_move(move)
+			score = -self.quiesce(position, -beta, -alpha, ply + 1)
+			position.unmake_move()
+			if score > best_score:
+				best_score = score
+				if score > alpha:
+					alpha = score
+					if alpha >= beta:
+						break
+		return best_score
+
+
+class Computer:
+	""" Computer opponent playing one color of a Game. on_search, if given, is called
+	with the SearchInfo of the last iteration after every search. With a Tablebase it plays
+	the endgames of its tables perfectly, with an OpeningBook it plays the book moves (picked
+	by weight) without searching as long as the game is in the book """
+	def __init__(self, color, time_limit=1.0, max_depth=MAX_PLY, on_search=None, tablebase=None, book=None):
+		self.color = color
+		self.time_limit = time_limit
+		self.max_depth = max_depth
+		self.on_search = on_search
+		self.searcher = Searcher(tablebase=tablebase)
+		self.book = book
+
+	def choose_move(self, game, time_limit=None):
+		""" Returns the move to play: a book move if there is one, otherwise the result of a search
+		of the position of the game. time_limit, if given, caps the thinking time (the time left
+		on the clock) """
+		if self.book is not None:
+			move = self.book.choose(game.position)
+			if move is not None:
+				return move
+		limit = self.time_limit
+		if time_limit is not None:
+			# 0 is no limit for the searcher, so a clock always leaves it a few milliseconds
+			limit = max(0.01, min(limit, time_limit) if limit else time_limit)
+		move = self.searcher.search(game.position, limit, self.max_depth)
+		if self.on_search and self.searcher.last:
+			self.on_search(self.searcher.last)
+		return move
+
+	def new_game(self):
+		self.searcher.new_game()
+
+
+def tablebase_score(result, plies, ply):
+	""" Search score of a tablebase result (WIN, DRAW or LOSS) with mate in plies, at ply
+	from the root. Positions known only as won or lost score just inside the mate scores """
+	if result == DRAW:
+		return 0
+	if plies is None:
+		plies = MAX_PLY
+	return result * (MATE - ply - plies)
+
+
+def score_to_tt(score, ply):
+	""" Mate scores are stored relative to the position instead of the root """
+	if score > MATE_BOUND:
+		return score + ply
+	if score < -MATE_BOUND:
+		return score - ply
+	return score
+
+
+def score_from_tt(score, ply):
+	if score > MATE_BOUND:
+		return score - ply
+	if score < -MATE_BOUND:
+		return score + ply
+	return score
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description="Searches a position and reports depth and nodes per second")
+	parser.add_argument("--fen", default=START_FEN)
+	parser.add_argument("--time", type=float, default=1.0, help="time budget in seconds")
+	parser.add_argument("--depth", type=int, default=MAX_PLY, help="maximum depth")
+	parser.add_argument("--tablebases", metavar="DIR", help="directory of endgame tables (see chesscore.tablebase)")
+	args = parser.parse_args(argv)
+	try:
+		position = Position.from_fen(args.fen)
+	except ValueError as error:
+		parser.error(str(error))
+
+	searcher = Searcher(tablebase=Tablebase(args.tablebases) if args.tablebases else None)
+	searcher.search(position, args.time, args.depth)
+	for info in searcher.info:
+		print(info)
+	return 0
+
+
+if __name__ == "__main__":
+	sys.exit(main())
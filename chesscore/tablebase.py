@@ -0,0 +1,614 @@
+""" Endgame tablebases of positions with up to four pieces (kings included)
+
+	python -m chesscore.tablebase generate tables/ [--pieces 4] [--jobs 8] [KQK KRK ...]
+	python -m chesscore.tablebase probe tables/ --fen "<FEN>"
+
+A table holds every position of one material balance like KQK or KRKN: the pieces of the
+stronger side, which is white in the table, then the pieces of the other side. Tables are
+generated by retrograde analysis: positions are solved backwards from the checkmates and
+from the captures and promotions into smaller tables, so those tables must exist first.
+Tables that do not depend on each other are generated in parallel processes.
+
+Positions are indexed by symmetry: the board is rotated and mirrored so that the white king
+is in the a1-d1-d4 triangle (tables with pawns are only mirrored left to right, with the king
+on files a-d), then the index is made of the side to move, the white king and the squares of
+the other pieces. A probe is a few table lookups and one read of a memory-mapped file.
+Every table is written twice:
+	NAME.dtm    one byte per position: 0 for an index that is not a legal position, 1 for a
+	            draw, otherwise 2 + the number of plies to mate (odd: the side to move wins)
+	NAME.wdl    two bits per position, four positions per byte (0 invalid, 1 draw, 2 win, 3 loss)
+both after a 24-byte header (magic, name, number of positions). Positions with castling rights
+or an en passant square are not in the tables, en passant captures are not considered and the
+fifty-move rule is ignored.
+"""
+
+import argparse
+import array
+import itertools
+import mmap
+import os
+import struct
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from chesscore.attacks import KNIGHT_ATTACKS, KING_ATTACKS, PAWN_ATTACKS, rook_attacks, bishop_attacks, queen_attacks
+from chesscore.bitboard import Position, iter_bits, move_uci
+from chesscore.constants import WHITE, BLACK, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING, WIN, DRAW, LOSS
+
+
+MAGIC = b"CHESSTB\x01"
+HEADER = struct.Struct("<8s8sQ")
+
+# Codes of the .wdl files
+WDL_CODES = (None, DRAW, WIN, LOSS)
+WDL_BITS = {DRAW: 1, WIN: 2, LOSS: 3}
+
+# Values of the .dtm files, and of positions not solved yet while generating
+INVALID, DRAWN, UNSOLVED = 0, 1, 255
+MAX_PLIES = 252
+
+# Order of the pieces other than the king in table names, from the strongest
+PIECE_CHARS = "PNBRQK"
+NAME_ORDER = (QUEEN, ROOK, BISHOP, KNIGHT, PAWN)
+
+
+def _transform(transpose, flip_rows, flip_cols):
+	""" Square map of a symmetry of the board """
+	squares = []
+	for square in range(64):
+		row, col = divmod(square, 8)
+		if transpose:
+			row, col = col, row
+		if flip_rows:
+			row = 7 - row
+		if flip_cols:
+			col = 7 - col
+		squares.append(row*8 + col)
+	return squares
+
+SYMMETRIES = [_transform(*flags) for flags in itertools.product((False, True), repeat=3)]
+MIRRORS = [_transform(False, False, False), _transform(False, False, True)]
+
+# Squares of the white king: the a1-d1-d4 triangle without pawns, files a-d with pawns
+TRIANGLE = [sq for sq in range(64) if sq & 7 <= 3 and 7 - (sq >> 3) <= (sq & 7)]
+LEFT_HALF = [sq for sq in range(64) if sq & 7 <= 3]
+
+
+def _attacks(ptype, color, square, occupied):
+	if ptype == PAWN:
+		return PAWN_ATTACKS[color][square]
+	if ptype == KNIGHT:
+		return KNIGHT_ATTACKS[square]
+	if ptype == BISHOP:
+		return bishop_attacks(square, occupied)
+	if ptype == ROOK:
+		return rook_attacks(square, occupied)
+	if ptype == QUEEN:
+		return queen_attacks(square, occupied)
+	return KING_ATTACKS[square]
+
+
+def side_name(ptypes):
+	""" 'K' and the other pieces of one side, strongest first """
+	return "K" + "".join(PIECE_CHARS[ptype] for ptype in sorted(ptypes, key=NAME_ORDER.index))
+
+
+def table_name(white, black):
+	""" Name of the table of the given piece types (without kings) of both sides, and whether
+	the colors are swapped in it (the stronger side is white in a table) """
+	def strength(ptypes):
+		return len(ptypes), sorted((5 - NAME_ORDER.index(ptype) for ptype in ptypes), reverse=True)
+	if strength(black) > strength(white):
+		return side_name(black) + side_name(white), True
+	return side_name(white) + side_name(black), False
+
+
+def split_name(name):
+	""" Piece types (without kings) of white and black in a table name like 'KRKN' """
+	second = name.find("K", 1)
+	if not name.startswith("K") or second < 0 or any(char not in PIECE_CHARS for char in name):
+		raise ValueError(f"invalid table name {name!r}")
+	return [PIECE_CHARS.index(char) for char in name[1:second]], [PIECE_CHARS.index(char) for char in name[second + 1:]]
+
+
+class TableSpec:
+	""" The pieces of a table and the index of its positions. Squares are given in the order
+	white king, black king, other white pieces, other black pieces (as in the name) """
+	__slots__ = ("name", "pieces", "by_color", "groups", "region", "region_index", "symmetries", "size")
+
+	def __init__(self, name):
+		white, black = split_name(name)
+		self.name = name
+		self.pieces = [(WHITE, KING), (BLACK, KING)] + [(WHITE, ptype) for ptype in white] + \
+			[(BLACK, ptype) for ptype in black]
+		self.by_color = [[i for i, piece in enumerate(self.pieces) if piece[0] == color] for color in (WHITE, BLACK)]
+		# Runs of identical pieces, whose squares are kept sorted
+		self.groups = []
+		for i in range(2, len(self.pieces)):
+			if self.pieces[i] == self.pieces[i - 1]:
+				if self.groups and self.groups[-1][1] == i:
+					self.groups[-1][1] = i + 1
+				else:
+					self.groups.append([i - 1, i + 1])
+		pawns = PAWN in white or PAWN in black
+		self.region = LEFT_HALF if pawns else TRIANGLE
+		self.region_index = {square: i for i, square in enumerate(self.region)}
+		# Symmetries that move each square of the white king into the region
+		symmetries = MIRRORS if pawns else SYMMETRIES
+		self.symmetries = [[t for t in symmetries if t[square] in self.region_index] for square in range(64)]
+		self.size = 2 * len(self.region) * 64 ** (len(self.pieces) - 1)
+
+	def canonical(self, squares):
+		""" The squares of the symmetric position that is stored in the table """
+		best = None
+		for t in self.symmetries[squares[0]]:
+			mapped = [t[square] for square in squares]
+			for start, end in self.groups:
+				mapped[start:end] = sorted(mapped[start:end])
+			mapped = tuple(mapped)
+			if best is None or mapped < best:
+				best = mapped
+		return best
+
+	def index(self, turn, squares):
+		""" Index of a position given by its canonical squares """
+		index = turn * len(self.region) + self.region_index[squares[0]]
+		for square in squares[1:]:
+			index = index * 64 + square
+		return index
+
+	def decode(self, index):
+		""" (turn, squares) of an index """
+		squares = []
+		for i in range(len(self.pieces) - 1):
+			index, square = divmod(index, 64)
+			squares.append(square)
+		turn, region = divmod(index, len(self.region))
+		squares.append(self.region[region])
+		return turn, tuple(reversed(squares))
+
+	def attacked(self, target, squares, by, occupied, skip=-1):
+		""" Checks whether the pieces of a color (but the one at index skip) attack a square """
+		pieces = self.pieces
+		for i in self.by_color[by]:
+			if i != skip and _attacks(pieces[i][1], by, squares[i], occupied) >> target & 1:
+				return True
+		return False
+
+	def is_legal(self, turn, squares):
+		""" Checks that no two pieces share a square, no pawn is on the first or last rank and
+		the side that just moved is not in check """
+		occupied = 0
+		for (color, ptype), square in zip(self.pieces, squares):
+			bit = 1 << square
+			if occupied & bit or ptype == PAWN and (square < 8 or square >= 56):
+				return False
+			occupied |= bit
+		return not self.attacked(squares[1 - turn], squares, turn, occupied)
+
+	def moves(self, turn, squares):
+		""" Yields (squares, captured piece index or -1, promotion or None) of every legal move """
+		pieces = self.pieces
+		occupied = own = 0
+		for (color, ptype), square in zip(pieces, squares):
+			occupied |= 1 << square
+			if color == turn:
+				own |= 1 << square
+		them = 1 - turn
+		for i in self.by_color[turn]:
+			ptype = pieces[i][1]
+			frm = squares[i]
+			if ptype == PAWN:
+				step = -8 if turn == WHITE else 8
+				targets = PAWN_ATTACKS[turn][frm] & occupied & ~own
+				if not occupied >> (frm + step) & 1:
+					targets |= 1 << (frm + step)
+					start_row = 6 if turn == WHITE else 1
+					if frm >> 3 == start_row and not occupied >> (frm + 2*step) & 1:
+						targets |= 1 << (frm + 2*step)
+			else:
+				targets = _attacks(ptype, turn, frm, occupied) & ~own
+			for to in iter_bits(targets):
+				captured = -1
+				if occupied >> to & 1:
+					captured = squares.index(to)
+				moved = list(squares)
+				moved[i] = to
+				king = moved[turn]
+				if self.attacked(king, moved, them, occupied & ~(1 << frm) | 1 << to, captured):
+					continue
+				if ptype == PAWN and (to < 8 or to >= 56):
+					for promotion in (QUEEN, ROOK, BISHOP, KNIGHT):
+						yield moved, captured, promotion
+				else:
+					yield moved, captured, None
+
+	def unmoves(self, turn, squares):
+		""" Canonical squares of the legal positions (with the other side to move) from which
+		the side that just moved reached this one with a move that is not a capture or promotion """
+		pieces = self.pieces
+		occupied = 0
+		for square in squares:
+			occupied |= 1 << square
+		us = 1 - turn
+		found = set()
+		for i in self.by_color[us]:
+			ptype = pieces[i][1]
+			to = squares[i]
+			if ptype == PAWN:
+				step = 8 if us == WHITE else -8
+				row = to >> 3
+				sources = 0
+				if (row <= 5 if us == WHITE else row >= 2) and not occupied >> (to + step) & 1:
+					sources = 1 << (to + step)
+					if row == (4 if us == WHITE else 3) and not occupied >> (to + 2*step) & 1:
+						sources |= 1 << (to + 2*step)
+			else:
+				sources = _attacks(ptype, us, to, occupied) & ~occupied
+			for frm in iter_bits(sources):
+				moved = list(squares)
+				moved[i] = frm
+				# The side to move after the move back must not be the one giving check
+				if self.attacked(moved[turn], moved, us, occupied & ~(1 << to) | 1 << frm):
+					continue
+				found.add(self.canonical(moved))
+		return found
+
+
+class Table:
+	""" A memory-mapped table: its .dtm file, its .wdl file or both """
+	__slots__ = ("spec", "dtm", "wdl")
+
+	def __init__(self, spec):
+		self.spec = spec
+		self.dtm = None
+		self.wdl = None
+
+	def load(self, path):
+		with open(path, "rb") as file:
+			data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+		magic, name, size = HEADER.unpack_from(data)
+		if magic != MAGIC or name.rstrip(b"\0").decode() != self.spec.name or size != self.spec.size:
+			data.close()
+			raise ValueError(f"not a tablebase file of {self.spec.name}: {path}")
+		if path.endswith(".dtm"):
+			self.dtm = data
+		else:
+			self.wdl = data
+
+	def close(self):
+		for data in (self.dtm, self.wdl):
+			if data is not None:
+				data.close()
+		self.dtm = self.wdl = None
+
+	def value(self, index):
+		""" (result, plies to mate) of a position; plies is None for draws and in .wdl only tables """
+		if self.dtm is not None:
+			value = self.dtm[HEADER.size + index]
+			if value == DRAWN:
+				return DRAW, None
+			if value == INVALID:
+				return None
+			plies = value - 2
+			return (WIN if plies & 1 else LOSS), plies
+		code = self.wdl[HEADER.size + (index >> 2)] >> ((index & 3) << 1) & 3
+		return (WDL_CODES[code], None) if code else None
+
+
+class Tablebase:
+	""" The tables of a directory, probed by the material of a position """
+	def __init__(self, directory=None):
+		self.tables = {}
+		self.max_pieces = 0
+		if directory:
+			self.open(directory)
+
+	def __len__(self):
+		return len(self.tables)
+
+	def __contains__(self, name):
+		return name in self.tables
+
+	def open(self, directory):
+		""" Maps every .dtm and .wdl file of the directory """
+		for file_name in sorted(os.listdir(directory)):
+			name, extension = os.path.splitext(file_name)
+			if extension not in (".dtm", ".wdl"):
+				continue
+			table = self.tables.get(name)
+			if table is None:
+				table = self.tables[name] = Table(TableSpec(name))
+			table.load(os.path.join(directory, file_name))
+			self.max_pieces = max(self.max_pieces, len(table.spec.pieces))
+
+	def close(self):
+		for table in self.tables.values():
+			table.close()
+		self.tables.clear()
+		self.max_pieces = 0
+
+	def probe_pieces(self, pieces, turn):
+		""" (result, plies to mate) from the view of the side to move of the position made of
+		the given (color, piece type, square), or None if it is not in the tables """
+		white = [ptype for color, ptype, square in pieces if color == WHITE and ptype != KING]
+		black = [ptype for color, ptype, square in pieces if color == BLACK and ptype != KING]
+		if not white and not black:
+			return DRAW, None
+		name, swapped = table_name(white, black)
+		table = self.tables.get(name)
+		if table is None:
+			return None
+		if swapped:
+			pieces = [(1 - color, ptype, square ^ 56) for color, ptype, square in pieces]
+			turn = 1 - turn
+		spec = table.spec
+		squares = [None] * len(spec.pieces)
+		for color, ptype, square in pieces:
+			i = spec.pieces.index((color, ptype))
+			while squares[i] is not None:
+				i += 1
+			squares[i] = square
+		return table.value(spec.index(turn, spec.canonical(squares)))
+
+	def probe(self, position):
+		""" (result, plies to mate) of a Position from the view of the side to move (WIN, DRAW
+		or LOSS), or None if it is not in the tables """
+		occupied = position.occupied[0] | position.occupied[1]
+		if not self.tables or bin(occupied).count("1") > self.max_pieces or position.castling or \
+				position.ep_square is not None:
+			return None
+		squares = position.squares
+		pieces = [(squares[square] >> 3, (squares[square] & 7) - 1, square) for square in iter_bits(occupied)]
+		return self.probe_pieces(pieces, position.turn)
+
+	def probe_wdl(self, position):
+		""" WIN, DRAW or LOSS for the side to move, or None """
+		found = self.probe(position)
+		return found[0] if found else None
+
+	def best_move(self, position):
+		""" The move keeping the best result with the shortest mate (the longest when losing),
+		with its (result, plies to mate) after the move. None if the position or one of the
+		positions after a move is not in the tables with distances to mate """
+		best = best_key = None
+		for move in position.legal_moves():
+			position.make_move(move)
+			found = self.probe(position)
+			position.unmake_move()
+			if found is None or found[0] != DRAW and found[1] is None:
+				return None
+			result, plies = found
+			# Results after the move are from the view of the opponent
+			if result == LOSS:
+				key = (2, -plies)
+			elif result == DRAW:
+				key = (1, 0)
+			else:
+				key = (0, plies)
+			if best_key is None or key > best_key:
+				best, best_key = (move, found), key
+		return best
+
+
+def dependencies(name):
+	""" Names of the tables reached by the captures and promotions of a table (without KK) """
+	white, black = split_name(name)
+	found = set()
+	for side in (white, black):
+		for i, ptype in enumerate(side):
+			rest = side[:i] + side[i + 1:]
+			variants = [rest]
+			if ptype == PAWN:
+				variants += [rest + [promotion] for promotion in (QUEEN, ROOK, BISHOP, KNIGHT)]
+			for variant in variants:
+				sides = (variant, black) if side is white else (white, variant)
+				if sides[0] or sides[1]:
+					found.add(table_name(*sides)[0])
+	return found
+
+
+def all_tables(max_pieces):
+	""" Names of all tables with 3 to max_pieces pieces """
+	names = set()
+	for count in range(1, max_pieces - 1):
+		for pieces in itertools.combinations_with_replacement(NAME_ORDER, count):
+			for split in range(count + 1):
+				names.add(table_name(list(pieces[:split]), list(pieces[split:]))[0])
+	return names
+
+
+def generate(name, directory):
+	""" Generates a table by retrograde analysis and writes its files. The tables it depends
+	on are read from the same directory. Returns (positions, longest mate in plies) """
+	spec = TableSpec(name)
+	subtables = Tablebase(directory)
+	values = bytearray(spec.size)
+	# Distinct positions after the moves of each position not known to lose yet, and the
+	# longest mate among those that do
+	remaining = bytearray(spec.size)
+	longest = bytearray(spec.size)
+	# Positions to solve with each number of plies to mate: odd wins, even losses
+	queue = []
+
+	def push(plies, index):
+		if plies > MAX_PLIES:
+			raise ValueError(f"mate in more than {MAX_PLIES} plies in {name}")
+		while len(queue) <= plies:
+			queue.append(array.array("I"))
+		queue[plies].append(index)
+
+	for turn in (WHITE, BLACK):
+		for king in spec.region:
+			for rest in itertools.product(range(64), repeat=len(spec.pieces) - 1):
+				squares = (king,) + rest
+				if not spec.is_legal(turn, squares) or spec.canonical(squares) != squares:
+					continue
+				index = spec.index(turn, squares)
+				values[index] = UNSOLVED
+				children = set()
+				escapes = 0
+				best_win = None
+				moved = False
+				for child, captured, promotion in spec.moves(turn, squares):
+					moved = True
+					if captured < 0 and promotion is None:
+						children.add(spec.canonical(child))
+						continue
+					pieces = [(color, ptype, square) for i, ((color, ptype), square) in enumerate(zip(spec.pieces, child))
+						if i != captured]
+					if promotion is not None:
+						moving = next(i for i in spec.by_color[turn] if child[i] != squares[i])
+						pieces = [(color, promotion if square == child[moving] else ptype, square) for color, ptype, square in pieces]
+					found = subtables.probe_pieces(pieces, 1 - turn)
+					if found is None:
+						raise ValueError(f"{name} needs the table of {pieces} in {directory}")
+					result, plies = found
+					if result == LOSS:
+						best_win = plies + 1 if best_win is None else min(best_win, plies + 1)
+					elif result == WIN:
+						longest[index] = max(longest[index], plies + 1)
+					else:
+						# A move into a drawn position: this one is never lost
+						escapes += 1
+				if not moved:
+					if spec.attacked(squares[turn], squares, 1 - turn, sum(1 << square for square in squares)):
+						push(0, index)
+					else:
+						values[index] = DRAWN
+					continue
+				remaining[index] = len(children) + escapes
+				if best_win is not None:
+					push(best_win, index)
+				elif not remaining[index]:
+					push(longest[index], index)
+
+	plies = 0
+	while plies < len(queue):
+		for index in queue[plies]:
+			if values[index] != UNSOLVED:
+				continue
+			values[index] = plies + 2
+			turn, squares = spec.decode(index)
+			for previous in spec.unmoves(turn, squares):
+				before = spec.index(1 - turn, previous)
+				if values[before] != UNSOLVED:
+					continue
+				if plies & 1 == 0:
+					# The side to move here is mated in plies: moving here wins
+					push(plies + 1, before)
+				else:
+					remaining[before] -= 1
+					longest[before] = max(longest[before], plies + 1)
+					if not remaining[before]:
+						push(longest[before], before)
+		queue[plies] = None
+		plies += 1
+
+	positions = 0
+	wdl = bytearray((spec.size + 3) >> 2)
+	for index, value in enumerate(values):
+		if value == INVALID:
+			continue
+		if value == UNSOLVED:
+			value = values[index] = DRAWN
+		positions += 1
+		code = WDL_BITS[DRAW if value == DRAWN else WIN if value & 1 else LOSS]
+		wdl[index >> 2] |= code << ((index & 3) << 1)
+	subtables.close()
+
+	header = HEADER.pack(MAGIC, name.encode(), spec.size)
+	for extension, data in ((".dtm", values), (".wdl", wdl)):
+		path = os.path.join(directory, name + extension)
+		with open(path + ".tmp", "wb") as file:
+			file.write(header)
+			file.write(data)
+		os.replace(path + ".tmp", path)
+	return positions, max(0, len(queue) - 1)
+
+
+def _generate_timed(name, directory):
+	start = time.perf_counter()
+	positions, plies = generate(name, directory)
+	return name, positions, plies, time.perf_counter() - start
+
+
+def generate_all(names, directory, jobs=None, log=print):
+	""" Generates the tables and the tables they depend on that are not in the directory yet,
+	in parallel processes. A table is started as soon as the tables it depends on are done """
+	existing = {name for name in Tablebase(directory).tables}
+	wanted = set()
+	stack = list(names)
+	while stack:
+		name = stack.pop()
+		if name in wanted or name in existing:
+			continue
+		wanted.add(name)
+		stack.extend(dependencies(name))
+
+	done = set(existing)
+	running = {}
+	with ProcessPoolExecutor(jobs) as executor:
+		while wanted or running:
+			for name in sorted(wanted):
+				if dependencies(name) <= done:
+					wanted.discard(name)
+					running[executor.submit(_generate_timed, name, directory)] = name
+			if not running:
+				raise ValueError(f"cannot generate {sorted(wanted)}: missing dependencies")
+			finished, _ = wait(running, return_when=FIRST_COMPLETED)
+			for future in finished:
+				name, positions, plies, seconds = future.result()
+				done.add(running.pop(future))
+				log(f"{name:6} {positions:10} positions  longest mate {(plies + 1) // 2:3} moves  {seconds:8.1f} s")
+	return done
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description="Endgame tablebases of up to four pieces")
+	commands = parser.add_subparsers(dest="command", required=True)
+	command = commands.add_parser("generate", help="generate tables by retrograde analysis")
+	command.add_argument("directory")
+	command.add_argument("tables", nargs="*", help="names like KQK or KRKN (default: all tables)")
+	command.add_argument("--pieces", type=int, choices=(3, 4), default=4, help="largest tables to generate")
+	command.add_argument("--jobs", type=int, default=os.cpu_count(), help="number of processes")
+	command = commands.add_parser("probe", help="print the result and distance to mate of a position")
+	command.add_argument("directory")
+	command.add_argument("--fen", required=True)
+	args = parser.parse_args(argv)
+
+	if args.command == "generate":
+		os.makedirs(args.directory, exist_ok=True)
+		try:
+			names = [table_name(*split_name(name))[0] for name in args.tables] or all_tables(args.pieces)
+		except ValueError as error:
+			parser.error(str(error))
+		start = time.perf_counter()
+		generate_all(names, args.directory, args.jobs)
+		print(f"done in {time.perf_counter() - start:.1f} s")
+	else:
+		try:
+			position = Position.from_fen(args.fen)
+		except ValueError as error:
+			parser.error(str(error))
+		tablebase = Tablebase(args.directory)
+		start = time.perf_counter()
+		found = tablebase.probe(position)
+		seconds = time.perf_counter() - start
+		if found is None:
+			print("not in the tables")
+			return 1
+		result, plies = found
+		text = {WIN: "win", DRAW: "draw", LOSS: "loss"}[result]
+		if plies is not None:
+			text += f", mate in {(plies + 1) // 2} moves ({plies} plies)"
+		print(f"{text} for the side to move ({1e6 * seconds:.1f} us)")
+		best = tablebase.best_move(position)
+		if best:
+			print(f"best move {move_uci(best[0])}")
+	return 0
+
+
+if __name__ == "__main__":
+	sys.exit(main())
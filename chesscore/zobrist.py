@@ -0,0 +1,91 @@
+""" Zobrist hashing of positions and a transposition table indexed by the hash keys """
+
+import random
+
+from chesscore.constants import WHITE, BLACK
+
+
+_random = random.Random(0x5EED_C4E55)
+
+def _random_key():
+	return _random.getrandbits(64)
+
+# PIECE_KEYS[color][piece type][square]
+PIECE_KEYS = [[[_random_key() for square in range(64)] for ptype in range(6)] for color in (WHITE, BLACK)]
+# XORed in when black is to move
+SIDE_KEY = _random_key()
+CASTLING_KEYS = [_random_key() for rights in range(16)]
+EP_KEYS = [_random_key() for col in range(8)]
+
+
+def compute_key(position):
+	""" Computes the 64-bit Zobrist key of a position from scratch """
+	key = 0
+	for color, pieces in enumerate(position.pieces):
+		for ptype, bitboard in enumerate(pieces):
+			keys = PIECE_KEYS[color][ptype]
+			while bitboard:
+				lsb = bitboard & -bitboard
+				key ^= keys[lsb.bit_length() - 1]
+				bitboard ^= lsb
+	if position.turn == BLACK:
+		key ^= SIDE_KEY
+	key ^= CASTLING_KEYS[position.castling]
+	if position.ep_square is not None:
+		key ^= EP_KEYS[position.ep_square & 7]
+	return key
+
+
+# Bounds of the scores stored in the transposition table
+EXACT, LOWER, UPPER = 0, 1, 2
+SCORE_OFFSET = 1 << 31
+
+
+class TranspositionTable:
+	""" Fixed size hash table of search results indexed by Zobrist key. Every bucket holds two
+	entries: one kept for the deepest search of the current generation and one always
+	replaced, so deep results survive while recent shallow results are still cached """
+	def __init__(self, size=1 << 18):
+		# Number of buckets, rounded down to a power of 2
+		self.mask = (1 << (size.bit_length() - 1)) - 1
+		self.keys = [0] * (2 * (self.mask + 1))
+		self.entries = [0] * (2 * (self.mask + 1))
+		self.generation = 0
+		self.hits = 0
+		self.probes = 0
+
+	def new_search(self):
+		""" Ages all entries so that results of older searches get replaced first """
+		self.generation = (self.generation + 1) & 0xFF
+
+	def clear(self):
+		self.keys = [0] * len(self.keys)
+		self.entries = [0] * len(self.entries)
+
+	def store(self, key, depth, score, bound, move=0):
+		""" Stores a search result: entry = move | depth << 16 | bound << 24 | generation << 26 | score << 34 """
+		index = (key & self.mask) << 1
+		entry = move | depth << 16 | bound << 24 | self.generation << 26 | (score + SCORE_OFFSET) << 34
+		old = self.entries[index]
+		if self.keys[index] == key or not old or depth >= (old >> 16 & 0xFF) or \
+				(old >> 26 & 0xFF) != self.generation:
+			self.keys[index] = key
+			self.entries[index] = entry
+		else:
+			self.keys[index + 1] = key
+			self.entries[index + 1] = entry
+
+	def probe(self, key):
+		""" Returns (depth, score, bound, move) stored for the key or None """
+		self.probes += 1
+		index = (key & self.mask) << 1
+		for i in (index, index + 1):
+			if self.keys[i] == key and self.entries[i]:
+				self.hits += 1
+				entry = self.entries[i]
+				return entry >> 16 & 0xFF, (entry >> 34) - SCORE_OFFSET, entry >> 24 & 3, entry & 0xFFFF
+		return None
+
+	def usage(self):
+		""" Fraction of the entries in use """
+		return sum(1 for entry in self.entries if entry) / len(self.entries)
@@ -0,0 +1,60 @@
+import collections
+
+import pygame
+
+
+FONT_NAME = "courier"
+TEXT_CACHE_SIZE = 64
+
+
+class TextCache:
+	""" Finds the font file once, keeps one Font object per size and the rendered surfaces
+	of the most recently used (text, size, color) in an LRU cache, so that drawing the same
+	text again is a dictionary lookup instead of a font lookup and a render """
+	def __init__(self, font_name=FONT_NAME, bold=True, max_size=TEXT_CACHE_SIZE):
+		self.font_name = font_name
+		self.bold = bold
+		self.max_size = max_size
+		self.font_path = None
+		self.fonts = {}
+		self.surfaces = collections.OrderedDict()
+		self.renders = 0
+		self.hits = 0
+
+	def find_font(self):
+		""" Looks up the font file among the system fonts (once per process) """
+		if self.font_path is None:
+			# pygame's default font if the system has no such font
+			self.font_path = pygame.font.match_font(self.font_name, bold=self.bold) or ""
+		return self.font_path
+
+	def font(self, size):
+		""" Returns the Font of the given size, created on first use """
+		font = self.fonts.get(size)
+		if font is None:
+			font = self.fonts[size] = pygame.font.Font(self.find_font() or None, size)
+			if self.bold and not self.font_path:
+				font.set_bold(True)
+		return font
+
+	def render(self, text, size, color):
+		""" Returns the surface of the text, rendered only if it is not in the cache """
+		key = (text, size, tuple(color))
+		surface = self.surfaces.get(key)
+		if surface is not None:
+			self.hits += 1
+			self.surfaces.move_to_end(key)
+			return surface
+		self.renders += 1
+		surface = self.surfaces[key] = self.font(size).render(text, True, color)
+		if len(self.surfaces) > self.max_size:
+			self.surfaces.popitem(last=False)
+		return surface
+
+	def stats(self):
+		""" Returns the number of texts rendered and the number served from the cache """
+		return {"renders": self.renders, "cache_hits": self.hits, "fonts": len(self.fonts)}
+
+
+# One cache per process shared by all screens
+text_cache = TextCache()
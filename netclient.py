@@ -0,0 +1,57 @@
+""" Thin client connecting the pygame front-end to a game server (see server.py) """
+
+import json
+import socket
+import threading
+
+import pygame
+
+
+# Posted for every message of the server, with the message in event.message
+NETWORK_EVENT = pygame.USEREVENT + 1
+
+
+class NetworkClient:
+	""" Sends the moves of the local player and posts the messages of the server as pygame
+	events, so the scheduler wakes up for them like for any other input """
+	def __init__(self, host, port):
+		self.sock = socket.create_connection((host, port))
+		self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+		self.reader = self.sock.makefile("rb")
+		self.color = None
+		self.game = None
+		threading.Thread(target=self.receive, daemon=True).start()
+
+	def send(self, message):
+		self.sock.sendall(json.dumps(message).encode() + b"\n")
+
+	def new_game(self, clock=None, mode=None):
+		""" Starts a game, with clocks if a time control like '5+3' is given """
+		message = {"type": "new"}
+		if clock:
+			message["clock"] = clock
+			if mode:
+				message["mode"] = mode
+		self.send(message)
+
+	def join(self, game_id):
+		self.send({"type": "join", "game": game_id})
+
+	def send_move(self, uci):
+		self.send({"type": "move", "move": uci})
+
+	def rematch(self):
+		self.send({"type": "rematch"})
+
+	def receive(self):
+		""" Reads the messages of the server until the connection is closed """
+		for line in self.reader:
+			message = json.loads(line)
+			if message["type"] == "joined":
+				self.color = message["color"]
+				self.game = message["game"]
+			pygame.event.post(pygame.event.Event(NETWORK_EVENT, message=message))
+		pygame.event.post(pygame.event.Event(NETWORK_EVENT, message={"type": "closed"}))
+
+	def close(self):
+		self.sock.close()
@@ -0,0 +1,108 @@
+import pygame
+
+from fonts import text_cache
+from sprites import get_image
+
+
+SQUARE_WIDTH = 65
+# Top left corner of the a8 square and of the board image on the screen
+BOARD_ORIGIN = (300, 65)
+BOARD_IMAGE_ORIGIN = (260, 25)
+BACKGROUND_COLOR = (255, 255, 255)
+
+
+class BoardRenderer:
+	""" Retained-mode renderer of the chess board. It remembers what was drawn on every
+	square and redraws (and updates on the screen) only the squares that changed """
+	def __init__(self, board_image):
+		self.board_image = board_image
+		self.drawn = [None] * 64
+		self.dirty = True
+		self.full_redraw = True
+
+	def invalidate(self, full=False):
+		""" Marks the board as possibly changed, so that the next draw compares the squares.
+		A full invalidation repaints the whole screen (after another screen was shown) """
+		self.dirty = True
+		self.full_redraw = self.full_redraw or full
+
+	def square_rect(self, index):
+		row, col = divmod(index, 8)
+		return pygame.Rect(BOARD_ORIGIN[0] + col*SQUARE_WIDTH, BOARD_ORIGIN[1] + row*SQUARE_WIDTH,
+			SQUARE_WIDTH, SQUARE_WIDTH)
+
+	def draw_square(self, surface, index, state):
+		""" Draws the board background, the piece and the highlight border of one square """
+		rect = self.square_rect(index)
+		area = rect.move(-BOARD_IMAGE_ORIGIN[0], -BOARD_IMAGE_ORIGIN[1])
+		surface.blit(self.board_image, rect.topleft, area)
+
+		img_file_name, highlight_color = state
+		if img_file_name:
+			surface.blit(get_image(img_file_name), rect.topleft)
+		if highlight_color:
+			pygame.draw.rect(surface, highlight_color,
+				(rect.x+2, rect.y+2, SQUARE_WIDTH-3, SQUARE_WIDTH-3), width=4)
+		return rect
+
+	def draw(self, surface, square_states):
+		""" Takes a function returning the (image name, highlight color) of all 64 squares
+		and redraws the squares whose state changed. Does nothing if it was not invalidated """
+		if not self.dirty:
+			return []
+		self.dirty = False
+
+		if self.full_redraw:
+			surface.fill(BACKGROUND_COLOR)
+			surface.blit(self.board_image, BOARD_IMAGE_ORIGIN)
+			self.drawn = [None] * 64
+
+		dirty_rects = []
+		for index, state in enumerate(square_states()):
+			if state != self.drawn[index]:
+				self.drawn[index] = state
+				dirty_rects.append(self.draw_square(surface, index, state))
+
+		if self.full_redraw:
+			self.full_redraw = False
+			pygame.display.update()
+		elif dirty_rects:
+			pygame.display.update(dirty_rects)
+		return dirty_rects
+
+
+# Centers of the clocks of black (top) and white (bottom), right of the board
+CLOCK_CENTERS = {"black": (990, 100), "white": (990, 550)}
+CLOCK_SIZE = (170, 60)
+CLOCK_COLORS = {True: ((0, 0, 0), (255, 255, 255)), False: ((200, 200, 200), (0, 0, 0))}
+
+
+class ClockRenderer:
+	""" Retained-mode renderer of the two chess clocks. A clock is redrawn only when its text
+	or whether it runs changed, so a running clock costs one small update per second """
+	def __init__(self):
+		self.drawn = {}
+
+	def invalidate(self):
+		""" Forgets what was drawn (after the whole screen was repainted) """
+		self.drawn = {}
+
+	def draw(self, surface, clocks):
+		""" Takes {color: (text, running)} and redraws the clocks that changed """
+		dirty_rects = []
+		for color, state in clocks.items():
+			if self.drawn.get(color) == state:
+				continue
+			self.drawn[color] = state
+			text, running = state
+			background, foreground = CLOCK_COLORS[running]
+			rect = pygame.Rect((0, 0), CLOCK_SIZE)
+			rect.center = CLOCK_CENTERS[color]
+			pygame.draw.rect(surface, background, rect)
+			pygame.draw.rect(surface, (0, 0, 0), rect, width=2)
+			rendered = text_cache.render(text, 40, foreground)
+			surface.blit(rendered, rendered.get_rect(center=rect.center))
+			dirty_rects.append(rect)
+		if dirty_rects:
+			pygame.display.update(dirty_rects)
+		return dirty_rects
@@ -0,0 +1,68 @@
+import pygame
+import sys
+import time
+
+from chesscore.profiling import Histogram
+
+
+DEFAULT_FPS = 60
+
+
+class EventScheduler:
+	""" Event loop shared by all screens of the game. Instead of spinning on the event queue
+	it sleeps in pygame.event.wait until something happens, and never runs more frames
+	per second than the fps cap (0 means no cap) """
+	def __init__(self, fps=DEFAULT_FPS):
+		self.fps = fps
+		self.clock = pygame.time.Clock()
+		self.frame_start = None
+		self.frames = 0
+		self.busy_time = 0.0
+		self.max_frame_time = 0.0
+		self.idle_time = 0.0
+		self.frame_times = Histogram()
+
+	def wait(self, timeout=0):
+		""" Blocks until at least one event arrives (or timeout milliseconds pass, if given)
+		and returns all pending events. Quits the game if the window is closed """
+		now = time.perf_counter()
+		if self.frame_start is not None:
+			# Time spent handling the previous batch of events and drawing the frame
+			frame_time = now - self.frame_start
+			self.frames += 1
+			self.busy_time += frame_time
+			self.max_frame_time = max(self.max_frame_time, frame_time)
+			self.frame_times.add(frame_time)
+
+		if self.fps:
+			self.clock.tick(self.fps)
+		event = pygame.event.wait(timeout) if timeout else pygame.event.wait()
+		events = [event] + pygame.event.get()
+
+		self.frame_start = time.perf_counter()
+		self.idle_time += self.frame_start - now
+
+		for event in events:
+			if event.type == pygame.QUIT:
+				self.quit()
+		return [event for event in events if event.type != pygame.NOEVENT]
+
+	def quit(self):
+		pygame.quit()
+		sys.exit()
+
+	def stats(self):
+		""" Per-frame timing stats in milliseconds """
+		return {
+			"frames": self.frames,
+			"avg_frame_ms": 1000 * self.busy_time / self.frames if self.frames else 0.0,
+			"p50_frame_ms": 1000 * self.frame_times.percentile(0.5),
+			"p99_frame_ms": 1000 * self.frame_times.percentile(0.99),
+			"max_frame_ms": 1000 * self.max_frame_time,
+			"idle_ms": 1000 * self.idle_time,
+		}
+
+	def report(self):
+		stats = self.stats()
+		return "{frames} frames, {avg_frame_ms:.2f} ms avg, {p50_frame_ms:.2f} ms p50, {p99_frame_ms:.2f} ms p99, " \
+			"{max_frame_ms:.2f} ms max, {idle_ms:.0f} ms idle".format(**stats)
@@ -0,0 +1,393 @@
+""" Asyncio game server hosting many games of chess
+
+	python server.py --host 127.0.0.1 --port 8765 [--workers 4]
+
+Clients talk newline-delimited JSON over TCP. A client sends
+	{"type": "new"}                          to start a game (playing white)
+	{"type": "new", "clock": "5+3"}          to start a game with clocks (minutes+increment,
+	                                         "mode": "fischer", "bronstein" or "sudden-death")
+	{"type": "join", "game": 1}              to join a game (taking the free color)
+	{"type": "move", "move": "e2e4"}         to play a move in UCI notation
+	{"type": "rematch"}                      to start over once the game is over
+	{"type": "stats"}                        to get the server stats
+and receives "joined" messages with the full game, "update" messages with the state diff after
+every move (the move, the changed squares, turn, check, result and clocks) and "error" messages.
+When a flag falls the players get an update without a move, with the result and "timed_out".
+A player leaving a running game loses it: the opponent gets an update with "abandoned".
+The flags of all games are watched by one timer heap.
+
+With --workers the games are sharded over worker processes by game id (see shards.py),
+otherwise they are played in the server process. --profile (or CHESS_PROFILE) times the rules
+hot paths of the server process, see chesscore/profiling.py.
+"""
+
+import argparse
+import asyncio
+import collections
+import itertools
+import json
+import time
+
+from chesscore import Position, square_name, flag_result, COLOR_NAMES
+from chesscore.bitboard import FEN_PIECES
+from chesscore.clock import TimeControl, ChessClock, TimerHeap, FISCHER
+from chesscore.profiling import profiler, configure as configure_profiling
+from shards import ShardPool, MoveError, new_game, end_game, play_move
+
+
+# Latencies kept for the percentiles of the stats
+LATENCY_SAMPLES = 100000
+
+
+def square_diff(before, after):
+	""" Squares whose piece changed between two mailboxes, as {square name: FEN letter or None} """
+	changes = {}
+	for square, (old, new) in enumerate(zip(before, after)):
+		if old != new:
+			if new:
+				char = FEN_PIECES[(new & 7) - 1]
+				changes[square_name(square)] = char if new >> 3 else char.upper()
+			else:
+				changes[square_name(square)] = None
+	return changes
+
+
+class GameSession:
+	""" One game hosted by the server and the connections of its players. The game itself
+	is played by the shard; the session keeps what the clients are sent: the packed position,
+	the moves and the state after the last move """
+	__slots__ = ("id", "players", "packed", "moves", "turn", "check", "result",
+		"control", "clock", "timer", "timed_out", "abandoned")
+
+	def __init__(self, game_id, control=None):
+		self.id = game_id
+		self.players = {}
+		self.control = control
+		self.timer = None
+
+	def reset(self, packed):
+		self.packed = packed
+		self.moves = []
+		self.turn = "white"
+		self.check = False
+		self.result = None
+		self.clock = ChessClock(self.control) if self.control else None
+		self.timed_out = None
+		self.abandoned = None
+
+	def free_color(self):
+		for color in ("white", "black"):
+			if color not in self.players:
+				return color
+		return None
+
+	def snapshot(self, color=None):
+		""" The full state of the game, sent when a player joins """
+		return {
+			"type": "joined",
+			"game": self.id,
+			"color": color,
+			"fen": Position.unpack(self.packed).fen(),
+			"moves": list(self.moves),
+			"turn": self.turn,
+			"result": self.result,
+			"clock": self.clock.state() if self.clock else None,
+			"timed_out": self.timed_out,
+			"abandoned": self.abandoned,
+		}
+
+	def update(self, text, packed, turn, check, result):
+		""" Records a move played by the shard and returns the update sent to the players """
+		# The first 64 bytes of a packed position are its mailbox
+		changes = square_diff(self.packed[:64], packed[:64])
+		self.packed = packed
+		self.moves.append(text)
+		self.turn, self.check, self.result = turn, check, result
+		return {
+			"type": "update",
+			"game": self.id,
+			"move": text,
+			"changes": changes,
+			"turn": turn,
+			"check": check,
+			"result": result,
+			"clock": self.clock.state() if self.clock else None,
+		}
+
+	def time_out(self):
+		""" Ends the game on time and returns the update sent to the players """
+		color = self.clock.running
+		self.clock.stop()
+		self.result = flag_result(Position.unpack(self.packed), color)
+		self.timed_out = COLOR_NAMES[color]
+		return {
+			"type": "update",
+			"game": self.id,
+			"move": None,
+			"changes": {},
+			"turn": self.turn,
+			"check": self.check,
+			"result": self.result,
+			"clock": self.clock.state(),
+			"timed_out": self.timed_out,
+		}
+
+	def abandon(self, color):
+		""" Ends the game because the player of the given color left it and returns the update
+		sent to the opponent """
+		if self.clock:
+			self.clock.stop()
+		self.result = "black" if color == "white" else "white"
+		self.abandoned = color
+		return {
+			"type": "update",
+			"game": self.id,
+			"move": None,
+			"changes": {},
+			"turn": self.turn,
+			"check": self.check,
+			"result": self.result,
+			"clock": self.clock.state() if self.clock else None,
+			"abandoned": color,
+		}
+
+
+class Connection:
+	""" A client connection and the game it plays in """
+	__slots__ = ("reader", "writer", "session", "color")
+
+	def __init__(self, reader, writer):
+		self.reader = reader
+		self.writer = writer
+		self.session = None
+		self.color = None
+
+	def send(self, message):
+		self.writer.write(json.dumps(message).encode() + b"\n")
+
+
+class ChessServer:
+	""" Hosts any number of concurrent games; all moves are validated with chesscore,
+	in the worker processes of the shard pool if it has any """
+	def __init__(self, workers=0):
+		self.pool = ShardPool(workers)
+		self.sessions = {}
+		self.game_ids = itertools.count(1)
+		self.moves = 0
+		self.latencies = collections.deque(maxlen=LATENCY_SAMPLES)
+		self.started = time.monotonic()
+		# Flags of the clocks of all games
+		self.timers = TimerHeap()
+		self.timers_changed = None
+		self.timer_task = None
+
+	async def new_session(self, control=None):
+		session = GameSession(next(self.game_ids), control)
+		session.reset(await self.pool.call(session.id, new_game, session.id))
+		self.sessions[session.id] = session
+		return session
+
+	async def handle_message(self, connection, message):
+		""" Handles one message of a client """
+		if not isinstance(message, dict):
+			raise MoveError("a message must be a JSON object")
+		kind = message.get("type")
+		session = connection.session
+
+		if kind == "new":
+			control = None
+			if message.get("clock"):
+				control = TimeControl.parse(str(message["clock"]), message.get("mode", FISCHER))
+			self.leave(connection)
+			session = await self.new_session(control)
+			self.seat(connection, session, "white")
+		elif kind == "join":
+			game_id = message.get("game")
+			session = self.sessions.get(game_id) if isinstance(game_id, int) else None
+			if session is None:
+				raise MoveError("no such game")
+			color = session.free_color()
+			if color is None:
+				raise MoveError("the game is full")
+			self.leave(connection)
+			self.seat(connection, session, color)
+			self.start_clock(session)
+		elif kind == "move":
+			if session is None:
+				raise MoveError("not in a game")
+			if session.clock and session.clock.flagged() is not None:
+				self.flag(session)
+			if session.result:
+				raise MoveError("the game is over")
+			if len(session.players) < 2:
+				# The clock only starts once both players are seated
+				raise MoveError("waiting for the opponent")
+			text = str(message.get("move"))
+			start = time.perf_counter()
+			state = await self.pool.call(session.id, play_move, session.id, connection.color, text)
+			self.latencies.append(time.perf_counter() - start)
+			if session.result:
+				# The flag fell while the move was validated
+				raise MoveError("the game is over")
+			if session.clock:
+				if state[3]:
+					session.clock.stop()
+				else:
+					session.clock.press()
+			update = session.update(text, *state)
+			self.arm_flag(session)
+			self.moves += 1
+			self.broadcast(session, update)
+		elif kind == "rematch":
+			if session is None:
+				raise MoveError("not in a game")
+			if session.result:
+				session.reset(await self.pool.call(session.id, new_game, session.id))
+				self.start_clock(session)
+			connection.send(session.snapshot(connection.color))
+		elif kind == "stats":
+			connection.send(dict(type="stats", **self.stats()))
+		else:
+			raise MoveError(f"unknown message type {kind!r}")
+
+	def broadcast(self, session, message):
+		for player in session.players.values():
+			player.send(message)
+
+	def start_clock(self, session):
+		""" Starts the clock of the side to move once both players are seated """
+		clock = session.clock
+		if clock and clock.running is None and not session.result and len(session.players) == 2:
+			clock.start(COLOR_NAMES.index(session.turn))
+			self.arm_flag(session)
+
+	def arm_flag(self, session):
+		""" Schedules the fall of the flag of the running clock of a game """
+		self.timers.cancel(session.timer)
+		session.timer = None
+		if session.clock and session.clock.running is not None:
+			session.timer = self.timers.schedule(session.clock.flag_time(), self.flag, session)
+			if self.timers_changed:
+				self.timers_changed.set()
+
+	def flag(self, session):
+		""" Called when the flag of a game falls: adjudicates the game and tells the players """
+		self.timers.cancel(session.timer)
+		session.timer = None
+		if session.result or not session.clock or session.id not in self.sessions:
+			return
+		if session.clock.flagged() is None:
+			# Woken up a bit early
+			self.arm_flag(session)
+			return
+		self.broadcast(session, session.time_out())
+
+	async def run_timers(self):
+		""" Sleeps until the next deadline of the timer heap (or a new timer) and runs the timers due """
+		self.timers_changed = asyncio.Event()
+		while True:
+			deadline = self.timers.next_deadline()
+			timeout = None if deadline is None else max(0, deadline - time.monotonic())
+			try:
+				await asyncio.wait_for(self.timers_changed.wait(), timeout)
+			except asyncio.TimeoutError:
+				pass
+			self.timers_changed.clear()
+			self.timers.run(time.monotonic())
+
+	def seat(self, connection, session, color):
+		session.players[color] = connection
+		connection.session = session
+		connection.color = color
+		connection.send(session.snapshot(color))
+
+	def leave(self, connection):
+		""" Removes a player from their game, and the game once nobody plays it. A player
+		leaving a running game loses it """
+		session = connection.session
+		if session is None:
+			return
+		seated = session.players.pop(connection.color, None) is connection
+		if not session.players and self.sessions.pop(session.id, None):
+			self.timers.cancel(session.timer)
+			if self.pool.executors:
+				self.pool.submit(session.id, end_game, session.id)
+			else:
+				end_game(session.id)
+		elif seated and session.result is None:
+			self.timers.cancel(session.timer)
+			session.timer = None
+			self.broadcast(session, session.abandon(connection.color))
+		connection.session = None
+		connection.color = None
+
+	async def handle_client(self, reader, writer):
+		connection = Connection(reader, writer)
+		try:
+			while True:
+				line = await reader.readline()
+				if not line:
+					break
+				try:
+					await self.handle_message(connection, json.loads(line))
+				except (MoveError, ValueError) as error:
+					connection.send({"type": "error", "message": str(error)})
+				await writer.drain()
+		except ConnectionError:
+			pass
+		finally:
+			self.leave(connection)
+			writer.close()
+
+	def stats(self):
+		""" Number of games, moves per second and move validation latency percentiles (ms), and the
+		profiling numbers of the server process when profiling is on """
+		latencies = sorted(self.latencies)
+		def percentile(p):
+			return 1000 * latencies[min(len(latencies) - 1, int(p * len(latencies)))] if latencies else 0.0
+		stats = {
+			"games": len(self.sessions),
+			"moves": self.moves,
+			"moves_per_second": self.moves / (time.monotonic() - self.started),
+			"p50_ms": percentile(0.5),
+			"p99_ms": percentile(0.99),
+		}
+		if profiler.enabled:
+			stats["profile"] = profiler.to_json()
+		return stats
+
+	async def start(self, host, port):
+		self.timer_task = asyncio.create_task(self.run_timers())
+		return await asyncio.start_server(self.handle_client, host, port)
+
+
+async def serve(host, port, workers):
+	chess_server = ChessServer(workers)
+	server = await chess_server.start(host, port)
+	print("Serving chess on", ", ".join(str(sock.getsockname()) for sock in server.sockets))
+	try:
+		async with server:
+			await server.serve_forever()
+	finally:
+		chess_server.pool.close()
+
+
+def main():
+	parser = argparse.ArgumentParser(description="Multiplayer chess server")
+	parser.add_argument("--host", default="127.0.0.1")
+	parser.add_argument("--port", type=int, default=8765)
+	parser.add_argument("--workers", type=int, default=0,
+		help="worker processes the games are sharded over (0: play in the server process)")
+	parser.add_argument("--profile", metavar="PATH", nargs="?", const="-",
+		help="time the rules hot paths of the server process and write the numbers on exit to PATH "
+		"(.json or .prof), or print them without PATH; also sent with the stats")
+	args = parser.parse_args()
+	configure_profiling(args.profile)
+	try:
+		asyncio.run(serve(args.host, args.port, args.workers))
+	except KeyboardInterrupt:
+		pass
+
+
+if __name__ == "__main__":
+	main()
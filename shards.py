@@ -0,0 +1,125 @@
+""" Sharding of the games of the server over worker processes
+
+Every game lives in one worker process, chosen by game id, so the CPU-bound rules of
+different games run on different cores while the server process only does the I/O.
+Positions cross the process boundary packed in 72 bytes (Position.pack) instead of as
+pickled Piece objects, and moves as UCI strings.
+"""
+
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from chesscore import Game
+
+
+class MoveError(Exception):
+	pass
+
+
+# Games of this process: all games without workers, the games of the shard in a worker
+_games = {}
+
+
+def new_game(game_id):
+	""" Starts a game over and returns the packed initial position """
+	game = _games[game_id] = Game(with_board=False)
+	return game.position.pack()
+
+
+def end_game(game_id):
+	_games.pop(game_id, None)
+
+
+def play_move(game_id, color, text):
+	""" Validates and plays a move of the player of the given color; the check, checkmate
+	and draw detection after the move runs here too. Returns (packed position, turn, check, result) """
+	game = _games.get(game_id)
+	if game is None:
+		raise MoveError("no such game")
+	if game.result:
+		raise MoveError("the game is over")
+	if color != game.player_turn:
+		raise MoveError("not your turn")
+	move = game.find_uci(text)
+	if move is None:
+		raise MoveError(f"illegal move {text}")
+	game.make_move(move)
+	return game.position.pack(), game.player_turn, game.state.in_check, game.result
+
+
+def run_batch(calls):
+	""" Runs a batch of (function, args) calls in a worker; returns (ok, result or exception) pairs """
+	results = []
+	for function, args in calls:
+		try:
+			results.append((True, function(*args)))
+		except Exception as error:
+			results.append((False, error))
+	return results
+
+
+class ShardPool:
+	""" One single-process executor per shard, so that all calls for a game run in order in
+	the process that holds the game. The calls made for a shard in the same iteration of
+	the event loop are sent to it as one batch, which keeps the cost of crossing the process
+	boundary low under load. With no workers the calls run in the current process """
+	def __init__(self, workers=None):
+		if workers is None:
+			workers = os.cpu_count() or 1
+		# Spawned rather than forked, so the workers do not inherit the sockets of the server
+		context = multiprocessing.get_context("spawn")
+		self.executors = [ProcessPoolExecutor(max_workers=1, mp_context=context) for i in range(workers)]
+		self.pending = [[] for executor in self.executors]
+		# Starts the workers now instead of on the first move
+		for executor in self.executors:
+			executor.submit(os.getpid).result()
+
+	def __len__(self):
+		return len(self.executors)
+
+	def shard(self, game_id):
+		return game_id % len(self.executors)
+
+	def submit(self, game_id, function, *args):
+		""" Queues function(*args) for the shard of the game and returns an asyncio future """
+		loop = asyncio.get_running_loop()
+		future = loop.create_future()
+		pending = self.pending[self.shard(game_id)]
+		if not pending:
+			loop.call_soon(self.flush, self.shard(game_id))
+		pending.append((future, function, args))
+		return future
+
+	def flush(self, shard):
+		""" Sends the queued calls of a shard to its worker as one batch """
+		batch = self.pending[shard]
+		self.pending[shard] = []
+		calls = [(function, args) for future, function, args in batch]
+		done = asyncio.wrap_future(self.executors[shard].submit(run_batch, calls))
+
+		def resolve(done):
+			error = done.exception()
+			for index, (future, function, args) in enumerate(batch):
+				if future.cancelled():
+					continue
+				if error is not None:
+					future.set_exception(error)
+				else:
+					ok, value = done.result()[index]
+					if ok:
+						future.set_result(value)
+					else:
+						future.set_exception(value)
+		done.add_done_callback(resolve)
+
+	async def call(self, game_id, function, *args):
+		""" Runs function(*args) in the shard of the game without blocking the event loop """
+		if not self.executors:
+			return function(*args)
+		return await self.submit(game_id, function, *args)
+
+	def close(self):
+		for executor in self.executors:
+			executor.shutdown(cancel_futures=True)
@@ -0,0 +1,75 @@
+import pygame
+
+
+IMAGE_DIR = "images/"
+PIECE_IMAGES = [f"{color}_{name}.png" for color in ("white", "black")
+	for name in ("king", "queen", "rook", "bishop", "knight", "pawn")]
+BOARD_IMAGE = "chess_board.jpg"
+ICON_IMAGE = "chess_icon.png"
+
+
+class SpriteCache:
+	""" Loads every image of the game from the disk once and keeps the converted
+	surfaces in memory, so that all display paths only blit from memory """
+	def __init__(self, use_atlas=True):
+		self.use_atlas = use_atlas
+		self.atlas = None
+		self.sprites = {}
+		self.disk_loads = 0
+		self.hits = 0
+
+	def load_image(self, img_file_name):
+		""" Reads an image from the disk and converts it for fast blitting """
+		self.disk_loads += 1
+		image = pygame.image.load(IMAGE_DIR + img_file_name)
+		return image.convert_alpha()
+
+	def load_all(self):
+		""" Loads the 12 piece images, the board and the icon (needs an initialized display) """
+		if self.sprites:
+			return
+		pieces = [self.load_image(name) for name in PIECE_IMAGES]
+
+		if self.use_atlas:
+			# Packs all piece images side by side in a single surface and
+			# keeps a subsurface of the atlas for each piece
+			width = sum(image.get_width() for image in pieces)
+			height = max(image.get_height() for image in pieces)
+			self.atlas = pygame.Surface((width, height), pygame.SRCALPHA).convert_alpha()
+			x = 0
+			for name, image in zip(PIECE_IMAGES, pieces):
+				self.atlas.blit(image, (x, 0))
+				self.sprites[name] = self.atlas.subsurface((x, 0, image.get_width(), image.get_height()))
+				x += image.get_width()
+		else:
+			self.sprites.update(zip(PIECE_IMAGES, pieces))
+
+		self.sprites[BOARD_IMAGE] = self.load_image(BOARD_IMAGE)
+		self.sprites[ICON_IMAGE] = self.load_image(ICON_IMAGE)
+
+	def get(self, img_file_name):
+		""" Returns the cached surface of the image, loading it only if it was never loaded before """
+		image = self.sprites.get(img_file_name)
+		if image is None:
+			image = self.sprites[img_file_name] = self.load_image(img_file_name)
+		else:
+			self.hits += 1
+		return image
+
+	def stats(self):
+		""" Returns the number of images read from the disk and the number of blits served from memory """
+		return {"disk_loads": self.disk_loads, "cache_hits": self.hits, "atlas": self.atlas is not None}
+
+
+# One cache per process shared by all boards
+sprite_cache = SpriteCache()
+
+
+def get_image(img_file_name):
+	""" Returns the in-memory surface of an image from the shared sprite cache """
+	return sprite_cache.get(img_file_name)
+
+
+def disk_load_count():
+	""" Number of images loaded from the disk by this process (14 once the cache is warm) """
+	return sprite_cache.disk_loads
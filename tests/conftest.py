@@ -0,0 +1,49 @@
+import os
+import sys
+
+# The tests import chesscore and the front-end modules from the repository root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from chesscore.bitboard import Position, parse_square, move_uci
+from chesscore.constants import WHITE, BLACK
+from chesscore.game import Game
+
+
+def make_position(pieces, turn=WHITE, halfmove_clock=0, castling=0, ep_square=None):
+	""" A Position with the pieces given like "Ke1 ke8 Ra1": the letter of the piece, upper
+	case for white, followed by its square. ep_square is the name of the en passant square """
+	position = Position()
+	for piece in pieces.split():
+		color = BLACK if piece[0].islower() else WHITE
+		position.put(parse_square(piece[1:]), color, "PNBRQK".index(piece[0].upper()))
+	position.turn = turn
+	position.halfmove_clock = halfmove_clock
+	position.castling = castling
+	position.ep_square = None if ep_square is None else parse_square(ep_square)
+	position.rehash()
+	return position
+
+
+def play(position, *moves):
+	""" Plays moves written in UCI notation on a Position and returns it """
+	for text in moves:
+		position.make_move(next(move for move in position.legal_moves() if move_uci(move) == text))
+	return position
+
+
+def random_moves(rng, position, plies):
+	""" Plays up to plies random legal moves on a Position, yielding it after every move """
+	for ply in range(plies):
+		moves = position.legal_moves()
+		if not moves:
+			return
+		position.make_move(rng.choice(moves))
+		yield position
+
+
+def random_game(rng, plies, fen=None):
+	""" A Game of random moves, played until it is over or has plies moves """
+	game = Game(with_board=False, fen=fen)
+	while not game.result and len(game.moves) < plies:
+		game.make_move(rng.choice(game.state.moves))
+	return game
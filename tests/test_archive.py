@@ -0,0 +1,78 @@
+""" Binary game archive: appending, random access and position queries """
+
+import io
+import random
+
+import pytest
+
+from chesscore.archive import Archive
+from chesscore.bitboard import Position
+from chesscore.pgn import read_games, write_pgn
+from conftest import random_game
+
+
+@pytest.fixture
+def games():
+	rng = random.Random(3)
+	games = [random_game(rng, 60) for i in range(8)]
+	games.append(random_game(rng, 30, "r3k2r/8/8/8/8/8/8/R3K2R w KQkq - 0 1"))
+	return games
+
+
+def test_games_read_back(tmp_path, games):
+	path = str(tmp_path / "games.chs")
+	with Archive(path) as archive:
+		for game in games:
+			archive.append_game(game)
+	with Archive(path) as archive:
+		assert len(archive) == len(games)
+		for number, game in enumerate(games):
+			assert list(archive.moves(number)) == game.moves
+			assert archive.result(number) == game.result
+			assert archive.position(number) == game.position
+			assert archive.start_position(number) == Position.from_fen(game.start_fen)
+		with pytest.raises(IndexError):
+			archive.moves(len(games))
+
+
+def test_position_queries(tmp_path, games):
+	path = str(tmp_path / "games.chs")
+	with Archive(path) as archive:
+		for game in games[:5]:
+			archive.append_game(game)
+		archive.build_index()
+		# Games appended after the index was built are found too
+		for game in games[5:]:
+			archive.append_game(game)
+
+		# Every game reaches the start position, all but the last one from the standard start
+		assert [game for game, ply in archive.games_with(Position.start())] == list(range(len(games) - 1))
+		for number, game in enumerate(games):
+			ply = len(game.moves) // 2
+			position = archive.position(number, ply)
+			assert (number, ply) in archive.games_with(position)
+			for found, found_ply in archive.games_with(position):
+				assert archive.position(found, found_ply) == position
+		assert archive.games_with(Position.from_fen("8/8/8/8/8/2k5/8/K7 w - - 0 1")) == []
+
+
+def test_illegal_move_is_rejected(tmp_path):
+	with Archive(str(tmp_path / "games.chs")) as archive:
+		with pytest.raises(ValueError):
+			archive.append([0])
+		assert len(archive) == 0
+
+
+def test_import_from_pgn(tmp_path, games):
+	text = "\n".join(write_pgn(game) for game in games)
+	with Archive(str(tmp_path / "games.chs")) as archive:
+		for game in read_games(io.StringIO(text)):
+			archive.append_game(game)
+		assert [list(archive.moves(number)) for number in range(len(archive))] == [game.moves for game in games]
+
+
+def test_not_an_archive(tmp_path):
+	path = tmp_path / "other.bin"
+	path.write_bytes(b"something else")
+	with pytest.raises(ValueError):
+		Archive(str(path))
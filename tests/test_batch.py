@@ -0,0 +1,64 @@
+""" Batch analysis of packed positions, against the analysis of the positions one by one """
+
+import random
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from chesscore.archive import RESULT_CODES
+from chesscore.attacks import attacked_squares
+from chesscore.batch import analyse, pack_positions, load_packed
+from chesscore.bitboard import Position
+from chesscore.evaluation import evaluate
+from chesscore.gamestate import GameState
+from conftest import random_moves
+
+
+# Checkmate, stalemate, dead positions, fifty moves, en passant and castling
+SPECIAL_FENS = (
+	"rnb1kbnr/pppp1ppp/8/4p3/6Pq/5P2/PPPPP2P/RNBQKBNR w KQkq - 1 3",
+	"7k/5Q2/6K1/8/8/8/8/8 b - - 0 1",
+	"8/8/8/4k3/8/2b5/8/3BK3 w - - 0 1",
+	"8/8/8/4k3/8/3b4/8/3BK3 w - - 0 1",
+	"8/8/8/4k3/8/8/8/3RK3 w - - 100 80",
+	"4k3/8/8/3pP3/8/8/8/4K3 w - d6 0 2",
+	"r3k2r/8/8/8/8/8/8/R3K2R b KQkq - 0 1",
+)
+
+
+def sample_positions(count):
+	rng = random.Random(9)
+	positions = [Position.from_fen(fen) for fen in SPECIAL_FENS]
+	while len(positions) < count:
+		positions.extend(position.copy() for position in random_moves(rng, Position.start(), 150))
+	return positions[:count]
+
+
+def test_analysis_matches_the_positions():
+	positions = sample_positions(3000)
+	# Chunks smaller than the batch
+	analysis = analyse(pack_positions(positions), chunk_size=1000)
+	assert len(analysis) == len(positions)
+	results = set()
+	for row, position in enumerate(positions):
+		occupied = position.occupied[0] | position.occupied[1]
+		assert int(analysis.white_attacks[row]) == attacked_squares(position, 0, occupied)
+		assert int(analysis.black_attacks[row]) == attacked_squares(position, 1, occupied)
+		state = GameState(position)
+		assert bool(analysis.in_check[row]) == state.in_check
+		assert int(analysis.score[row]) == evaluate(position)
+		assert analysis.result[row] == RESULT_CODES[state.result]
+		results.add(state.result)
+	assert {None, "black", "stalemate", "normal-draw", "50-move"} <= results
+
+
+def test_memory_mapped_positions(tmp_path):
+	positions = sample_positions(200)
+	packed = pack_positions(positions)
+	path = str(tmp_path / "positions.bin")
+	packed.tofile(path)
+	mapped = load_packed(path)
+	assert mapped.shape == (200, 72)
+	assert Position.unpack(mapped[10].tobytes()) == positions[10]
+	assert np.array_equal(analyse(mapped).score, analyse(packed).score)
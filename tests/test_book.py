@@ -0,0 +1,81 @@
+""" Opening book: compiling PGN games and probing the book """
+
+import random
+
+import pytest
+
+from chesscore.bitboard import Position, move_uci
+from chesscore.book import OpeningBook, compile_book, HEADER, ENTRY
+from chesscore.game import Game
+from chesscore.pgn import write_pgn
+
+
+def play(game, *moves):
+	for text in moves:
+		game.make_move(game.find_uci(text))
+	return game
+
+
+@pytest.fixture
+def book_path(tmp_path):
+	games = [
+		(("e2e4", "e7e5", "g1f3"), "white"),
+		(("e2e4", "e7e5", "f1c4"), "white"),
+		(("e2e4", "c7c5"), "black"),
+		(("d2d4", "d7d5"), "normal-draw"),
+	]
+	texts = [write_pgn(play(Game(with_board=False), *moves), result=result) for moves, result in games]
+	# A game with a bad FEN tag is skipped
+	texts.append('[SetUp "1"]\n[FEN "not a fen"]\n\n1. e4 *\n')
+	pgn = tmp_path / "games.pgn"
+	pgn.write_text("\n".join(texts))
+	path = str(tmp_path / "book.bin")
+	assert compile_book([str(pgn)], path) == (5, 7)
+	return path
+
+
+def test_probe(book_path):
+	with OpeningBook(book_path) as book:
+		assert len(book) == 7
+		start = Position.start()
+		# e4: two wins and a loss for white (2 + 2 + 0), d4: a draw
+		assert [(move_uci(move), weight, games) for move, weight, games in book.entries(start)] == \
+			[("e2e4", 4, 3), ("d2d4", 1, 1)]
+		assert move_uci(book.best_move(start)) == "e2e4"
+		position = play(Game(with_board=False), "e2e4").position
+		# c5 won for black, e5 lost twice
+		assert [(move_uci(move), weight) for move, weight, games in book.entries(position)] == [("c7c5", 2), ("e7e5", 0)]
+		assert move_uci(book.choose(position)) == "c7c5"
+		assert book.entries(Position.from_fen("8/8/8/8/8/2k5/8/K7 w - - 0 1")) == []
+		assert book.choose(Position.from_fen("8/8/8/8/8/2k5/8/K7 w - - 0 1")) is None
+
+
+def test_choose_follows_the_weights(book_path):
+	rng = random.Random(4)
+	with OpeningBook(book_path) as book:
+		counts = {}
+		for i in range(2000):
+			move = move_uci(book.choose(Position.start(), rng))
+			counts[move] = counts.get(move, 0) + 1
+		assert set(counts) == {"e2e4", "d2d4"}
+		assert 0.7 < counts["e2e4"] / 2000 < 0.9
+
+
+def test_entries_are_sorted(book_path):
+	with OpeningBook(book_path) as book:
+		entries = [ENTRY.unpack_from(book.map, HEADER.size + i * ENTRY.size) for i in range(len(book))]
+	assert entries == sorted(entries, key=lambda entry: (entry[0], -entry[2]))
+
+
+def test_min_games_and_plies(tmp_path, book_path):
+	pgn = str(tmp_path / "games.pgn")
+	path = str(tmp_path / "small.bin")
+	assert compile_book([pgn], path, min_games=2) == (5, 2)
+	assert compile_book([pgn], path, plies=1) == (5, 2)
+
+
+def test_not_a_book(tmp_path):
+	path = tmp_path / "other.bin"
+	path.write_bytes(b"something else entirely")
+	with pytest.raises(ValueError):
+		OpeningBook(str(path))
@@ -0,0 +1,97 @@
+""" Chess clocks and the timer heap, driven by explicit times """
+
+import pytest
+
+from chesscore.bitboard import Position
+from chesscore.clock import TimeControl, ChessClock, TimerHeap, FISCHER, BRONSTEIN, SUDDEN_DEATH
+from chesscore.constants import WHITE, BLACK
+from chesscore.gamestate import flag_result
+
+
+def test_parse_time_control():
+	control = TimeControl.parse("5+3")
+	assert (control.initial, control.increment, control.mode) == (300, 3, FISCHER)
+	assert TimeControl.parse("10").mode == SUDDEN_DEATH
+	assert TimeControl.parse("1+2", BRONSTEIN).mode == BRONSTEIN
+	for text in ("", "x", "5+y", "0", "-1+2"):
+		with pytest.raises(ValueError):
+			TimeControl.parse(text)
+
+
+def test_fischer_increment():
+	clock = ChessClock(TimeControl(60, 2, FISCHER))
+	clock.start(WHITE, now=0)
+	assert clock.press(now=5) == 5
+	assert clock.time_left(WHITE) == 57
+	assert clock.running == BLACK
+	assert clock.time_left(BLACK, now=15) == 50
+	assert clock.display(BLACK, now=15) == "0:50"
+
+
+def test_bronstein_delay_gives_back_at_most_the_increment():
+	clock = ChessClock(TimeControl(60, 3, BRONSTEIN))
+	clock.start(WHITE, now=0)
+	clock.press(now=2)
+	assert clock.time_left(WHITE) == 60
+	clock.press(now=12)
+	assert clock.time_left(BLACK) == 53
+
+
+def test_flag():
+	clock = ChessClock(TimeControl(10, 0, SUDDEN_DEATH))
+	clock.start(WHITE, now=100)
+	assert clock.flag_time() == 110
+	assert clock.flagged(now=109.9) is None
+	assert clock.flagged(now=110) == WHITE
+	assert clock.display(WHITE, now=200) == "0:00"
+
+
+def test_result_on_time():
+	assert flag_result(Position.start(), WHITE) == "black"
+	# The opponent cannot checkmate with a bare king
+	position = Position.from_fen("8/8/8/4k3/8/8/8/3QK3 w - - 0 1")
+	assert flag_result(position, BLACK) == "white"
+	assert flag_result(position, WHITE) == "timeout-draw"
+
+
+def test_next_wakeup_is_the_next_displayed_second():
+	clock = ChessClock(TimeControl(10))
+	clock.start(WHITE, now=0)
+	assert clock.next_wakeup(now=0.25) == pytest.approx(1.0)
+	assert clock.display(WHITE, now=0.25) == "0:10"
+	assert clock.display(WHITE, now=1.0) == "0:09"
+	clock.stop(now=3)
+	assert clock.next_wakeup() is None
+
+
+def test_state_round_trip():
+	clock = ChessClock(TimeControl(180, 2))
+	clock.start(WHITE, now=0)
+	clock.press(now=4)
+	copy = ChessClock(TimeControl(180, 2))
+	copy.set_state(clock.state(now=10), now=10)
+	assert copy.running == BLACK
+	assert copy.time_left(WHITE) == clock.time_left(WHITE)
+	assert copy.time_left(BLACK, now=11) == pytest.approx(clock.time_left(BLACK, now=11))
+
+
+def test_timer_heap():
+	timers = TimerHeap()
+	fired = []
+	timers.schedule(3, fired.append, "c")
+	first = timers.schedule(1, fired.append, "a")
+	timers.schedule(2, fired.append, "b")
+	timers.cancel(first)
+	assert len(timers) == 2
+	assert timers.next_deadline() == 2
+	assert timers.run(2.5) == 1
+	assert timers.run(10) == 1
+	assert fired == ["b", "c"]
+	assert timers.next_deadline() is None
+
+
+def test_press_while_stopped():
+	clock = ChessClock(TimeControl(60, 2))
+	assert clock.press(now=5) == 0
+	assert clock.running is None
+	assert clock.time_left(WHITE) == clock.time_left(BLACK) == 60
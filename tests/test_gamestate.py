@@ -0,0 +1,71 @@
+""" Game results decided by GameState after every move """
+
+import pytest
+
+from chesscore.bitboard import Position, move_to, move_uci
+from chesscore.constants import WHITE, BLACK, KNIGHT
+from chesscore.gamestate import GameState
+from conftest import make_position, play
+
+
+def test_game_goes_on():
+	state = GameState(Position.start())
+	assert state.result is None and not state.is_over and not state.in_check
+	assert len(state.moves) == 20
+
+
+def test_checkmate():
+	position = Position.start()
+	for text in ("f2f3", "e7e5", "g2g4"):
+		play(position, text)
+		assert GameState(position).result is None
+	state = GameState(play(position, "d8h4"))
+	assert state.in_check and not state.moves
+	assert state.result == "black" and state.is_over and not state.is_draw
+
+
+@pytest.mark.parametrize("pieces, turn, halfmove_clock, result", [
+	("Kg6 Qf7 kh8", BLACK, 0, "stalemate"),
+	("Kg6 Ra8 kh8", BLACK, 0, "white"),
+	("Kh1 kh3 ra1", WHITE, 0, "black"),
+	("Ke1 ke5", WHITE, 0, "normal-draw"),
+	("Ke1 Nd1 ke5", BLACK, 0, "normal-draw"),
+	("Ke1 Rd1 ke5", WHITE, 99, None),
+	("Ke1 Rd1 ke5", WHITE, 100, "50-move"),
+	# Checkmate takes precedence over the fifty-move rule
+	("Kg6 Ra8 kh8", BLACK, 100, "white"),
+])
+def test_results(pieces, turn, halfmove_clock, result):
+	state = GameState(make_position(pieces, turn, halfmove_clock))
+	assert state.result == result
+	assert state.is_over == (result is not None)
+	assert state.is_draw == (result not in (None, "white", "black"))
+	assert state.in_check == (result in ("white", "black"))
+
+
+def test_fifty_moves_without_capture_or_pawn_move():
+	position = play(make_position("Ke1 Rd1 ke5", halfmove_clock=99), "d1d2")
+	assert GameState(position).result == "50-move"
+	position = play(make_position("Ke1 Rd1 Pe2 ke5", halfmove_clock=99), "e2e4")
+	assert position.halfmove_clock == 0 and GameState(position).result is None
+
+
+def test_moves_from_a_square():
+	state = GameState(Position.start())
+	# The knight on g1 (square 62) and the pawn on e2 (52)
+	assert sorted(move_to(move) for move in state.moves_from(62)) == [45, 47]
+	assert len(state.moves_from(52)) == 2
+	assert state.moves_from(36) == []
+
+
+def test_moves_grouped_by_square():
+	state = GameState(make_position("Ke1 Pb7 ke8 ra8"))
+	# b7 (square 9) promotes on b8 or captures on a8, to four pieces each
+	targets = state.targets(9)
+	assert sorted(targets) == [0, 1]
+	assert all(len(moves) == 4 for moves in targets.values())
+	# The queen unless another piece is asked for
+	assert move_uci(state.find(9, 1)) == "b7b8q"
+	assert move_uci(state.find(9, 0, KNIGHT)) == "b7a8n"
+	assert state.find(9, 17) is None
+	assert state.targets(10) == {}
@@ -0,0 +1,70 @@
+""" Material signatures and dead positions """
+
+import random
+
+import pytest
+
+from chesscore.bitboard import Position
+from chesscore.constants import WHITE, BLACK, PAWN, KNIGHT, BISHOP, QUEEN
+from chesscore.material import signature, count, is_dead, has_pieces, LIGHT_BISHOPS, DARK_BISHOPS
+from conftest import random_moves
+
+
+def test_signature_follows_the_moves():
+	rng = random.Random(5)
+	for i in range(20):
+		position = Position.start()
+		for position in random_moves(rng, position, 200):
+			assert position.material == signature(position)
+		while position.ply:
+			position.unmake_move()
+			assert position.material == signature(position)
+
+
+def test_counts():
+	material = Position.start().material
+	for color in (WHITE, BLACK):
+		assert count(material, color, PAWN) == 8
+		assert count(material, color, QUEEN) == 1
+		assert count(material, color, BISHOP) == 2
+		assert count(material, color, LIGHT_BISHOPS) == count(material, color, DARK_BISHOPS) == 1
+	# Eight promoted queens
+	material = Position.from_fen("QQQQQQQQ/Q7/8/8/8/8/8/K6k w - - 0 1").material
+	assert count(material, WHITE, QUEEN) == 9
+	assert count(material, WHITE, KNIGHT) == count(material, BLACK, QUEEN) == 0
+
+
+@pytest.mark.parametrize("fen, dead", [
+	("8/8/8/4k3/8/8/8/4K3 w - - 0 1", True),
+	("8/8/8/4k3/8/8/8/3NK3 w - - 0 1", True),
+	("8/8/8/4k3/8/8/8/3BK3 b - - 0 1", True),
+	# Bishops on light squares, on both sides or one
+	("8/8/8/4k3/8/3b4/8/3BK3 w - - 0 1", True),
+	("8/8/8/4k3/8/8/4B3/3BK3 w - - 0 1", True),
+	("8/8/8/4k3/8/8/2B5/3BK3 w - - 0 1", True),
+	# Bishops on squares of different colors
+	("8/8/8/4k3/8/2b5/8/3BK3 w - - 0 1", False),
+	("8/8/8/4k3/8/8/3B4/3BK3 w - - 0 1", False),
+	("8/8/8/4k3/8/8/8/2NNK3 w - - 0 1", False),
+	("8/8/8/4k3/8/2n5/8/3BK3 w - - 0 1", False),
+	("8/8/8/4k3/8/8/4P3/4K3 w - - 0 1", False),
+	("8/8/8/4k3/8/8/8/3RK3 w - - 0 1", False),
+])
+def test_dead_positions(fen, dead):
+	assert is_dead(Position.from_fen(fen).material) == dead
+
+
+def test_has_pieces():
+	material = Position.from_fen("8/8/8/4k3/8/8/8/3NK3 w - - 0 1").material
+	assert has_pieces(material, WHITE)
+	assert not has_pieces(material, BLACK)
+
+
+@pytest.mark.parametrize("fen", [
+	"4k3/pppppppp/8/8/8/8/PPPPPPPP/PPPPPPPK w - - 0 1",
+	"QQQQQQQQ/QQQQQQQQ/8/8/8/8/8/K6k w - - 0 1",
+	"4k3/8/8/8/8/8/PPPPPPPP/NNNK4 w - - 0 1",
+])
+def test_more_pieces_than_a_side_can_have(fen):
+	with pytest.raises(ValueError):
+		Position.from_fen(fen)
@@ -0,0 +1,78 @@
+""" SAN and PGN: writing games and reading them back """
+
+import io
+import random
+
+import pytest
+
+from chesscore.bitboard import Position, move_uci
+from chesscore.game import Game
+from chesscore.notation import move_san, parse_san
+from chesscore.pgn import read_games, write_pgn
+from conftest import random_moves, random_game
+
+
+def test_san_round_trip():
+	rng = random.Random(1)
+	for i in range(6):
+		for position in random_moves(rng, Position.start(), 80):
+			for move in position.legal_moves():
+				assert parse_san(position, move_san(position, move)) == move
+
+
+def test_san_special_moves():
+	position = Position.from_fen("r3k2r/1P6/8/3pP3/8/8/8/R3K2R w KQkq d6 0 1")
+	names = {move_san(position, move) for move in position.legal_moves()}
+	assert {"O-O", "O-O-O", "exd6", "b8=Q+", "bxa8=Q+"} <= names
+	assert move_uci(parse_san(position, "b8=N")) == "b7b8n"
+	with pytest.raises(ValueError):
+		parse_san(position, "Qd4")
+
+
+def test_pgn_round_trip():
+	rng = random.Random(2)
+	games = [random_game(rng, 150) for i in range(10)]
+	games.append(random_game(rng, 40, "r3k2r/8/8/8/8/8/8/R3K2R w KQkq - 0 1"))
+	text = "\n".join(write_pgn(game, {"White": "A \"quoted\" name"}) for game in games)
+	read = list(read_games(io.StringIO(text)))
+	assert len(read) == len(games)
+	for game, found in zip(games, read):
+		assert found.error is None
+		assert found.moves == game.moves
+		assert found.start_fen == game.start_fen
+		assert found.tags["White"] == "A \"quoted\" name"
+		assert found.position() == game.position
+
+
+def test_pgn_comments_and_variations_are_skipped():
+	text = '[Event "x"]\n\n1. e4 {best by test} e5 (1... c5 2. Nf3) 2. Nf3 $1 ; rest\nNc6 1-0\n'
+	game, = read_games(io.StringIO(text))
+	assert [move_uci(move) for move in game.moves] == ["e2e4", "e7e5", "g1f3", "b8c6"]
+	assert game.result == "1-0"
+
+
+@pytest.mark.parametrize("fen", ["not a fen", "4k3/8/8/8/8/8/8/4K3 w Kx - 0 1", "4k3/8/8/8/8/8/8/4K3 w - e 0 1"])
+def test_bad_fen_tag_is_a_game_error(fen):
+	text = f'[SetUp "1"]\n[FEN "{fen}"]\n\n1. e4 *\n'
+	game, = read_games(io.StringIO(text))
+	assert game.error and not game.moves
+
+
+def test_illegal_move_stops_the_replay():
+	game, = read_games(io.StringIO("1. e4 e5 2. Ke3 Nc6 *\n"))
+	assert len(game.moves) == 2
+	assert "ply 3" in game.error
+
+
+def test_game_rejects_bad_fen():
+	with pytest.raises(ValueError):
+		Game(fen="4k3/8/8/8/8/8/8/4K3 w - - zero 1")
+
+
+def test_result_given_to_the_writer():
+	game = Game(with_board=False)
+	game.make_move(game.find_uci("e2e4"))
+	found, = read_games(io.StringIO(write_pgn(game, result="black")))
+	assert found.result == found.tags["Result"] == "0-1"
+	found, = read_games(io.StringIO(write_pgn(game)))
+	assert found.result == "*"
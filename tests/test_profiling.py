@@ -0,0 +1,48 @@
+""" Profiling of the hot paths: counters and histograms, switched on and off """
+
+import json
+
+from chesscore.bitboard import Position
+from chesscore.game import Game
+from chesscore.profiling import Profiler, Histogram, HOT_PATHS
+
+
+def test_histogram_percentiles():
+	histogram = Histogram()
+	for i in range(1, 101):
+		histogram.add(i / 1000)
+	assert histogram.count == 100
+	assert histogram.max == 0.1
+	# Buckets are 19% wide
+	assert 0.050 <= histogram.percentile(0.5) < 0.050 * 1.19
+	assert 0.099 <= histogram.percentile(0.99) <= 0.1
+	assert Histogram().percentile(0.5) == 0.0
+
+
+def test_profiled_move():
+	original = Position.legal_moves
+	profiler = Profiler()
+	profiler.enable()
+	try:
+		assert Position.legal_moves is not original
+		game = Game(with_board=False)
+		game.make_move(game.find_uci("e2e4"))
+	finally:
+		profiler.disable()
+	assert Position.legal_moves is original
+
+	data = json.loads(json.dumps(profiler.to_json()))
+	functions = data["functions"]
+	assert set(functions) == {f"{owner or module.rsplit('.', 1)[-1]}.{name}" for module, owner, name, histogram in HOT_PATHS}
+	for name in ("Game.make_move", "GameState.__init__", "Position.legal_moves", "Position.make_move", "Game.sync_board"):
+		assert functions[name]["calls"] > 0, name
+	# The start position and the position after the move
+	assert functions["GameState.__init__"]["calls"] == 2
+	for name in ("Game.make_move", "GameState.__init__", "Position.legal_moves"):
+		assert data["histograms"][name]["count"] > 0, name
+		assert data["histograms"][name]["p50_ms"] > 0
+	assert "Position.legal_moves" in profiler.report()
+
+	# Nothing is counted once profiling is off
+	game.make_move(game.find_uci("e7e5"))
+	assert profiler.to_json()["functions"]["Game.make_move"]["calls"] == 1
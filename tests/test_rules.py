@@ -0,0 +1,73 @@
+""" Move generation (perft on the standard positions) and FEN parsing """
+
+import pytest
+
+from chesscore.bitboard import Position, START_FEN, CASTLING, move_flag, move_uci, parse_square
+from chesscore.perft import POSITIONS, perft
+
+
+@pytest.mark.parametrize("name", sorted(POSITIONS))
+def test_perft(name):
+	fen, counts = POSITIONS[name]
+	position = Position.from_fen(fen)
+	for depth in (1, 2, 3):
+		assert perft(position, depth) == counts[depth - 1]
+	# make_move / unmake_move leave the position as it was
+	assert position.fen() == Position.from_fen(fen).fen()
+
+
+def test_fen_round_trip():
+	for fen, counts in POSITIONS.values():
+		assert Position.from_fen(fen).fen() == fen
+
+
+def test_castling_rights_need_king_and_rook_at_home():
+	position = Position.from_fen("4k3/8/8/8/8/8/8/R2K3R w K - 0 1")
+	assert position.castling == 0
+	assert not [move for move in position.legal_moves() if move_flag(move) == CASTLING]
+	assert position.fen() == "4k3/8/8/8/8/8/8/R2K3R w - - 0 1"
+	# Only the queenside right survives when the kingside rook is missing
+	assert Position.from_fen("r3k3/8/8/8/8/8/8/4K3 b kq - 0 1").fen() == "r3k3/8/8/8/8/8/8/4K3 b q - 0 1"
+
+
+def test_en_passant_square_kept_only_if_capturable():
+	fen = "4k3/8/8/3pP3/8/8/8/4K3 w - d6 0 2"
+	position = Position.from_fen(fen)
+	assert position.fen() == fen
+	assert "e5d6" in [move_uci(move) for move in position.legal_moves()]
+	assert Position.from_fen("4k3/8/8/3p4/8/8/8/4K3 w - d6 0 2").ep_square is None
+
+
+@pytest.mark.parametrize("fen", [
+	"",
+	"8/8/8/8/8/8/8/8 w - - 0 1",
+	"4k3/8/8/8/8/8/8/4K3 x - - 0 1",
+	"4k3/8/8/8/8/8/8/4KK2 w - - 0 1",
+	"4k3/8/8/8/8/8/8/4K4 w - - 0 1",
+	"4k3/8/8/8/8/8/8/4X3 w - - 0 1",
+	"4k3/8/8/8/8/8/8/4K3 w X - 0 1",
+	"4k3/8/8/8/8/8/8/4K3 w KK - 0 1",
+	"4k3/8/8/8/8/8/8/4K3 w - e - 0 1",
+	"4k3/8/8/8/8/8/8/4K3 w - z9 0 1",
+	"4k3/8/8/8/8/8/8/4K3 w - e4 0 1",
+	"4k3/8/8/8/8/8/8/4K3 w - - x 1",
+	"4k3/8/8/8/8/8/8/4K3 w - - -1 1",
+	"4k3/8/8/8/8/8/8/4K3 w - - 0 0",
+	"4k3/8/8/8/8/8/8/4K3 w - - 0 1 extra",
+])
+def test_invalid_fen_raises_value_error(fen):
+	with pytest.raises(ValueError):
+		Position.from_fen(fen)
+
+
+def test_parse_square():
+	assert parse_square("a8") == 0
+	assert parse_square("h1") == 63
+	for name in ("e", "e9", "i1", "", "e44"):
+		with pytest.raises(ValueError):
+			parse_square(name)
+
+
+def test_start_position():
+	assert Position.start() == Position.from_fen(START_FEN)
+	assert len(Position.start().legal_moves()) == 20
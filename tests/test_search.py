@@ -0,0 +1,63 @@
+""" Alpha-beta search: mates, material and the time budget """
+
+import pytest
+
+from chesscore.bitboard import Position, move_uci
+from chesscore.game import Game
+from chesscore.search import Searcher, Computer, MATE
+
+
+@pytest.mark.parametrize("fen, best", [
+	("6k1/5ppp/8/8/8/8/8/R5K1 w - - 0 1", "a1a8"),
+	("r5k1/8/8/8/8/8/5PPP/6K1 b - - 0 1", "a8a1"),
+	("r1bqkb1r/pppp1ppp/2n2n2/4p2Q/2B1P3/8/PPPP1PPP/RNB1K1NR w KQkq - 4 4", "h5f7"),
+])
+def test_mate_in_one(fen, best):
+	searcher = Searcher()
+	position = Position.from_fen(fen)
+	assert move_uci(searcher.search(position, time_limit=0, max_depth=4)) == best
+	# Mate in one ply, and the search stops as soon as it finds it
+	assert searcher.last.score == MATE - 1
+	assert searcher.last.depth == 1
+	assert position.fen() == fen
+
+
+def test_mate_in_two():
+	searcher = Searcher()
+	# Back rank mate: 1. Rd8+ Rxd8 2. Rxd8#
+	position = Position.from_fen("r5k1/5ppp/8/8/8/3R4/5PPP/3R2K1 w - - 0 1")
+	move = searcher.search(position, time_limit=0, max_depth=5)
+	assert MATE - searcher.last.score == 3
+	assert move_uci(move) == "d3d8"
+
+
+def test_wins_material():
+	searcher = Searcher()
+	move = searcher.search(Position.from_fen("4k3/8/8/3q4/8/8/3R4/4K3 w - - 0 1"), time_limit=0, max_depth=3)
+	assert move_uci(move) == "d2d5"
+	assert searcher.last.score > 0
+
+
+def test_no_moves():
+	assert Searcher().search(Position.from_fen("R6k/8/6K1/8/8/8/8/8 b - - 0 1")) is None
+	assert Searcher().search(Position.from_fen("7k/5Q2/6K1/8/8/8/8/8 b - - 0 1")) is None
+
+
+def test_time_budget():
+	searcher = Searcher()
+	position = Position.start()
+	move = searcher.search(position, time_limit=0.2)
+	assert move in position.legal_moves()
+	assert searcher.info and searcher.last.seconds < 1
+	# The moves of the interrupted iteration are taken back
+	assert position.ply == 0 and position == Position.start()
+
+
+def test_computer_plays_its_color():
+	game = Game(with_board=False)
+	game.make_move(game.find_uci("e2e4"))
+	infos = []
+	computer = Computer("black", time_limit=0, max_depth=2, on_search=infos.append)
+	move = computer.choose_move(game)
+	assert move in game.state.moves
+	assert len(infos) == 1 and infos[0].depth == 2
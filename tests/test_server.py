@@ -0,0 +1,198 @@
+""" Game server: games played by clients connected over localhost """
+
+import asyncio
+import json
+
+from server import ChessServer
+
+
+class Client:
+	""" A connection speaking the newline-delimited JSON of the server """
+	def __init__(self, reader, writer):
+		self.reader = reader
+		self.writer = writer
+
+	@classmethod
+	async def connect(cls, port):
+		return cls(*await asyncio.open_connection("127.0.0.1", port))
+
+	async def send(self, **message):
+		""" Sends a message and returns the first message received after it """
+		return await self.send_line(json.dumps(message))
+
+	async def send_line(self, line):
+		self.writer.write(line.encode() + b"\n")
+		await self.writer.drain()
+		return await self.receive()
+
+	async def receive(self):
+		return json.loads(await asyncio.wait_for(self.reader.readline(), 10))
+
+	async def close(self):
+		self.writer.close()
+		await self.writer.wait_closed()
+
+
+def serve(test, workers=0):
+	""" Runs the coroutine test(port) against a server listening on a free port """
+	async def main():
+		chess_server = ChessServer(workers)
+		server = await chess_server.start("127.0.0.1", 0)
+		try:
+			await test(server.sockets[0].getsockname()[1])
+		finally:
+			server.close()
+			chess_server.timer_task.cancel()
+			chess_server.pool.close()
+	asyncio.run(main())
+
+
+async def start_game(port, **options):
+	""" Connects two players to a new game; returns (white, black, game id) """
+	white = await Client.connect(port)
+	joined = await white.send(type="new", **options)
+	assert joined["type"] == "joined" and joined["color"] == "white"
+	black = await Client.connect(port)
+	joined = await black.send(type="join", game=joined["game"])
+	assert joined["color"] == "black" and joined["moves"] == []
+	return white, black, joined["game"]
+
+
+async def play(first, second, *moves):
+	""" Plays the moves, the first one by first, and returns the last update (both players get it) """
+	players = (first, second)
+	for ply, move in enumerate(moves):
+		update = await players[ply % 2].send(type="move", move=move)
+		assert update["type"] == "update" and update["move"] == move
+		assert await players[1 - ply % 2].receive() == update
+	return update
+
+
+def test_game_and_rematch():
+	async def test(port):
+		white, black, game = await start_game(port)
+		update = await play(white, black, "f2f3")
+		assert update["changes"] == {"f2": None, "f3": "P"}
+		assert update["turn"] == "black" and not update["check"] and update["result"] is None
+
+		# Fool's mate
+		update = await play(black, white, "e7e5", "g2g4", "d8h4")
+		assert update["check"] and update["result"] == "black"
+		assert await white.send(type="move", move="a2a3") == {"type": "error", "message": "the game is over"}
+
+		for player, color in ((white, "white"), (black, "black")):
+			joined = await player.send(type="rematch")
+			assert joined["type"] == "joined" and joined["game"] == game and joined["color"] == color
+			assert joined["moves"] == [] and joined["result"] is None
+		await play(white, black, "e2e4", "e7e5")
+
+		stats = await white.send(type="stats")
+		assert stats["games"] == 1 and stats["moves"] == 6
+		await white.close()
+		await black.close()
+	serve(test)
+
+
+def test_illegal_moves_are_rejected():
+	async def test(port):
+		white, black, game = await start_game(port)
+		assert await white.send(type="move", move="e2e5") == {"type": "error", "message": "illegal move e2e5"}
+		assert await white.send(type="move", move="castle") == {"type": "error", "message": "illegal move castle"}
+		assert await black.send(type="move", move="e7e5") == {"type": "error", "message": "not your turn"}
+		update = await play(white, black, "e2e4")
+		assert update["changes"] == {"e2": None, "e4": "P"}
+		await white.close()
+		await black.close()
+	serve(test)
+
+
+def test_join_errors():
+	async def test(port):
+		client = await Client.connect(port)
+		for game in (99, "1", [1], {"game": 1}, None):
+			assert await client.send(type="join", game=game) == {"type": "error", "message": "no such game"}
+		white, black, game = await start_game(port)
+		assert await client.send(type="join", game=game) == {"type": "error", "message": "the game is full"}
+		assert await client.send(type="move", move="e2e4") == {"type": "error", "message": "not in a game"}
+		assert (await client.send(type="resign"))["type"] == "error"
+		for player in (client, white, black):
+			await player.close()
+	serve(test)
+
+
+def test_messages_must_be_json_objects():
+	async def test(port):
+		client = await Client.connect(port)
+		for line in ("[1]", '"new"', "1", "null", "not json"):
+			assert (await client.send_line(line))["type"] == "error"
+		# The connection is still open
+		assert (await client.send(type="stats"))["type"] == "stats"
+		await client.close()
+	serve(test)
+
+
+def test_leaving_player_loses():
+	async def test(port):
+		white, black, game = await start_game(port, clock="5+3")
+		await play(white, black, "e2e4")
+		await black.close()
+		update = await white.receive()
+		assert update["abandoned"] == "black" and update["result"] == "white"
+		assert update["clock"]["running"] is None
+		assert await white.send(type="move", move="d2d4") == {"type": "error", "message": "the game is over"}
+
+		# The free seat can be taken, and a rematch starts over
+		other = await Client.connect(port)
+		joined = await other.send(type="join", game=game)
+		assert joined["color"] == "black" and joined["result"] == "white" and joined["abandoned"] == "black"
+		joined = await white.send(type="rematch")
+		assert joined["moves"] == [] and joined["result"] is None and joined["abandoned"] is None
+		await other.send(type="rematch")
+		await play(white, other, "d2d4")
+		await white.close()
+		await other.close()
+	serve(test)
+
+
+def test_no_move_before_the_opponent_joins():
+	async def test(port):
+		white = await Client.connect(port)
+		joined = await white.send(type="new", clock="5+3")
+		assert joined["clock"] == {"white": 300, "black": 300, "running": None}
+		assert await white.send(type="move", move="e2e4") == {"type": "error", "message": "waiting for the opponent"}
+		black = await Client.connect(port)
+		await black.send(type="join", game=joined["game"])
+		update = await play(white, black, "e2e4")
+		assert update["clock"]["running"] == "black" and 300 < update["clock"]["white"] <= 303
+		await white.close()
+		await black.close()
+	serve(test)
+
+
+def test_flag_falls():
+	async def test(port):
+		# 0.01 minutes of sudden death
+		white, black, game = await start_game(port, clock="0.01")
+		for player in (white, black):
+			update = await player.receive()
+			assert update["timed_out"] == "white" and update["result"] == "black"
+			assert update["move"] is None and update["clock"]["running"] is None
+		assert await white.send(type="move", move="e2e4") == {"type": "error", "message": "the game is over"}
+		await white.close()
+		await black.close()
+	serve(test)
+
+
+def test_games_sharded_over_workers():
+	async def test(port):
+		# Game 1 lives in the second worker, game 2 in the first one
+		first = await start_game(port)
+		second = await start_game(port)
+		assert (first[2], second[2]) == (1, 2)
+		await asyncio.gather(play(first[0], first[1], "e2e4", "e7e5", "g1f3"), play(second[0], second[1], "d2d4"))
+		assert await first[1].send(type="move", move="e2e4") == {"type": "error", "message": "illegal move e2e4"}
+		update = await play(second[1], second[0], "d7d5")
+		assert update["changes"] == {"d7": None, "d5": "p"}
+		for player in first[:2] + second[:2]:
+			await player.close()
+	serve(test, workers=2)
@@ -0,0 +1,106 @@
+""" Endgame tablebases: generating KQK and KRK and probing them """
+
+import random
+
+import pytest
+
+from chesscore.bitboard import Position, move_uci
+from chesscore.constants import WIN, DRAW, LOSS
+from chesscore.game import Game
+from chesscore.search import Searcher, MATE
+from chesscore.tablebase import Tablebase, generate
+
+
+def random_position(rng, pieces, turn):
+	""" A legal position with the pieces (FEN letters) on random squares """
+	while True:
+		board = ["1"] * 64
+		for square, char in zip(rng.sample(range(64), len(pieces)), pieces):
+			board[square] = char
+		position = Position.from_fen("/".join("".join(board[row*8:row*8 + 8]) for row in range(8)) + f" {turn} - - 0 1")
+		if not position.in_check(1 - position.turn):
+			return position
+
+
+@pytest.fixture(scope="module")
+def tablebase(tmp_path_factory):
+	directory = str(tmp_path_factory.mktemp("tables"))
+	# The longest mates take 10 moves with a queen and 16 with a rook (the plies of the losing side)
+	assert generate("KQK", directory)[1] == 20
+	assert generate("KRK", directory)[1] == 32
+	tablebase = Tablebase(directory)
+	yield tablebase
+	tablebase.close()
+
+
+@pytest.mark.parametrize("fen, found", [
+	("7k/8/6K1/8/8/8/8/1Q6 w - - 0 1", (WIN, 1)),
+	("R6k/8/6K1/8/8/8/8/8 b - - 0 1", (LOSS, 0)),
+	("7k/5Q2/6K1/8/8/8/8/8 b - - 0 1", (DRAW, None)),
+	# The rook is lost
+	("8/8/8/8/8/8/6k1/K6R b - - 0 1", (DRAW, None)),
+	("8/8/8/8/8/8/6k1/K6R w - - 0 1", (WIN, 25)),
+	# Black has the queen: the tables are probed with the colors swapped
+	("1q6/8/8/8/8/8/6k1/K7 b - - 0 1", (WIN, 9)),
+	("8/8/8/4k3/8/8/8/4K3 w - - 0 1", (DRAW, None)),
+])
+def test_probe(tablebase, fen, found):
+	assert tablebase.probe(Position.from_fen(fen)) == found
+
+
+def test_not_in_the_tables(tablebase):
+	assert tablebase.probe(Position.start()) is None
+	assert tablebase.probe(Position.from_fen("8/8/8/4k3/8/8/8/3NK3 w - - 0 1")) is None
+	assert tablebase.probe(Position.from_fen("r3k3/8/8/8/8/8/8/4K3 b q - 0 1")) is None
+
+
+def test_distances_agree_with_the_moves(tablebase):
+	""" A position won in n plies has a move to a position lost in n - 1 and none quicker;
+	a position lost in n plies only has moves to positions won in at most n - 1 """
+	rng = random.Random(7)
+	for pieces in ("Kkq", "Kkr", "KQk", "KRk"):
+		for i in range(50):
+			position = random_position(rng, pieces, rng.choice("wb"))
+			result, plies = tablebase.probe(position)
+			after = []
+			for move in position.legal_moves():
+				position.make_move(move)
+				after.append(tablebase.probe(position))
+				position.unmake_move()
+			if result == WIN:
+				assert (LOSS, plies - 1) in after
+				assert all(found[0] != LOSS or found[1] >= plies - 1 for found in after)
+			elif result == LOSS and not after:
+				assert position.in_check() and plies == 0
+			elif result == LOSS:
+				assert all(found[0] == WIN and found[1] <= plies - 1 for found in after)
+				assert (WIN, plies - 1) in after
+			else:
+				assert all(found[0] != LOSS for found in after)
+
+
+def test_short_mates_agree_with_the_search(tablebase):
+	rng = random.Random(8)
+	checked = 0
+	while checked < 5:
+		position = random_position(rng, "KkQ", "w")
+		result, plies = tablebase.probe(position)
+		if result == WIN and plies <= 3:
+			searcher = Searcher()
+			searcher.search(position, time_limit=0, max_depth=plies)
+			assert searcher.last.score == MATE - plies
+			checked += 1
+
+
+def test_search_and_game_use_the_tables(tablebase):
+	fen = "8/8/8/8/8/8/6k1/K6R w - - 0 1"
+	searcher = Searcher(tablebase=tablebase)
+	move = searcher.search(Position.from_fen(fen))
+	position = Position.from_fen(fen)
+	position.make_move(move)
+	assert tablebase.probe(position) == (LOSS, 24)
+	assert searcher.last.score == MATE - 25
+	assert move_uci(tablebase.best_move(Position.from_fen(fen))[0]) == move_uci(move)
+
+	game = Game(with_board=False, fen=fen, tablebase=tablebase)
+	assert game.result == "white" and game.state.adjudicated
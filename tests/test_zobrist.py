@@ -0,0 +1,85 @@
+""" Zobrist keys, the transposition table and repetition draws """
+
+import random
+
+from chesscore.bitboard import Position
+from chesscore.constants import WHITE, BLACK, WHITE_KINGSIDE, WHITE_QUEENSIDE, BLACK_KINGSIDE, BLACK_QUEENSIDE
+from chesscore.gamestate import GameState
+from chesscore.zobrist import TranspositionTable, compute_key, EXACT, LOWER
+from conftest import make_position, play, random_moves
+
+ALL_CASTLING = WHITE_KINGSIDE | WHITE_QUEENSIDE | BLACK_KINGSIDE | BLACK_QUEENSIDE
+
+
+def test_incremental_key_in_random_games():
+	rng = random.Random(6)
+	for i in range(20):
+		position = Position.start()
+		keys = [position.key]
+		for position in random_moves(rng, position, 200):
+			assert position.key == compute_key(position)
+			keys.append(position.key)
+		while position.ply:
+			keys.pop()
+			position.unmake_move()
+			assert position.key == keys[-1] == compute_key(position)
+
+
+def test_key_after_special_moves():
+	# Castling both ways, en passant, promotions with and without capture, rook and king moves
+	for position in (
+		make_position("Ke1 Ra1 Rh1 Pb7 Pe5 ke8 ra8 rh8 pd5", WHITE, castling=ALL_CASTLING, ep_square="d6"),
+		make_position("Ke1 Ra1 Rh1 Pd4 ke8 ra8 rh8 pe4 pb2", BLACK, castling=ALL_CASTLING, ep_square="d3"),
+	):
+		assert position.key == compute_key(position)
+		for move in position.legal_moves():
+			position.make_move(move)
+			assert position.key == compute_key(position)
+			position.unmake_move()
+			assert position.key == compute_key(position)
+
+
+def test_transpositions_share_the_key():
+	first = play(Position.start(), "g1f3", "g8f6", "b1c3")
+	second = play(Position.start(), "b1c3", "g8f6", "g1f3")
+	assert first.key == second.key
+	# The side to move, castling rights and en passant square are part of the key
+	assert make_position("Ke1 ke8", WHITE).key != make_position("Ke1 ke8", BLACK).key
+	assert make_position("Ke1 Rh1 ke8", castling=WHITE_KINGSIDE).key != make_position("Ke1 Rh1 ke8").key
+	assert make_position("Ke1 Pe5 ke8 pd5", ep_square="d6").key != make_position("Ke1 Pe5 ke8 pd5").key
+
+
+def test_transposition_table():
+	table = TranspositionTable(1 << 10)
+	key = Position.start().key
+	assert table.probe(key) is None
+	table.store(key, 3, 25, EXACT, 1234)
+	assert table.probe(key) == (3, 25, EXACT, 1234)
+	table.store(key, 5, -10, LOWER, 4321)
+	assert table.probe(key) == (5, -10, LOWER, 4321)
+	table.clear()
+	assert table.probe(key) is None
+
+
+def test_threefold_repetition():
+	position = Position.start()
+	shuffle = ("g1f3", "g8f6", "f3g1", "f6g8")
+	for text in shuffle * 2:
+		assert GameState(position).result is None
+		play(position, text)
+	# The start position occurred for the third time
+	assert position.repetition_count() == 3
+	assert GameState(position).result == "threefold"
+
+
+def test_fivefold_repetition():
+	position = Position.start()
+	for count in range(1, 6):
+		# Threefold repetition only ends the game when it is claimed automatically
+		state = GameState(position, auto_threefold=False)
+		assert position.repetition_count() == count
+		assert state.result == ("fivefold" if count == 5 else None)
+		play(position, "g1f3", "g8f6", "f3g1", "f6g8")
+	# Pawn moves and captures cannot be taken back, so the count starts over
+	play(position, "e2e4")
+	assert position.repetition_count() == 1